@@ -114,7 +114,7 @@ if __name__ == '__main__':
     bot = engine.get_bot(reset=True)  # create a group channel
 
     for index in range(7):  # send notifications to the channel
-        bot.say(some_message())
+        bot.say(some_message(), priority='bulk')
         time.sleep(5)
 
     bot.say(u"Nothing more to say")
@@ -16,7 +16,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import logging
 from multiprocessing import Process, Queue
 from six import string_types
 import sys
@@ -24,7 +23,12 @@ import time
 import yaml
 
 from .i18n import _
+from .logger import Logger
 from .speaker import Vibes
+from .tracing import tracer
+
+
+logger = Logger(__name__)
 
 
 class ShellBot(object):
@@ -133,6 +137,8 @@ class ShellBot(object):
 
         self.machine = machine
 
+        self.priority = 'normal'  # interactive while a command is executed
+
         self.on_init()
 
     def on_init(self):
@@ -337,7 +343,12 @@ class ShellBot(object):
         if self.id:
             self.space.remove_participant(id=self.id, person=person)
 
-    def say(self, text=None, content=None, file=None, person=None):
+    def say(self,
+            text=None,
+            content=None,
+            file=None,
+            person=None,
+            priority=None):
         """
         Sends a message to the chat space
 
@@ -353,6 +364,18 @@ class ShellBot(object):
         :param person: for direct message to someone
         :type person: str
 
+        :param priority: either ``interactive``, ``normal`` or ``bulk``
+        :type priority: str
+
+        By default, messages are sent with the priority of the bot, which
+        is ``interactive`` while the shell executes a command, and
+        ``normal`` otherwise. Use ``bulk`` for notifications and
+        broadcasts, so that they do not delay responses to chat
+        participants. Example::
+
+            for bot in engine.enumerate_bots():
+                bot.say(u"Maintenance at 5pm", priority='bulk')
+
         """
         if text:
             line = text[:50] + (text[50:] and '..')
@@ -361,23 +384,31 @@ class ShellBot(object):
         else:
             return
 
-        logging.info(u"Bot says: {}".format(line))
+        logger.info(u"Bot says: {}", line)
+
+        priority = priority or self.priority
 
         vibes = Vibes(text=text,
                       content=content,
                       file=file,
                       channel_id=None if person else self.id,
-                      person=person)
+                      person=person,
+                      priority=priority)
+
+        tracer.inherit(vibes, 'mouth')  # from the event being processed
 
         if not self.is_ready:
-            logging.debug(u"- not ready to speak")
+            logger.debug(u"- not ready to speak")
 
         elif self.engine.mouth:
-            logging.debug(u"- pushing message to mouth queue")
-            self.engine.mouth.put(vibes)
+            if self.engine.journal:
+                self.engine.journal.record(vibes)  # survive a restart
+
+            logger.debug(u"- pushing message to mouth queue")
+            self.engine.get_mouth(priority).put(vibes)
 
         else:
-            logging.debug(u"- calling speaker directly")
+            logger.debug(u"- calling speaker directly")
             self.engine.speaker.process(vibes)
 
     def say_banner(self):
@@ -445,7 +476,7 @@ class ShellBot(object):
 
         file = self.engine.get('bot.banner.file')
 
-        self.say(text=text, content=content, file=file)
+        self.say(text=text, content=content, file=file, priority='bulk')
 
     def remember(self, key, value):
         """
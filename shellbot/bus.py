@@ -17,12 +17,44 @@
 
 from builtins import str
 import json
-import logging
 from multiprocessing import Process, Queue
+import os
 from six import string_types
+from threading import Lock, current_thread
 import time
 import zmq
 
+from .logger import Logger
+
+
+logger = Logger(__name__)
+
+
+def encode(message):
+    """
+    Turns a message into the payload of a bus frame
+
+    :param message: the message to send
+    :type message: dict or other json-serializable object
+
+    :return: UTF-8 encoded JSON
+    :rtype: bytes
+    """
+    return json.dumps(message).encode('utf-8')
+
+
+def decode(payload):
+    """
+    Restores a message from the payload of a bus frame
+
+    :param payload: UTF-8 encoded JSON
+    :type payload: bytes
+
+    :return: the message
+    :rtype: dict or other json-serializable object
+    """
+    return json.loads(payload.decode('utf-8'))
+
 
 class Bus(object):
     """
@@ -84,6 +116,24 @@ class Bus(object):
           The default value is ``tcp://*:5555`` which means 'use TCP port 5555
           on local machine'.
 
+        * ``bus.bind`` - the address bound by the publisher, if different
+          from ``bus.address``. This is needed when subscribers run on
+          other computers, e.g., ``tcp://*:5555``.
+
+        * ``bus.broker`` - the address of a broker, e.g.,
+          ``tcp://127.0.0.1:5556``. When it is set, publishers connect
+          to the broker instead of binding ``bus.address``, so that
+          many processes can publish at the same time. See
+          :class:`Broker`.
+
+        * ``bus.serve`` - set it to True to start the broker along with
+          the engine. Default value is False.
+
+        * ``bus.direct`` - set it to True so that each process sends
+          messages straight to the broker, instead of handing them over to
+          the publishing process. This requires ``bus.broker``. Default
+          value is False.
+
         """
         self.context.check('bus.address', self.DEFAULT_ADDRESS)
 
@@ -131,6 +181,23 @@ class Bus(object):
         """
         return Publisher(context=self.context)
 
+    def serve(self):
+        """
+        Forwards messages from publishers to subscribers
+
+        :return: Broker
+
+        Example::
+
+            # get a broker
+            broker = bus.serve()
+
+            # start the forwarding process
+            broker.start()
+
+        """
+        return Broker(context=self.context)
+
 
 class Subscriber(object):
     """
@@ -172,7 +239,7 @@ class Subscriber(object):
         """
         self.context = context
         address=self.context.get('bus.address')
-        logging.debug(u"Subscribing at {}".format(address))
+        logger.debug(u"Subscribing at {}", address)
 
         assert channels or channels == ''
         if isinstance(channels, string_types):
@@ -181,9 +248,9 @@ class Subscriber(object):
 
         for channel in self.channels:
             if channel:
-                logging.debug(u"- {}".format(channel))
+                logger.debug(u"- {}", channel)
             else:
-                logging.debug(u"- {}".format('<all channels>'))
+                logger.debug(u"- {}", '<all channels>')
 
         self.socket = None  # defer binding to first get()
 
@@ -209,10 +276,27 @@ class Subscriber(object):
 
             message = subscriber.get(block=True)  # wait until available
 
-        Note that this function does not preserve the enveloppe of the message.
-        In other terms, the channel used for the communication is lost
-        in translation. Therefore the need to put within messages all
-        information that may be relevant for the receiver.
+        Use ``receive()`` to know the channel of the message as well.
+        """
+        (channel, message) = self.receive(block=block)
+        return message
+
+    def receive(self, block=False):
+        """
+        Gets next message, and its channel
+
+        :return: (channel, message), or (None, None)
+        :rtype: tuple
+
+        Example::
+
+            (channel, message) = subscriber.receive()
+            if message:
+                ...
+
+        Each message is made of two frames, the channel and the payload.
+        Messages sent by older publishers, as a single frame, are
+        accepted as well.
         """
         if not self.socket:
             zmq_context = zmq.Context.instance()
@@ -226,11 +310,15 @@ class Subscriber(object):
 
         try:
             flags = zmq.NOBLOCK if not block else 0
-            snippet = str(self.socket.recv(flags=flags))
-            (channel, text) = snippet.split(' ', 1)
-            return json.loads(text)
+            frames = self.socket.recv_multipart(flags=flags)
         except zmq.error.Again:
-            return None
+            return (None, None)
+
+        if len(frames) == 1:
+            frames = frames[0].split(b' ', 1)
+
+        (channel, payload) = frames[:2]
+        return (channel.decode('utf-8'), decode(payload))
 
 
 class Publisher(Process):
@@ -254,10 +342,22 @@ class Publisher(Process):
         # share new state
         publisher.put(bot.id, bit_of_information_here)
 
+    By default, messages are queued to the publishing process, which relays
+    them to the bus. When ``bus.direct`` and ``bus.broker`` are both set,
+    each process, and each thread, connects its own socket to the broker,
+    and ``put()`` sends messages right away. Large payloads are handed over
+    to the socket without being copied. Messages are counted locally, and
+    the counter is flushed to the context from time to time. Sockets of
+    threads that have ended are closed on next use, and ``close()`` should
+    be called when a process stops publishing.
+
     """
 
     DEFER_DURATION = 0.3  # allow subscribers to connect
     EMPTY_DELAY = 0.005   # time to wait if queue is empty
+    LINGER = 1000  # milliseconds to flush direct sockets on exit
+    ZERO_COPY = 65536  # send larger payloads without copying them
+    FLUSH = 1.0  # seconds between updates of the counter in direct mode
 
     def __init__(self, context):
         """
@@ -276,6 +376,13 @@ class Publisher(Process):
 
         self.socket = None  # allow socket injection for tests
 
+        self._pid = None
+        self._direct = None
+        self._lock = None
+        self._sockets = {}  # sockets of direct mode, one per thread
+        self._count = 0  # messages not yet added to the counter
+        self._flushed = 0.0
+
     def run(self):
         """
         Continuously broadcasts messages
@@ -300,18 +407,23 @@ class Publisher(Process):
             publisher.fan.put(None)
 
         """
-        address=self.context.get('bus.address')
+        address = (self.context.get('bus.bind')
+                   or self.context.get('bus.address'))
 
         if not self.socket:
             zmq_context = zmq.Context.instance()
             self.socket = zmq_context.socket(zmq.PUB)
             self.socket.linger = 0
-            self.socket.bind(address)
+            if self.context.get('bus.broker'):
+                address = self.context.get('bus.broker')
+                self.socket.connect(address)
+            else:
+                self.socket.bind(address)
 
         time.sleep(self.DEFER_DURATION)  # allow subscribers to connect
 
-        logging.info(u"Starting publisher")
-        logging.debug(u"- publishing at {}".format(address))
+        logger.info(u"Starting publisher")
+        logger.debug(u"- publishing at {}", address)
 
         try:
             self.context.set('publisher.counter', 0)
@@ -330,7 +442,7 @@ class Publisher(Process):
                     self.process(item)
 
                 except Exception as feedback:
-                    logging.exception(feedback)
+                    logger.exception(feedback)
 
         except KeyboardInterrupt:
             pass
@@ -338,20 +450,23 @@ class Publisher(Process):
         self.socket.close()
         self.socket = None
 
-        logging.info("Publisher has been stopped")
+        logger.info("Publisher has been stopped")
 
     def process(self, item):
         """
         Processes items received from the queue
 
         :param item: the item received
-        :type item: str
+        :type item: tuple
 
-        Note that the item should result from serialization
-        of (channel, message) tuple done previously.
+        Note that the item should be a (channel, payload) tuple, where the
+        payload has been encoded previously. It is sent as two frames,
+        so that subscribers can filter on the channel, and get it back
+        without parsing the payload.
         """
-        logging.debug(u"Publishing {}".format(item))
-        self.socket.send_string(item)
+        (channel, payload) = item
+        logger.debug(u"Publishing {} bytes to {}", len(payload), channel)
+        self.socket.send_multipart([channel.encode('utf-8'), payload])
 
     def put(self, channels, message):
         """
@@ -371,14 +486,356 @@ class Publisher(Process):
         This function actually put the message in a global queue that is
         handled asynchronously. Therefore, when the function returns there is
         no guarantee that message has been transmitted nor received.
+
+        In direct mode, the message is sent to the broker before the
+        function returns.
         """
         assert channels
         if isinstance(channels, string_types):
             channels = [channels]
 
         assert message
-        text = json.dumps(message)
+        payload = encode(message)  # once for all channels
+
+        if self.is_direct:
+            socket = self.get_socket()
+            for channel in channels:
+                self.send(socket, channel, payload)
+            return
+
         for channel in channels:
-            item = channel + ' ' + text
-            logging.debug(u"Queuing {}".format(item))
-            self.fan.put(item)
+            logger.debug(u"Queuing {} bytes to {}", len(payload), channel)
+            self.fan.put((channel, payload))
+
+    @property
+    def is_direct(self):
+        """
+        Checks if messages are sent directly to the broker
+
+        :rtype: bool
+
+        The settings are read once per process.
+        """
+        self.check_process()
+        if self._direct is None:
+            self._direct = bool(self.context.get('bus.direct')
+                                and self.context.get('bus.broker'))
+        return self._direct
+
+    def check_process(self):
+        """
+        Forgets sockets and settings inherited from a parent process
+
+        ZeroMQ sockets cannot be shared across processes, so each process
+        that publishes in direct mode creates its own sockets.
+        """
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._direct = None
+            self._lock = Lock()
+            self._sockets = {}
+            self._count = 0
+            self._flushed = time.time()
+
+    def get_socket(self):
+        """
+        Provides a socket connected to the broker
+
+        :return: the socket dedicated to the current thread
+
+        The socket is created on first call in each thread, and then the
+        thread waits a bit so that the connection can be established.
+        Sockets of threads that have ended are closed at this moment.
+        """
+        self.check_process()
+        thread = current_thread()
+
+        with self._lock:
+            socket = self._sockets.get(thread)
+            if socket is None:
+                self.sweep()
+
+        if socket is None:
+            address = self.context.get('bus.broker')
+            logger.debug(u"Connecting to broker at {}", address)
+
+            socket = zmq.Context.instance().socket(zmq.PUB)
+            socket.linger = self.LINGER
+            socket.connect(address)
+            time.sleep(self.DEFER_DURATION)  # allow connection to complete
+
+            with self._lock:
+                self._sockets[thread] = socket
+
+        return socket
+
+    def sweep(self):
+        """
+        Closes sockets of threads that have ended
+
+        This function is called with the lock held.
+        """
+        for thread in list(self._sockets.keys()):
+            if not thread.is_alive():
+                logger.debug(u"Closing socket of ended thread")
+                self._sockets.pop(thread).close()
+
+    def send(self, socket, channel, payload):
+        """
+        Sends a message to the broker
+
+        :param socket: the socket of the current thread
+
+        :param channel: the channel of the message
+        :type channel: str
+
+        :param payload: the encoded message
+        :type payload: bytes
+
+        Payloads of ``ZERO_COPY`` bytes or more are not copied by ZeroMQ.
+        The message is counted locally, and the counter is flushed to the
+        context every ``FLUSH`` seconds.
+        """
+        logger.debug(u"Sending {} bytes to {}", len(payload), channel)
+        socket.send_multipart([channel.encode('utf-8'), payload],
+                              copy=len(payload) < self.ZERO_COPY)
+
+        with self._lock:
+            self._count += 1
+            if time.time() - self._flushed < self.FLUSH:
+                return
+
+        self.flush()
+
+    def flush(self):
+        """
+        Adds messages sent in direct mode to ``publisher.counter``
+        """
+        self.check_process()
+        with self._lock:
+            count = self._count
+            self._count = 0
+            self._flushed = time.time()
+
+        if count:
+            self.context.increment('publisher.counter', count)
+
+    def close(self):
+        """
+        Stops publishing from the current process
+
+        In direct mode, this function flushes the counter and closes the
+        sockets of all threads. A socket is created again if ``put()`` is
+        called afterwards. In relay mode, this function has no effect.
+
+        Example::
+
+            publisher.close()
+
+        """
+        self.check_process()
+        if not self._sockets and not self._count:
+            return
+
+        self.flush()
+
+        with self._lock:
+            sockets = list(self._sockets.values())
+            self._sockets = {}
+
+        for socket in sockets:
+            socket.close()
+
+
+class Broker(Process):
+    """
+    Forwards messages from many publishers to many subscribers
+
+    Without a broker, a single publisher binds ``bus.address``. With a
+    broker, publishers connect to ``bus.broker``, and subscribers still
+    connect to ``bus.address``, where the broker forwards messages. In
+    other terms, multiple processes, and multiple computers, can publish
+    at the same time without contention on the address.
+
+    Example::
+
+        bus.context.apply({'bus': {'address': 'tcp://127.0.0.1:5555',
+                                   'broker': 'tcp://127.0.0.1:5556'}})
+        broker = bus.serve()
+        broker.start()
+
+    Subscriptions are forwarded upstream to publishers, so that messages
+    that are not expected by any subscriber are filtered at the source.
+
+    Statistics are pushed periodically to the context, per topic, under
+    the key ``broker.topics``, e.g.::
+
+        {'shard/node2/': {'messages': 42, 'bytes': 8192, 'subscribers': 1}}
+
+    Connections of subscribers are checked with heartbeats, so that those
+    of a lost computer are closed, and their subscriptions are withdrawn.
+
+    """
+
+    POLL_TIMEOUT = 0.1  # seconds before checking the context
+    FLUSH = 1.0  # seconds between updates of statistics
+
+    # report every subscription and unsubscription, not only the first
+    # and the last ones of each topic
+    VERBOSE = getattr(zmq, 'XPUB_VERBOSER', zmq.XPUB_VERBOSE)
+
+    HEARTBEAT = 1.0  # seconds between checks of subscriber connections
+
+    def __init__(self, context):
+        """
+        Forwards messages from many publishers to many subscribers
+
+        :param context: general settings
+        :type context: Context
+
+        """
+        Process.__init__(self)
+        self.daemon = True
+
+        self.context = context
+
+        self.topics = {}
+
+        self.frontend = None  # allow socket injection for tests
+        self.backend = None
+
+    def run(self):
+        """
+        Continuously forwards messages
+
+        The loop is stopped when ``general.switch`` is changed in the
+        context.
+        """
+        zmq_context = zmq.Context.instance()
+
+        if not self.frontend:
+            self.frontend = zmq_context.socket(zmq.XSUB)
+            self.frontend.linger = 0
+            self.frontend.bind(self.context.get('bus.broker'))
+
+        if not self.backend:
+            self.backend = zmq_context.socket(zmq.XPUB)
+            self.backend.linger = 0
+            self.backend.setsockopt(self.VERBOSE, 1)  # count all subscribers
+            if hasattr(zmq, 'HEARTBEAT_IVL'):  # drop lost subscribers
+                self.backend.setsockopt(zmq.HEARTBEAT_IVL,
+                                        int(self.HEARTBEAT * 1000))
+                self.backend.setsockopt(zmq.HEARTBEAT_TIMEOUT,
+                                        int(self.HEARTBEAT * 3000))
+            self.backend.bind(self.context.get('bus.bind')
+                              or self.context.get('bus.address'))
+
+        poller = zmq.Poller()
+        poller.register(self.frontend, zmq.POLLIN)
+        poller.register(self.backend, zmq.POLLIN)
+
+        logger.info(u"Starting broker")
+        logger.debug(u"- receiving from publishers at {}",
+                     self.context.get('bus.broker'))
+
+        flushed = time.time()
+        try:
+            while True:
+
+                events = dict(poller.poll(self.POLL_TIMEOUT * 1000))
+
+                if self.frontend in events:
+                    frames = self.frontend.recv_multipart()
+                    self.backend.send_multipart(frames)
+                    self.count(frames)
+
+                if self.backend in events:
+                    frames = self.backend.recv_multipart()
+                    self.frontend.send_multipart(frames)
+                    self.subscribe(frames)
+
+                if time.time() - flushed >= self.FLUSH:
+                    flushed = time.time()
+                    self.flush()
+
+                elif events:  # do not slow down the flow
+                    continue
+
+                if self.context.get('general.switch', 'on') != 'on':
+                    break
+
+        except KeyboardInterrupt:
+            pass
+
+        self.flush()
+
+        self.frontend.close()
+        self.frontend = None
+        self.backend.close()
+        self.backend = None
+
+        logger.info(u"Broker has been stopped")
+
+    def get_topic(self, frames):
+        """
+        Extracts the topic of a message
+
+        :param frames: frames of the message
+        :type frames: list of bytes
+
+        :return: the topic
+        :rtype: str
+        """
+        topic = frames[0]
+        if len(frames) == 1:
+            topic = topic.split(b' ', 1)[0]
+        return topic.decode('utf-8', 'replace')
+
+    def get_stats(self, topic):
+        """
+        Provides statistics of one topic
+
+        :param topic: the topic
+        :type topic: str
+
+        :return: ``messages``, ``bytes`` and ``subscribers``
+        :rtype: dict
+        """
+        return self.topics.setdefault(topic, {'messages': 0,
+                                              'bytes': 0,
+                                              'subscribers': 0})
+
+    def count(self, frames):
+        """
+        Updates statistics on a forwarded message
+
+        :param frames: frames of the message
+        :type frames: list of bytes
+
+        """
+        stats = self.get_stats(self.get_topic(frames))
+        stats['messages'] += 1
+        stats['bytes'] += sum(len(x) for x in frames)
+
+    def subscribe(self, frames):
+        """
+        Updates statistics on a subscription
+
+        :param frames: the subscription message, e.g., ``\\x01topic``
+        :type frames: list of bytes
+
+        """
+        if not frames or not frames[0]:
+            return
+
+        topic = frames[0][1:].decode('utf-8', 'replace')
+        if frames[0][:1] == b'\x01':
+            self.get_stats(topic)['subscribers'] += 1
+        elif frames[0][:1] == b'\x00':
+            self.get_stats(topic)['subscribers'] -= 1
+
+    def flush(self):
+        """
+        Pushes statistics to the context
+        """
+        self.context.set('broker.topics', dict(self.topics))
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import OrderedDict
+from threading import Lock
+import time
+
+
+class Cache(object):
+    """
+    Remembers a bounded number of recent items
+
+    This is a key-value store that is local to one process. It forgets
+    least recently used items when its size is exceeded, and items that
+    are older than some duration.
+
+    Example::
+
+        cache = Cache(size=100, duration=60.0)
+        cache.put('hello', 'world')
+        ...
+        value = cache.get('hello')
+
+    The cache can also be used to detect duplicates, like in this example::
+
+        if cache.seen(message_id):
+            return  # this has already been processed
+
+    This class is safe on multithreading, but not across processes.
+    """
+
+    def __init__(self, size=1000, duration=None):
+        """
+        Remembers a bounded number of recent items
+
+        :param size: maximum number of items to remember
+        :type size: positive integer
+
+        :param duration: maximum time to remember an item, in seconds
+        :type duration: positive number or None
+
+        If no duration is provided, then items are remembered until the cache
+        is full.
+        """
+        assert size > 0
+        self.size = size
+
+        assert duration is None or duration > 0
+        self.duration = duration
+
+        self.lock = Lock()
+        self.items = OrderedDict()
+
+    def __len__(self):
+        """
+        Counts items that are in the cache
+        """
+        with self.lock:
+            self._purge()
+            return len(self.items)
+
+    def __contains__(self, key):
+        """
+        Checks if some fresh item is in the cache
+        """
+        with self.lock:
+            self._purge()
+            return self._is_fresh(key)
+
+    def get(self, key, default=None):
+        """
+        Retrieves the value of one item
+
+        :param key: name of the item
+        :type key: str
+
+        :param default: default value
+        :type default: any object
+
+        :return: the actual value, or the default value
+
+        Retrieved items are moved to the top of the cache, so that they
+        are not pushed out by newer items. This does not extend the duration
+        of their life in the cache.
+        """
+        with self.lock:
+            self._purge()
+
+            if not self._is_fresh(key):
+                return default
+
+            (stamp, value) = self.items.pop(key)
+            self.items[key] = (stamp, value)
+            return value
+
+    def put(self, key, value=True):
+        """
+        Remembers one item
+
+        :param key: name of the item
+        :type key: str
+
+        :param value: value of the item
+        :type value: any object
+
+        """
+        with self.lock:
+            self.items.pop(key, None)
+            self.items[key] = (time.time(), value)
+            self._purge()
+
+    def seen(self, key):
+        """
+        Detects duplicates
+
+        :param key: identifier of some item
+        :type key: str
+
+        :return: True if this key is in the cache already, else False
+
+        The key is remembered on first call, so that next calls with the same
+        key will return True, until the key is forgotten.
+        """
+        with self.lock:
+            self._purge()
+
+            if self._is_fresh(key):
+                return True
+
+            self.items.pop(key, None)
+            self.items[key] = (time.time(), True)
+            self._purge()
+            return False
+
+    def forget(self, key=None):
+        """
+        Forgets one item or all items
+
+        :param key: name of the item to forget, or None
+        :type key: str
+
+        """
+        with self.lock:
+            if key is None:
+                self.items.clear()
+            else:
+                self.items.pop(key, None)
+
+    def _is_fresh(self, key):
+        """
+        Checks one item, and forgets it if it is too old
+
+        This function should be called while the lock is held.
+        """
+        try:
+            stamp = self.items[key][0]
+        except KeyError:
+            return False
+
+        if self.duration and stamp < time.time() - self.duration:
+            del self.items[key]
+            return False
+
+        return True
+
+    def _purge(self):
+        """
+        Forgets items that are too old, or too numerous
+
+        This function should be called while the lock is held.
+        """
+        while len(self.items) > self.size:
+            self.items.popitem(last=False)
+
+        if self.duration:
+            limit = time.time() - self.duration
+            while self.items:
+                key = next(iter(self.items))
+                if self.items[key][0] >= limit:
+                    break
+                del self.items[key]
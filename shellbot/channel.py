@@ -226,3 +226,15 @@ class Channel(object):
         many participants.
         """
         return self.attributes.get('is_direct', False)
+
+    @property
+    def is_group(self):
+        """
+        Indicates if this channel is shared by a group of persons
+
+        :rtype: bool
+
+        By default, every channel that is not direct is considered a group
+        channel.
+        """
+        return self.attributes.get('is_group', not self.is_direct)
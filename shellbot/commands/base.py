@@ -116,7 +116,11 @@ class Command(object):
         - ``attachment`` - When a file has been uploaded, this attribute
           provides its external name, e.g., ``picture024.png``. This can be used
           in the executed command, if you keep in mind that the same name can be
-          used multiple times in a conversation.
+          used multiple times in a conversation. Since the name can require a
+          request to the back-end, it may be provided as an ``AttachmentName``,
+          that is resolved only when the command reads it, e.g., with
+          ``u"{}".format(attachment)``. Testing ``if attachment:`` does not
+          trigger any request.
 
         - ``url`` - When a file has been uploaded, this is the handle by which
           actual content can be retrieved. Usually, ask the underlying space
@@ -31,6 +31,8 @@ class Context(object):
 
     """
 
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
     def __init__(self, settings=None, filter=None):
         """
         Stores settings across multiple independent processing units
@@ -358,6 +360,134 @@ class Context(object):
 
             return value
 
+    def append(self, key, value, limit=None):
+        """
+        Adds an item to a list
+
+        :param key: name of the list
+        :type key: str
+
+        :param value: the item to be added
+        :type value: any serializable type is accepted
+
+        :param limit: the maximum number of items in the list
+        :type limit: int
+
+        :return: the updated list
+        :rtype: list
+
+        When the limit is reached, oldest items are removed from the list.
+
+        Example::
+
+            context.append('audit.last', u'hello world', limit=10)
+
+        This function is safe on multiprocessing and multithreading.
+        """
+        with self.lock:
+
+            items = self.values.get(key)
+            if not isinstance(items, list):
+                items = []
+            items.append(value)
+            if limit:
+                items = items[-limit:]
+            self.values[key] = items
+
+            return items
+
+    def remove(self, key, value, field=None):
+        """
+        Removes an item from a list
+
+        :param key: name of the list
+        :type key: str
+
+        :param value: the item to be removed
+        :type value: any serializable type is accepted
+
+        :param field: if set, items are dicts compared on this field only
+        :type field: str
+
+        :return: the removed item, or None
+        :rtype: any serializable type
+
+        Example::
+
+            if context.remove('audit.last', u'hello world'):
+                ...
+
+            letter = context.remove('deadletters.items', 3, field='id')
+
+        This function is safe on multiprocessing and multithreading.
+        """
+        with self.lock:
+
+            items = self.values.get(key)
+            if not isinstance(items, list):
+                return None
+
+            for index, item in enumerate(items):
+                if field:
+                    if not isinstance(item, dict) or item.get(field) != value:
+                        continue
+                elif item != value:
+                    continue
+
+                del items[index]
+                self.values[key] = items
+                return item
+
+            return None
+
+    def observe(self, key, value, buckets=None):
+        """
+        Adds a measurement to a histogram
+
+        :param key: name of the histogram
+        :type key: str
+
+        :param value: the measurement, e.g., a duration in seconds
+        :type value: float
+
+        :param buckets: upper bounds of histogram buckets
+        :type buckets: list of float
+
+        :return: the updated histogram
+        :rtype: dict
+
+        The histogram is a dict with following keys:
+
+        * ``bounds`` -- upper bounds of buckets
+        * ``buckets`` -- cumulated count of measurements for each bucket
+        * ``count`` -- total number of measurements
+        * ``sum`` -- sum of measurements
+
+        Example::
+
+            context.observe('metrics.command.echo', 0.012)
+
+        This function is safe on multiprocessing and multithreading.
+        """
+        with self.lock:
+
+            histogram = self.values.get(key)
+            if not isinstance(histogram, dict):
+                bounds = list(buckets or self.BUCKETS)
+                histogram = {'bounds': bounds,
+                             'buckets': [0] * len(bounds),
+                             'count': 0,
+                             'sum': 0.0}
+
+            for index, bound in enumerate(histogram['bounds']):
+                if value <= bound:
+                    histogram['buckets'][index] += 1
+            histogram['count'] += 1
+            histogram['sum'] += value
+            self.values[key] = histogram
+
+            return histogram
+
     @classmethod
     def set_logger(cls, level=logging.DEBUG):
         """
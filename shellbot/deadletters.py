@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import traceback
+
+from .logger import Logger
+
+
+logger = Logger(__name__)
+
+
+class DeadLetters(object):
+    """
+    Keeps items whose processing has failed
+
+    When the listener, the speaker or the observer raises an exception on
+    some item, this item is captured along with the error, so that it can
+    be inspected and replayed later on, e.g., after a fix has been deployed.
+
+    Dead letters are kept in the context, and shared by all processes of
+    the engine. Only the most recent ones are kept:
+
+    * ``deadletters.limit`` - the maximum number of dead letters. Default
+      value is 100.
+
+    Each dead letter is a dict with following keys:
+
+    * ``id`` -- a unique number
+    * ``stage`` -- either ``listener``, ``speaker`` or ``observer``
+    * ``item`` -- the item that could not be processed
+    * ``error`` -- the exception raised, e.g., ``KeyError: 'text'``
+    * ``traceback`` -- where the exception was raised
+    * ``stamp`` -- when the exception was raised
+    * ``duration`` -- seconds spent on the item before the exception
+
+    Example::
+
+        for letter in engine.deadletters.list():
+            print(u"{}: {}".format(letter['id'], letter['error']))
+
+        engine.deadletters.replay(id=3)
+
+    The route :class:`shellbot.routes.DeadLetters` does the same over the
+    web.
+    """
+
+    LIMIT = 100  # keep only the most recent dead letters
+
+    KEY = 'deadletters.items'
+
+    def __init__(self, engine):
+        """
+        Keeps items whose processing has failed
+
+        :param engine: the engine that processes items
+        :type engine: Engine
+
+        """
+        self.engine = engine
+
+    def add(self, stage, item, feedback, started=None):
+        """
+        Captures an item whose processing has failed
+
+        :param stage: either ``listener``, ``speaker`` or ``observer``
+        :type stage: str
+
+        :param item: the item that could not be processed
+
+        :param feedback: the exception that has been raised
+        :type feedback: Exception
+
+        :param started: when processing of the item started
+        :type started: float
+
+        :return: the dead letter, or None
+        :rtype: dict
+
+        This function is called from exception handlers, and it never
+        raises an exception itself.
+        """
+        try:
+            letter = {
+                'id': self.engine.context.increment('deadletters.counter'),
+                'stage': stage,
+                'item': item,
+                'error': u'{}: {}'.format(feedback.__class__.__name__,
+                                          feedback),
+                'traceback': traceback.format_exc(),
+                'stamp': time.time(),
+                'duration': time.time() - started if started else None,
+            }
+
+            self.engine.context.append(
+                self.KEY,
+                letter,
+                limit=self.engine.get('deadletters.limit', self.LIMIT))
+
+            logger.warning(u"Captured dead letter {} from {}",
+                           letter['id'], stage)
+            return letter
+
+        except Exception as error:
+            logger.error(u"Unable to capture dead letter from {}: {}",
+                         stage, error)
+            return None
+
+    def list(self):
+        """
+        Lists dead letters
+
+        :return: dead letters, from the oldest to the most recent one
+        :rtype: list of dict
+        """
+        return self.engine.context.get(self.KEY, [])
+
+    def replay(self, id=None):
+        """
+        Submits dead letters again
+
+        :param id: the dead letter to replay, or None for all of them
+        :type id: int
+
+        :return: the number of replayed items
+        :rtype: int
+
+        Each item is put back in the queue of its stage, and removed from
+        dead letters. If it fails again, it is captured with a new id.
+        """
+        count = 0
+        for letter in self.list():
+            if id is not None and letter['id'] != int(id):
+                continue
+
+            letter = self.engine.context.remove(self.KEY,
+                                                letter['id'],
+                                                field='id')
+            if letter:
+                logger.info(u"Replaying dead letter {}", letter['id'])
+                self.get_queue(letter).put(letter['item'])
+                count += 1
+
+        return count
+
+    def get_queue(self, letter):
+        """
+        Finds the queue of the stage where some item has failed
+
+        :param letter: the dead letter
+        :type letter: dict
+
+        :return: ``engine.ears``, ``engine.fan``, or a queue of the speaker
+        :rtype: Queue
+        """
+        if letter['stage'] == 'speaker':
+            return self.engine.get_mouth(getattr(letter['item'],
+                                                 'priority',
+                                                 None))
+
+        if letter['stage'] == 'observer':
+            return self.engine.fan
+
+        return self.engine.ears
+
+    def clear(self):
+        """
+        Forgets all dead letters
+
+        :return: the number of forgotten dead letters
+        :rtype: int
+        """
+        count = len(self.list())
+        self.engine.context.set(self.KEY, [])
+        return count
@@ -16,7 +16,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import logging
 from multiprocessing import Process, Queue
 from six import string_types
 import sys
@@ -27,16 +26,28 @@ import weakref
 from .bot import ShellBot
 from .bus import Bus
 from .context import Context
+from .deadletters import DeadLetters
 from .i18n import _, localization as l10n
+from .journal import Journal
 from .lists import ListFactory
 from .listener import Listener
+from .logger import Logger
 from .observer import Observer
+from .queues import BoundedQueue, DurableQueue
+from .routes.deadletters import DeadLetters as DeadLettersRoute
+from .routes.metrics import Metrics
+from .routes.profile import Profile
 from .routes.wrapper import Wrapper
 from .server import Server
+from .shards import Shards, ShardReceiver
 from .shell import Shell
 from .spaces import SpaceFactory
 from .speaker import Speaker
 from .stores import StoreFactory
+from .tracing import tracer
+
+
+logger = Logger(__name__)
 
 
 class Engine(object):
@@ -257,8 +268,15 @@ class Engine(object):
 
         self.context = context if context else Context()
         l10n.context = self.context
+        tracer.set_context(self.context)
 
         self.mouth = mouth
+        self.mouths = {}
+        self.journal = None
+        self.deadletters = DeadLetters(engine=self)
+        self.shards = Shards(engine=self)
+        self.receiver = None
+        self.broker = None
         self.speaker = Speaker(engine=self)
 
         self.ears = ears
@@ -327,8 +345,8 @@ class Engine(object):
 
         """
 
-        logging.info(u"Loading configuration")
-        logging.info(u"- from '{}'".format(path))
+        logger.info(u"Loading configuration")
+        logger.info(u"- from '{}'", path)
         with open(path, 'r') as stream:
             self.configure_from_file(stream)
 
@@ -347,7 +365,7 @@ class Engine(object):
         try:
             settings = yaml.load(stream)
         except Exception as feedback:
-            logging.error(feedback)
+            logger.error(feedback)
             raise Exception(u"Unable to load valid YAML settings")
 
         self.configure(settings=settings)
@@ -375,7 +393,7 @@ class Engine(object):
         if (self.server is None
             and self.get('server.binding') is not None):
 
-            logging.debug(u"Adding web server")
+            logger.debug(u"Adding web server")
             self.server = Server(context=self.context, check=True)
 
         self.space.ears = self.ears
@@ -429,6 +447,9 @@ class Engine(object):
         self.context.check('bot.on_enter', filter=True)
         self.context.check('bot.on_exit', filter=True)
 
+        if self.context.get('server.profile'):  # profiler in every process
+            self.context.check('profiler.switch', 'off')
+
     def get(self, key, default=None):
         """
         Retrieves the value of one configuration key
@@ -543,7 +564,7 @@ class Engine(object):
         of registered objects.
 
         """
-        logging.debug(u"Registering to '{}' dispatch".format(event))
+        logger.debug(u"Registering to '{}' dispatch", event)
 
         assert event
         assert isinstance(event, string_types)
@@ -558,11 +579,11 @@ class Engine(object):
         self.registered[event].append(handle)
 
         if len(self.registered[event]) > 1:
-            logging.debug(u"- {} objects registered to '{}'".format(
-                len(self.registered[event]), event))
+            logger.debug(u"- {} objects registered to '{}'",
+                         len(self.registered[event]), event)
 
         else:
-            logging.debug(u"- 1 object registered to '{}'".format(event))
+            logger.debug(u"- 1 object registered to '{}'", event)
 
     def dispatch(self, event, **kwargs):
         """
@@ -586,14 +607,14 @@ class Engine(object):
         assert event in self.registered.keys()  # avoid unknown event type
 
         if len(self.registered[event]) > 1:
-            logging.debug(u"Dispatching '{}' to {} objects".format(
-                event, len(self.registered[event])))
+            logger.debug(u"Dispatching '{}' to {} objects", event,
+                         len(self.registered[event]))
 
         elif len(self.registered[event]) > 0:
-            logging.debug(u"Dispatching '{}' to 1 object".format(event))
+            logger.debug(u"Dispatching '{}' to 1 object", event)
 
         else:
-            logging.debug(u"Dispatching '{}', nothing to do".format(event))
+            logger.debug(u"Dispatching '{}', nothing to do", event)
             return
 
         name = 'on_' + event
@@ -602,7 +623,7 @@ class Engine(object):
                 callback = getattr(handle, name)
                 callback(**kwargs)
             except ReferenceError:
-                logging.debug(u"- registered object no longer exists")
+                logger.debug(u"- registered object no longer exists")
 
     def load_commands(self, *args, **kwargs):
         """
@@ -629,14 +650,55 @@ class Engine(object):
 
         This function adds a route to the provided server, and
         asks the back-end service to send messages there.
+
+        If ``server.metrics`` is set, then metrics of the engine are
+        exposed as well, at this path of the server. In a similar way,
+        ``server.profile`` adds a route to control the sampling profiler,
+        and ``server.deadletters`` a route to inspect and replay items
+        whose processing has failed.
+
+        The server also receives notifications from the Internet, so these
+        two routes can change the state of the engine from anywhere. They
+        are added only if ``server.admin_token`` is set as well, and then
+        requests have to provide ``Authorization: Bearer <token>``.
         """
 
         if server is not None:
-            logging.debug('Adding hook route to web server')
+            logger.debug('Adding hook route to web server')
             server.add_route(
                 Wrapper(callable=self.get_hook(),
                         route=self.context.get('server.hook', '/hook')))
 
+            if self.context.get('server.metrics'):
+                logger.debug('Adding metrics route to web server')
+                server.add_route(
+                    Metrics(context=self.context,
+                            engine=self,
+                            route=self.context.get('server.metrics')))
+
+            token = self.context.get('server.admin_token')
+            admin = [x for x in ('server.profile', 'server.deadletters')
+                     if self.context.get(x)]
+            if admin and not token:
+                logger.warning(u"Set server.admin_token to add {}",
+                               u', '.join(admin))
+
+            if self.context.get('server.profile') and token:
+                logger.debug('Adding profile route to web server')
+                server.add_route(
+                    Profile(context=self.context,
+                            token=token,
+                            route=self.context.get('server.profile')))
+
+            if self.context.get('server.deadletters') and token:
+                logger.debug('Adding dead letters route to web server')
+                server.add_route(
+                    DeadLettersRoute(
+                        context=self.context,
+                        engine=self,
+                        token=token,
+                        route=self.context.get('server.deadletters')))
+
         if (self.context.get('server.binding') is not None
             and self.context.get('server.url') is not None):
 
@@ -647,7 +709,13 @@ class Engine(object):
     def get_hook(self):
         """
         Provides the hooking function to receive messages from Cisco Spark
+
+        When sharding has been configured, notifications are routed to the
+        engine that owns their channel, see :class:`shellbot.shards.Shards`.
         """
+        if self.shards.is_enabled:
+            return self.shards.webhook
+
         return self.space.webhook
 
     def run(self, server=None):
@@ -686,7 +754,7 @@ class Engine(object):
             try:
                 self._server_process.join()
             except KeyboardInterrupt:
-                logging.error(u"Aborted by user")
+                logger.error(u"Aborted by user")
 
         self.stop()
 
@@ -695,20 +763,34 @@ class Engine(object):
         Starts the engine
         """
 
-        logging.warning(u'Starting the bot')
+        logger.warning(u'Starting the bot')
 
         for channel in self.space.list_group_channels(quantity=self.preload):
             self.bots_to_load.add(channel.id)  # handled by the listener
 
         if self.mouth is None:
-            self.mouth = Queue()
+            self.mouth = self.build_queue('mouth')
+
+        if not self.mouths:
+            self.mouths = dict((x, self.build_queue('mouth', lane=x))
+                               for x in ('interactive', 'bulk'))
+
+        if self.journal is None and self.context.get('speaker.journal'):
+            self.journal = Journal(
+                path=self.context.get('speaker.journal'),
+                retention=self.context.get('speaker.retention'))
+
+        if self.ears is None and self.context.get('ears.log'):
+            self.ears = DurableQueue(path=self.context.get('ears.log'),
+                                     name='ears')
+            self.space.ears = self.ears
 
         if self.ears is None:
-            self.ears = Queue()
+            self.ears = self.build_queue('ears')
             self.space.ears = self.ears
 
         if self.fan is None and self.updater_factory:
-            self.fan = Queue()
+            self.fan = self.build_queue('fan')
         self.space.fan = self.fan
 
         self.start_processes()
@@ -717,6 +799,74 @@ class Engine(object):
 
         self.dispatch('start')
 
+    def build_queue(self, name, lane=None):
+        """
+        Builds one queue of the engine
+
+        :param name: either ``ears``, ``mouth`` or ``fan``
+        :type name: str
+
+        :param lane: the priority served by this queue, if any
+        :type lane: str
+
+        :return: a Queue, or a BoundedQueue
+        :rtype: Queue
+
+        Queues are unbounded, unless a capacity is set in the context:
+
+        * ``<name>.size`` - the maximum number of items in memory
+
+        * ``<name>.policy`` - what to do on overflow, either ``block``
+          (the default), ``drop_oldest``, ``drop_newest`` or ``spill``
+
+        * ``<name>.spill`` - the file used by the ``spill`` policy
+
+        Example::
+
+            engine.configure({'ears': {'size': 1000, 'policy': 'drop_oldest'}})
+
+        Alternatively, inbound events can be kept on disk until they have
+        been processed, by setting ``ears.log`` to a directory. Then
+        :class:`shellbot.queues.DurableQueue` is used for ``ears``.
+        """
+        size = self.context.get(name + '.size', 0)
+        if not size:
+            return Queue()
+
+        policy = self.context.get(name + '.policy', 'block')
+        path = self.context.get(name + '.spill')
+        if lane:
+            name = name + '.' + lane
+            if path:
+                path = path + '.' + lane
+
+        logger.debug(u"- bounding queue {} to {} items", name, size)
+        return BoundedQueue(name=name,
+                            maxsize=size,
+                            policy=policy,
+                            path=path)
+
+    def get_mouth(self, priority=None):
+        """
+        Provides the queue used for updates of some priority
+
+        :param priority: either ``interactive``, ``normal`` or ``bulk``
+        :type priority: str
+
+        :return: a queue read by the speaker
+        :rtype: Queue
+
+        Updates of normal priority are put in ``engine.mouth``, and this
+        queue is also used for other priorities until the engine has
+        been started.
+        """
+        if priority and priority != 'normal':
+            queue = self.mouths.get(priority)
+            if queue is not None:
+                return queue
+
+        return self.mouth
+
     def start_processes(self):
         """
         Starts the engine processes
@@ -729,9 +879,18 @@ class Engine(object):
 
         self.speaker.start()
         self.listener.start()
-        self.publisher.start()
+        if self.context.get('bus.serve'):
+            self.broker = self.bus.serve()
+            self.broker.start()
+
+        if not self.publisher.is_direct:
+            self.publisher.start()
         self.observer.start()
 
+        if self.shards.is_enabled:
+            self.receiver = ShardReceiver(engine=self)
+            self.receiver.start()
+
     def on_start(self):
         """
         Does additional stuff when the engine is started
@@ -748,16 +907,19 @@ class Engine(object):
         by bot components.
         """
 
-        logging.warning(u'Stopping the bot')
+        logger.warning(u'Stopping the bot')
 
         self.dispatch('stop')
 
         self.on_stop()
 
-        logging.debug(u"Switching off")
+        logger.debug(u"Switching off")
         self.context.set('general.switch', 'off')
         time.sleep(1)
 
+        if getattr(self, 'publisher', None):
+            self.publisher.close()  # flush direct sockets of this process
+
         try:
             self.listener.join()
         except AssertionError:
@@ -811,11 +973,11 @@ class Engine(object):
         if not title:
             title=self.space.configured_title()
 
-        logging.debug(u"Bonding to channel '{}'".format(title))
+        logger.debug(u"Bonding to channel '{}'", title)
 
         channel = self.space.get_by_title(title=title)
         if channel and not reset:
-            logging.debug(u"- found existing channel")
+            logger.debug(u"- found existing channel")
 
             # ask explicitly the listener to load the bot
             if self.ears is None:
@@ -824,14 +986,14 @@ class Engine(object):
 
         else:
             if channel and reset:
-                logging.debug(u"- deleting existing channel")
+                logger.debug(u"- deleting existing channel")
                 self.space.delete(id=channel.id)
 
-            logging.debug(u"- creating channel '{}'".format(title))
+            logger.debug(u"- creating channel '{}'", title)
             channel = self.space.create(title=title, **kwargs)
 
             if not channel:
-                logging.error("Unable to create channel")
+                logger.error("Unable to create channel")
                 return
 
             if not participants:
@@ -855,7 +1017,7 @@ class Engine(object):
         if not title:
             title=self.space.configured_title()
 
-        logging.debug(u"Disposing channel '{}'".format(title))
+        logger.debug(u"Disposing channel '{}'", title)
 
         channel = self.space.get_by_title(title=title)
         if channel:
@@ -893,15 +1055,15 @@ class Engine(object):
                 return
             channel_id = channel.id
 
-        logging.debug(u"Getting bot {}".format(channel_id))
+        logger.debug(u"Getting bot {}", channel_id)
         if channel_id and channel_id in self.bots.keys():
-            logging.debug(u"- found matching bot instance")
+            logger.debug(u"- found matching bot instance")
             return self.bots[channel_id]
 
         bot = self.build_bot(id=channel_id, driver=self.driver)
 
         if bot and bot.id:
-            logging.debug(u"- remembering bot {}".format(bot.id))
+            logger.debug(u"- remembering bot {}", bot.id)
             self.bots[bot.id] = bot
             self.set('bots.ids', self.bots.keys())   # for the observer
 
@@ -923,7 +1085,7 @@ class Engine(object):
         This function receives the id of a chat space, and returns
         the related bot.
         """
-        logging.debug(u"- building bot instance")
+        logger.debug(u"- building bot instance")
         bot = driver(engine=self, channel_id=id)
 
         self.initialize_store(bot=bot)
@@ -962,18 +1124,18 @@ class Engine(object):
         This function receives an identifier, and returns
         a store bound to it.
         """
-        logging.debug(u"- building data store")
+        logger.debug(u"- building data store")
         return StoreFactory.get(type='memory')
 
     def initialize_store(self, bot):
         """
         Copies engine settings to the bot store
         """
-        logging.debug(u"Initializing bot store")
+        logger.debug(u"Initializing bot store")
 
         settings = self.get('bot.store', {})
         if settings:
-            logging.debug(u"- initializing store from general settings")
+            logger.debug(u"- initializing store from general settings")
             for (key, value) in settings.items():
                 bot.store.remember(key, value)
 
@@ -981,7 +1143,7 @@ class Engine(object):
             label = "store.{}".format(bot.id)
             settings = self.get(label, {})
             if settings:
-                logging.debug(u"- initializing store from bot settings")
+                logger.debug(u"- initializing store from bot settings")
                 for (key, value) in settings.items():
                     bot.store.remember(key, value)
 
@@ -998,7 +1160,7 @@ class Engine(object):
         a state machine bound to it.
         """
         if self.machine_factory:
-            logging.debug(u"- building state machine")
+            logger.debug(u"- building state machine")
             machine = self.machine_factory.get_machine(bot=bot)
             return machine
 
@@ -1017,7 +1179,7 @@ class Engine(object):
         a state machine bound to it.
         """
         if self.updater_factory:
-            logging.debug(u"- building updater")
+            logger.debug(u"- building updater")
             updater = self.updater_factory.get_updater(id=id)
             return updater
 
@@ -282,13 +282,15 @@ class Message(Event):
 
         :rtype: str
 
-        This attribute is set on file upload. It provides with the
+        This attribute may be set on file upload. It provides with the
         external name of the file that has been shared, if any.
 
-        For example, to get a local copy of an uploaded file::
+        Since resolving the name can be expensive, some spaces do not set
+        this attribute and only provide ``url``. In that case, the shell
+        provides commands with an ``AttachmentName``, that is resolved only
+        when it is read. The name can also be requested directly::
 
-            if message.attachment:
-                path = space.download_attachment(message.url)
+            name = message.attachment or space.name_attachment(message.url)
 
         """
         return self.attributes.get('attachment')
@@ -325,6 +327,98 @@ class Message(Event):
         return self.attributes.get('stamp')
 
 
+class AttachmentName(object):
+    """
+    Provides the name of an uploaded file, resolved on first use
+
+    Resolving the name of a file can involve a round trip to the back-end,
+    therefore it is requested to the space only when the name is actually
+    read, e.g., formatted or compared. The object is true if a file has been
+    uploaded, without any request to the back-end.
+
+    Example::
+
+        attachment = AttachmentName(space, message.url)
+        if attachment:  # no request here
+            bot.say(u"Thanks for {}".format(attachment))  # resolved here
+
+    """
+
+    def __init__(self, space, url):
+        """
+        Provides the name of an uploaded file, resolved on first use
+
+        :param space: the space that can name the file
+        :type space: Space
+
+        :param url: link to the uploaded file
+        :type url: str
+
+        """
+        self.space = space
+        self.url = url
+        self._name = None
+
+    @property
+    def name(self):
+        """
+        Returns the name of the uploaded file
+
+        :rtype: str
+
+        The name is asked to the space once, and then remembered.
+        """
+        if self._name is None:
+            self._name = self.space.name_attachment(self.url)
+        return self._name
+
+    def __getattr__(self, name):
+        """
+        Gives access to string functions, e.g., ``endswith()``
+        """
+        if name.startswith('_'):  # do not resolve on copy or pickle
+            raise AttributeError(name)
+
+        return getattr(self.name, name)
+
+    def __bool__(self):
+        return bool(self.url)
+
+    __nonzero__ = __bool__  # python 2
+
+    def __str__(self):
+        return self.name
+
+    __unicode__ = __str__  # python 2
+
+    def __format__(self, spec):
+        return format(self.name, spec)
+
+    def __repr__(self):
+        return u"{}({})".format(self.__class__.__name__,
+                                json.dumps(self.url))
+
+    def __len__(self):
+        return len(self.name)
+
+    def __add__(self, other):
+        return self.name + other
+
+    def __radd__(self, other):
+        return other + self.name
+
+    def __eq__(self, other):
+        if isinstance(other, AttachmentName):
+            other = other.name
+        return self.name == other
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self.name)
+
+
 class Join(Event):
     """
     Represents the addition of someone to a space
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import binascii
+import json
+import os
+import sqlite3
+from threading import Lock
+import time
+
+from .logger import Logger
+from .speaker import Vibes
+
+
+logger = Logger(__name__)
+
+
+class Journal(object):
+    """
+    Records outbound updates until they have been posted
+
+    Updates are written to a Sqlite database before being put in the queue
+    of the speaker, and they are marked once posted. When the engine is
+    restarted, updates that have not been posted yet are submitted again
+    to the speaker.
+
+    Each update has a unique key, so that it is posted only once, even if
+    it has been submitted multiple times.
+
+    The journal is activated in the context:
+
+    * ``speaker.journal`` - the path of the Sqlite database
+
+    * ``speaker.retention`` - seconds during which posted updates are
+      remembered. Default value is one day.
+
+    Example::
+
+        engine.configure({'speaker': {'journal': '/var/lib/shellbot.db'}})
+
+    """
+
+    RETENTION = 86400.0  # remember posted updates during one day
+
+    ATTEMPTS = 3  # give up after this number of failed posts
+
+    FIELDS = ('text', 'content', 'file', 'channel_id', 'person', 'priority')
+
+    def __init__(self, path, retention=None):
+        """
+        Records outbound updates until they have been posted
+
+        :param path: the file that contains Sqlite data
+        :type path: str
+
+        :param retention: seconds during which posted updates are remembered
+        :type retention: float
+
+        """
+        self.path = path
+        self.retention = retention if retention else self.RETENTION
+        self.lock = Lock()
+        self._pid = None
+        self._db = None
+
+    def get_db(self):
+        """
+        Gets a handle on the database
+
+        There is one connection per process, shared by all threads.
+        """
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._db = sqlite3.connect(self.path,
+                                       timeout=10.0,
+                                       check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS journal \
+                (key TEXT PRIMARY KEY, \
+                vibes TEXT, \
+                status TEXT, \
+                attempts INTEGER, \
+                stamp REAL)")
+            self._db.commit()
+
+        return self._db
+
+    def execute(self, statement, parameters=()):
+        """
+        Runs one statement and commits it
+
+        :return: rows returned by the statement
+        :rtype: list
+        """
+        with self.lock:
+            handle = self.get_db()
+            cursor = handle.execute(statement, parameters)
+            rows = cursor.fetchall()
+            handle.commit()
+            cursor.close()
+            return rows
+
+    def record(self, vibes):
+        """
+        Records an update before it is posted
+
+        :param vibes: the update to be posted
+        :type vibes: Vibes
+
+        :return: the key of this update
+        :rtype: str
+
+        A key is given to the update if it has none yet.
+        """
+        if not vibes.key:
+            vibes.key = binascii.hexlify(os.urandom(16)).decode('ascii')
+
+        record = dict((x, getattr(vibes, x)) for x in self.FIELDS)
+        self.execute("INSERT OR IGNORE INTO journal \
+                     (key, vibes, status, attempts, stamp) \
+                     VALUES (?, ?, 'pending', 0, ?)",
+                     (vibes.key, json.dumps(record), time.time()))
+        return vibes.key
+
+    def is_posted(self, key):
+        """
+        Checks if an update has been posted already
+
+        :param key: the key of the update
+        :type key: str
+
+        :rtype: bool
+        """
+        rows = self.execute("SELECT status FROM journal WHERE key=?", (key,))
+        return bool(rows) and rows[0][0] == 'posted'
+
+    def complete(self, key):
+        """
+        Remembers that an update has been posted
+
+        :param key: the key of the update
+        :type key: str
+
+        """
+        self.execute("UPDATE journal SET status='posted', stamp=? \
+                     WHERE key=?", (time.time(), key))
+
+    def fail(self, key):
+        """
+        Remembers that an update could not be posted
+
+        :param key: the key of the update
+        :type key: str
+
+        After ``ATTEMPTS`` failures, the update is not replayed anymore.
+        """
+        self.execute("UPDATE journal SET attempts=attempts+1, \
+                     status=CASE WHEN attempts+1 >= ? \
+                     THEN 'failed' ELSE 'pending' END \
+                     WHERE key=?", (self.ATTEMPTS, key))
+
+    def pending(self):
+        """
+        Lists updates that have not been posted yet
+
+        :return: updates, from the oldest to the most recent one
+        :rtype: list of Vibes
+        """
+        rows = self.execute("SELECT key, vibes FROM journal \
+                            WHERE status='pending' ORDER BY stamp")
+
+        updates = []
+        for key, record in rows:
+            vibes = Vibes(**json.loads(record))
+            vibes.key = key
+            updates.append(vibes)
+
+        return updates
+
+    def purge(self):
+        """
+        Forgets updates posted or failed long ago
+
+        :return: the number of forgotten updates
+        :rtype: int
+        """
+        with self.lock:
+            handle = self.get_db()
+            cursor = handle.execute("DELETE FROM journal \
+                                    WHERE status!='pending' AND stamp<?",
+                                    (time.time() - self.retention,))
+            count = cursor.rowcount
+            handle.commit()
+            cursor.close()
+
+        logger.debug(u"Purged {} updates from journal", count)
+        return count
@@ -16,7 +16,6 @@
 # limitations under the License.
 
 import json
-import logging
 from multiprocessing import Process
 import random
 from six import string_types
@@ -24,6 +23,12 @@ import time
 import yaml
 
 from .events import Event, Message, Join, Leave
+from .logger import Logger
+from .profiler import profiler
+from .tracing import tracer
+
+
+logger = Logger(__name__)
 
 
 class Listener(Process):
@@ -92,7 +97,8 @@ class Listener(Process):
             engine.ears.put(None)
 
         """
-        logging.info(u"Starting listener")
+        logger.info(u"Starting listener")
+        profiler.start(self.engine.context, 'listener')
 
         time.sleep(self.DEFER_DURATION)  # let SSL stabilize first
 
@@ -109,6 +115,8 @@ class Listener(Process):
                     time.sleep(self.EMPTY_DELAY)
                     continue
 
+                item = None
+                started = time.time()
                 try:
                     item = self.engine.ears.get_nowait()
                     if item is None:
@@ -117,17 +125,41 @@ class Listener(Process):
                     self.process(item)
 
                 except Exception as feedback:
-                    logging.exception(feedback)
+                    logger.exception(feedback)
+                    if item is not None:
+                        self.engine.deadletters.add('listener', item,
+                                                    feedback, started)
+
+                self.acknowledge()
 
         except KeyboardInterrupt:
             pass
 
-        logging.info(u"Listener has been stopped")
+        if getattr(self.engine, 'publisher', None):
+            self.engine.publisher.close()
+
+        profiler.stop()
+        logger.info(u"Listener has been stopped")
+
+    def acknowledge(self):
+        """
+        Confirms that the last item received has been processed
+
+        This is used by durable queues, which keep items on disk until
+        they have been processed. Other queues do not need it.
+        """
+        ack = getattr(self.engine.ears, 'ack', None)
+        if ack:
+            ack()
 
     def idle(self):
         """
         Finds something smart to do
         """
+        flush = getattr(self.engine.ears, 'flush', None)
+        if flush:
+            flush()
+
         if self.engine.bots_to_load:
             id = self.engine.bots_to_load.pop()
             self.engine.ears.put({'type': 'load_bot', 'id': id})
@@ -174,42 +206,65 @@ class Listener(Process):
 
         * on any other case, the function ``on_inbound()`` is
           called.
+
+        If tracing has been activated, the trace of the event is made
+        current while it is processed, and then it is exported.
         """
         counter = self.engine.context.increment('listener.counter')
-        logging.debug(u'Listener is working on {}'.format(counter))
+        logger.debug(u'Listener is working on {}', counter)
 
         if isinstance(item, string_types):
             item = yaml.safe_load(item)  # better unicode than json.loads()
 
         assert isinstance(item, dict)  # low-level event representation
 
+        if item['type'] == 'load_bot':
+            logger.debug(u"- processing a 'load_bot' event")
+            bot = self.engine.get_bot(channel_id=item['id'])
+            return
+
+        kind = item['type']  # removed from attributes of the event
+        tracer.current = tracer.mark(item, 'listener')
+        try:
+            self.dispatch(item)
+
+        finally:
+            tracer.export(item, 'done',
+                          type=kind,
+                          channel_id=item.get('channel_id'))
+            tracer.current = None
+
+    def dispatch(self, item):
+        """
+        Dispatches one event based on its type
+
+        :param item: attributes of the event received
+        :type item: dict
+
+        """
         if item['type'] == 'message':
-            logging.debug(u"- processing a 'message' event")
+            logger.debug(u"- processing a 'message' event")
             event = Message(item)
             if self.filter:
                 event = self.filter(event)
             self.on_message(event)
 
         elif item['type'] == 'join':
-            logging.debug(u"- processing a 'join' event")
+            logger.debug(u"- processing a 'join' event")
             event = Join(item)
             if self.filter:
                 event = self.filter(event)
             self.on_join(event)
 
         elif item['type'] == 'leave':
-            logging.debug(u"- processing a 'leave' event")
+            logger.debug(u"- processing a 'leave' event")
             event = Leave(item)
             if self.filter:
                 event = self.filter(event)
             self.on_leave(event)
 
-        elif item['type'] == 'load_bot':
-            logging.debug(u"- processing a 'load_bot' event")
-            bot = self.engine.get_bot(channel_id=item['id'])
-
         else:
-            logging.debug(u"- processing an inbound event")
+            logger.debug(u"- processing an inbound event")
             event = Event(item)
             if self.filter:
                 event = self.filter(event)
@@ -251,43 +306,43 @@ class Listener(Process):
         bot = self.engine.get_bot(received.channel_id)
 
         if received.from_id == self.engine.get('bot.id'):
-            logging.debug(u"- sent by me, thrown away")
+            logger.debug(u"- sent by me, thrown away")
             return
 
         input = received.text
 
         if input is None:
-            logging.debug(u"- no input in this item, thrown away")
+            logger.debug(u"- no input in this item, thrown away")
             return
 
         if len(input) > 0 and input[0] in ['@', '/', '!']:
             input = input[1:]
 
         label = 'fan.' + received.channel_id
-        logging.debug(u"- sensing fan listener on '{}'".format(label))
+        logger.debug(u"- sensing fan listener on '{}'", label)
 
         elapsed = time.time() - self.engine.get(label, 0)
         if elapsed < self.FRESH_DURATION:
-            logging.debug(u"- putting input to fan queue")
+            logger.debug(u"- putting input to fan queue")
             bot.fan.put(input)  # forward downstream
             return
 
         name = self.engine.get('bot.name', 'shelly')
         if input.startswith(name):
-            logging.debug(u"- bot name in command")
+            logger.debug(u"- bot name in command")
             input = input[len(name):].strip()
 
         elif received.is_direct:
-            logging.debug(u"- direct message")
+            logger.debug(u"- direct message")
 
         elif self.engine.get('bot.id') in received.mentioned_ids:
-            logging.debug(u"- bot mentioned in command")
+            logger.debug(u"- bot mentioned in command")
 
         else:
-            logging.info(u"- not for me, thrown away")
+            logger.info(u"- not for me, thrown away")
             return
 
-        logging.debug(u"- submitting command to the shell")
+        logger.debug(u"- submitting command to the shell")
         self.engine.shell.do(input, received=received)
 
     def on_join(self, received):
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+
+
+class Logger(object):
+    """
+    Logs messages with deferred formatting
+
+    Messages are given as a format string followed by its arguments, and
+    the string is formatted only if the level of the message is enabled.
+    This prevents the allocation of log strings in loops, when the
+    level of verbosity is low.
+
+    Example::
+
+        logger = Logger(__name__)
+
+        def process(self, item):
+            logger.debug(u"Processing {}", item)  # nothing built at INFO
+
+    Each module has its own logger, named after the module, so that
+    verbosity can be set separately for each of them::
+
+        logging.getLogger('shellbot.listener').setLevel(logging.INFO)
+
+    By default, these loggers inherit the level of the root logger, as
+    set by ``Context.set_logger()``.
+    """
+
+    def __init__(self, name):
+        """
+        Logs messages with deferred formatting
+
+        :param name: name of the logger, usually ``__name__``
+        :type name: str
+
+        """
+        self.logger = logging.getLogger(name)
+
+    def is_enabled(self, level=logging.DEBUG):
+        """
+        Checks if messages of some level are logged
+
+        :param level: the level of verbosity, e.g., ``logging.DEBUG``
+        :type level: int
+
+        :rtype: bool
+
+        This can be used to skip costly computations of log arguments.
+        """
+        return self.logger.isEnabledFor(level)
+
+    def log(self, level, message, *args, **kwargs):
+        """
+        Logs a message
+
+        :param level: the level of verbosity, e.g., ``logging.DEBUG``
+        :type level: int
+
+        :param message: the message, or a format string
+        :type message: str
+
+        Arguments, if any, are used to format the message, like
+        with ``message.format(*args, **kwargs)``.
+        """
+        if not self.logger.isEnabledFor(level):
+            return
+
+        if args or kwargs:
+            message = message.format(*args, **kwargs)
+
+        self.logger.log(level, message)
+
+    def debug(self, message, *args, **kwargs):
+        self.log(logging.DEBUG, message, *args, **kwargs)
+
+    def info(self, message, *args, **kwargs):
+        self.log(logging.INFO, message, *args, **kwargs)
+
+    def warning(self, message, *args, **kwargs):
+        self.log(logging.WARNING, message, *args, **kwargs)
+
+    def error(self, message, *args, **kwargs):
+        self.log(logging.ERROR, message, *args, **kwargs)
+
+    def exception(self, feedback):
+        """
+        Logs an exception, with its traceback
+
+        :param feedback: the exception that has been caught
+        :type feedback: Exception
+
+        """
+        self.logger.exception(feedback)
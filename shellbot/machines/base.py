@@ -21,6 +21,8 @@ from multiprocessing import Manager, Lock, Process, Queue
 import signal
 import time
 
+from shellbot.profiler import profiler
+
 
 class Machine(object):
     """
@@ -528,7 +530,9 @@ class Machine(object):
 
         """
         logging.info(u"Starting machine")
+        profiler.start(self.bot.engine.context, 'machine')
         self.set('is_running', True)
+        self.bot.engine.context.increment('metrics.machines')
         self.on_start()
 
         time.sleep(self.DEFER_DURATION)
@@ -558,7 +562,12 @@ class Machine(object):
             pass
 
         self.on_stop()
+        if getattr(self.bot.engine, 'publisher', None):
+            self.bot.engine.publisher.close()
+
         self.set('is_running', False)
+        self.bot.engine.context.decrement('metrics.machines')
+        profiler.stop()
         logging.info(u"Machine has been stopped")
 
     def on_start(self):
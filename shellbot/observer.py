@@ -15,13 +15,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import logging
 from multiprocessing import Process
 from six import string_types
 import time
 
 from shellbot.events import Event, Message
 from shellbot.i18n import _
+from shellbot.logger import Logger
+from shellbot.profiler import profiler
+
+
+logger = Logger(__name__)
+
 
 class Observer(Process):
     """
@@ -67,7 +72,8 @@ class Observer(Process):
             engine.fan.put(None)
 
         """
-        logging.info(u"Starting observer")
+        logger.info(u"Starting observer")
+        profiler.start(self.engine.context, 'observer')
 
         try:
             self.engine.set('observer.counter', 0)
@@ -80,6 +86,8 @@ class Observer(Process):
                     time.sleep(self.EMPTY_DELAY)
                     continue
 
+                item = None
+                started = time.time()
                 try:
                     item = self.engine.fan.get(True, 0.1)
                     if item is None:
@@ -88,12 +96,16 @@ class Observer(Process):
                     self.process(item)
 
                 except Exception as feedback:
-                    logging.exception(feedback)
+                    logger.exception(feedback)
+                    if item is not None:
+                        self.engine.deadletters.add('observer', item,
+                                                    feedback, started)
 
         except KeyboardInterrupt:
             pass
 
-        logging.info(u"Observer has been stopped")
+        profiler.stop()
+        logger.info(u"Observer has been stopped")
 
     def process(self, item):
         """
@@ -105,7 +117,7 @@ class Observer(Process):
         """
 
         counter = self.engine.context.increment('observer.counter')
-        logging.debug(u'Observer is working on {}'.format(counter))
+        logger.debug(u'Observer is working on {}', counter)
 
         if isinstance(item, string_types):
             item = Event(item)
@@ -113,11 +125,11 @@ class Observer(Process):
         # logging.debug(u"- {}".format(item))
 
         if item.channel_id not in self.engine.get('bots.ids', []):
-            logging.debug(u"- bot is not in this channel -- thrown away")
+            logger.debug(u"- bot is not in this channel -- thrown away")
             return
 
         if item.channel_id in self.updaters.keys():
-            logging.debug(u"- found matching updater")
+            logger.debug(u"- found matching updater")
             updater = self.updaters[item.channel_id]
 
         else:
@@ -125,10 +137,10 @@ class Observer(Process):
 
             if updater:
                 self.updaters[item.channel_id] = updater
-                logging.debug(u"- caching updater")
+                logger.debug(u"- caching updater")
 
             else:
-                logging.debug(u"- no updater available -- thrown away")
+                logger.debug(u"- no updater available -- thrown away")
                 return
 
         current = self.engine.get(
@@ -152,7 +164,7 @@ class Observer(Process):
 
 
         if current != 'on':
-            logging.debug(u"- no audit for this channel -- thrown away")
+            logger.debug(u"- no audit for this channel -- thrown away")
             return
 
         updater.put(item)
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import Counter
+import os
+import sys
+from threading import Event, Thread, current_thread
+import time
+
+from .logger import Logger
+
+
+logger = Logger(__name__)
+
+
+class Profiler(object):
+    """
+    Samples the stacks of a running process
+
+    A profiler is a background thread that wakes up at regular intervals,
+    and records the stack of every other thread of the process. Stacks
+    are aggregated in collapsed format, where frames are separated by
+    semicolons and followed by the number of samples, e.g.::
+
+        listener;run (listener.py);process (listener.py);do (shell.py) 42
+
+    This is the input expected by ``flamegraph.pl`` and by speedscope.
+
+    The profiler is started in each process of the engine, that is, the
+    listener, the speaker, the observer and state machines, if profiling
+    has been configured. It costs almost nothing until it is switched on
+    in the context:
+
+    * ``profiler.switch`` - either ``on`` or ``off``. If this is not set,
+      no profiler is started. The engine sets it to ``off`` when the route
+      ``server.profile`` is configured. The change is noticed within a
+      second by all processes.
+
+    * ``profiler.interval`` - seconds between samples. Default value
+      is 0.01.
+
+    Sampled stacks are pushed periodically to the context, under keys
+    named after processes, e.g., ``profiler.stacks.listener-1234``.
+    Stacks are reset each time the profiler is switched on.
+
+    Example::
+
+        engine.configure({'profiler': {'switch': 'off'}})  # before start
+        engine.start()
+        ...
+        engine.set('profiler.switch', 'on')
+        time.sleep(30)
+        engine.set('profiler.switch', 'off')
+        time.sleep(2)
+        with open('shellbot.folded', 'w') as handle:
+            handle.write(Profiler(engine.context).report())
+
+    The route :class:`shellbot.routes.Profile` does the same over the web.
+    """
+
+    INTERVAL = 0.01  # seconds between samples
+    POLL = 1.0  # seconds between checks of the context
+    FLUSH = 2.0  # seconds between updates of the context
+
+    def __init__(self, context=None):
+        """
+        Samples the stacks of a running process
+
+        :param context: the settings of this engine
+        :type context: Context
+
+        """
+        self.context = context
+        self.name = None
+        self.stacks = Counter()
+        self._pid = None
+        self._thread = None
+        self._stopping = None
+
+    def start(self, context, name):
+        """
+        Starts the profiler in the current process
+
+        :param context: the settings of this engine
+        :type context: Context
+
+        :param name: the label of this process, e.g., ``listener``
+        :type name: str
+
+        This function does nothing if the profiler is already running
+        in this process, except updating its context and name. It does
+        nothing either if ``profiler.switch`` has not been set, so that
+        processes do not poll the context for a missing key.
+        """
+        self.context = context
+        self.name = name
+
+        if self._pid == os.getpid():
+            return
+
+        if context.get('profiler.switch') is None:
+            return
+
+        self._pid = os.getpid()
+        self.stacks = Counter()
+        self._stopping = Event()
+
+        self._thread = Thread(target=self.run, name='profiler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the profiler in the current process
+
+        This function should be called before the process exits. It waits
+        for the background thread, so that the process does not end while
+        this thread holds the lock of the context.
+        """
+        if self._pid != os.getpid():
+            return
+
+        self._pid = None
+        self._stopping.set()
+        self._thread.join(self.POLL)
+        self._thread = None
+
+    @property
+    def key(self):
+        """
+        Provides the context key used for this process
+
+        :rtype: str
+        """
+        return u'profiler.stacks.{}-{}'.format(self.name, os.getpid())
+
+    def run(self):
+        """
+        Samples stacks while the profiler is switched on
+
+        This function is looping in a background thread. It is stopped
+        by ``stop()``, or when the context cannot be reached anymore.
+        """
+        is_active = False
+        checked = flushed = 0.0
+        interval = self.INTERVAL
+
+        try:
+            while not self._stopping.is_set():
+
+                if time.time() - checked >= self.POLL:
+                    checked = time.time()
+                    was_active = is_active
+                    is_active = (
+                        self.context.get('profiler.switch', 'off') == 'on')
+
+                    if is_active and not was_active:
+                        logger.debug(u"Profiling {}", self.key)
+                        self.stacks = Counter()
+                        interval = self.context.get('profiler.interval',
+                                                    self.INTERVAL)
+
+                    elif was_active and not is_active:
+                        self.flush()
+
+                if not is_active:
+                    self._stopping.wait(self.POLL)
+                    continue
+
+                self.sample()
+
+                if time.time() - flushed >= self.FLUSH:
+                    flushed = time.time()
+                    self.flush()
+
+                self._stopping.wait(interval)
+
+            if is_active:
+                self.flush()
+
+        except Exception:  # context has gone
+            logger.debug(u"Profiler has been stopped")
+
+    def sample(self):
+        """
+        Records the stacks of all other threads of the process
+        """
+        own = current_thread().ident
+        for ident, frame in sys._current_frames().items():
+            if ident != own:
+                self.stacks[self.collapse(frame)] += 1
+
+    def collapse(self, frame):
+        """
+        Turns a stack into a line of text
+
+        :param frame: the innermost frame of the stack
+        :type frame: frame
+
+        :return: frames from the outermost one, separated by semicolons
+        :rtype: str
+
+        """
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            frames.append(u'{} ({})'.format(
+                code.co_name, os.path.basename(code.co_filename)))
+            frame = frame.f_back
+
+        frames.append(u'{}'.format(self.name))
+        return u';'.join(reversed(frames))
+
+    def flush(self):
+        """
+        Pushes sampled stacks to the context
+        """
+        self.context.set(self.key, dict(self.stacks))
+
+    def report(self):
+        """
+        Aggregates stacks sampled by all processes
+
+        :return: stacks in collapsed format, one per line
+        :rtype: str
+
+        """
+        total = Counter()
+        for stacks in self.context.get('profiler.stacks', {}).values():
+            if isinstance(stacks, dict):
+                total.update(stacks)
+
+        return u''.join(u'{} {}\n'.format(stack, count)
+                        for stack, count in sorted(total.items()))
+
+
+profiler = Profiler()
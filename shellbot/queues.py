@@ -0,0 +1,629 @@
+# -*- coding: utf-8 -*-
+
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from multiprocessing import Lock, Queue, Value
+import os
+import pickle
+from six.moves.queue import Empty, Full
+import struct
+import tempfile
+import time
+import zlib
+
+from .logger import Logger
+
+
+logger = Logger(__name__)
+
+
+class BoundedQueue(object):
+    """
+    Queues items between processes, up to some capacity
+
+    This is a drop-in replacement of ``multiprocessing.Queue``, with a
+    policy applied when the queue is full:
+
+    * ``block`` - the producer waits until some room is available. This is
+      the default policy, and it slows down producers to the pace of the
+      consumer.
+
+    * ``drop_newest`` - the new item is thrown away
+
+    * ``drop_oldest`` - the oldest item is thrown away, to make room for
+      the new one
+
+    * ``spill`` - items are written to a file, and read back when
+      the queue has been emptied. Order is preserved.
+
+    Poison pills, i.e., ``None`` items, are never dropped. With the
+    ``spill`` policy, they are spilled after items already on disk, so
+    that the consumer does not stop before it has read them.
+
+    Example::
+
+        queue = BoundedQueue(name='ears', maxsize=1000, policy='drop_oldest')
+        ...
+        print(queue.stats())
+
+    """
+
+    POLICIES = ('block', 'drop_newest', 'drop_oldest', 'spill')
+
+    def __init__(self, name='queue', maxsize=1000, policy='block', path=None):
+        """
+        Queues items between processes, up to some capacity
+
+        :param name: a label for this queue, e.g., ``ears``
+        :type name: str
+
+        :param maxsize: the maximum number of items kept in memory
+        :type maxsize: positive int
+
+        :param policy: what to do when the queue is full
+        :type policy: str
+
+        :param path: the file used to spill items (optional)
+        :type path: str
+
+        """
+        assert maxsize > 0
+        assert policy in self.POLICIES
+
+        self.name = name
+        self.maxsize = maxsize
+        self.policy = policy
+        self.queue = Queue(maxsize)
+        self.lock = Lock()
+
+        self.dropped = Value('i', 0)  # items thrown away
+        self.spilled = Value('i', 0)  # items written to disk
+        self.waiting = Value('i', 0)  # items on disk, not read yet
+        self.offset = Value('l', 0)  # position of next item on disk
+
+        self.path = path
+        if policy == 'spill' and not path:
+            (handle, self.path) = tempfile.mkstemp(
+                prefix=u'shellbot-{}-'.format(name),
+                suffix='.spill')
+            os.close(handle)
+
+    def put(self, item, block=True, timeout=None):
+        """
+        Adds an item to the queue
+
+        :param item: the item to be added
+        :type item: any serializable object
+
+        :param block: wait for room, with the ``block`` policy
+        :type block: bool
+
+        :param timeout: maximum time to wait, in seconds
+        :type timeout: float
+
+        This function raises ``Full`` if the item could not be added, with
+        the ``block`` policy. With other policies, it does not block.
+        """
+        if self.policy == 'block' or (item is None
+                                      and self.policy != 'spill'):
+            self.queue.put(item, block, timeout)
+
+        elif self.policy == 'drop_newest':
+            try:
+                self.queue.put_nowait(item)
+            except Full:
+                self.drop(item)
+
+        elif self.policy == 'drop_oldest':
+            with self.lock:
+                pills = 0  # poison pills met, and put back
+                while True:
+                    try:
+                        self.queue.put_nowait(item)
+                        break
+                    except Full:
+                        pass
+
+                    try:
+                        oldest = self.queue.get_nowait()
+                    except Empty:
+                        continue
+
+                    if oldest is not None:
+                        self.drop(oldest)
+                        continue
+
+                    self.queue.put(None)  # keep it, at the end
+                    pills += 1
+                    if pills >= self.maxsize:  # only pills are left
+                        self.drop(item)
+                        break
+
+        else:
+            with self.lock:
+                if self.waiting.value < 1:  # else keep order
+                    try:
+                        self.queue.put_nowait(item)
+                        return
+                    except Full:
+                        pass
+
+                self.spill(item)
+
+    def put_nowait(self, item):
+        self.put(item, block=False)
+
+    def get(self, block=True, timeout=None):
+        """
+        Takes the oldest item of the queue
+
+        :param block: wait for some item
+        :type block: bool
+
+        :param timeout: maximum time to wait, in seconds
+        :type timeout: float
+
+        :return: an item
+
+        This function raises ``Empty`` if no item is available.
+        """
+        if self.waiting.value > 0:
+            try:
+                return self.queue.get_nowait()
+            except Empty:
+                with self.lock:
+                    if self.waiting.value > 0:
+                        return self.unspill()
+
+        return self.queue.get(block, timeout)
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def empty(self):
+        return self.waiting.value < 1 and self.queue.empty()
+
+    def full(self):
+        return self.queue.full()
+
+    def qsize(self):
+        return self.queue.qsize() + self.waiting.value
+
+    @property
+    def is_saturated(self):
+        """
+        Checks if new items would be refused or delayed
+
+        :rtype: bool
+
+        This is True when the queue is full, except with the ``spill``
+        policy.
+        """
+        return self.policy != 'spill' and self.queue.full()
+
+    def stats(self):
+        """
+        Reports on the activity of this queue
+
+        :return: ``capacity``, ``dropped`` and ``spilled`` items
+        :rtype: dict
+        """
+        return {'capacity': self.maxsize,
+                'dropped': self.dropped.value,
+                'spilled': self.spilled.value}
+
+    def drop(self, item):
+        """
+        Throws an item away
+
+        :param item: the item that has been removed from the queue
+
+        """
+        with self.dropped.get_lock():
+            self.dropped.value += 1
+            if self.dropped.value == 1 or self.dropped.value % 1000 == 0:
+                logger.warning(u"Queue {} is full, {} items dropped",
+                               self.name, self.dropped.value)
+
+    def spill(self, item):
+        """
+        Writes an item to disk
+
+        :param item: the item that could not be put in the queue
+
+        This function should be called with the lock acquired.
+        """
+        data = pickle.dumps(item, protocol=2)
+        with open(self.path, 'ab') as handle:
+            handle.write(struct.pack('>I', len(data)))
+            handle.write(data)
+
+        self.waiting.value += 1
+        if item is not None:  # do not count poison pills
+            with self.spilled.get_lock():
+                self.spilled.value += 1
+
+    def unspill(self):
+        """
+        Reads the oldest item written to disk
+
+        :return: the item
+
+        This function should be called with the lock acquired. When the
+        last item has been read, the file is reset.
+        """
+        with open(self.path, 'rb') as handle:
+            handle.seek(self.offset.value)
+            (length,) = struct.unpack('>I', handle.read(4))
+            item = pickle.loads(handle.read(length))
+
+        self.offset.value += 4 + length
+        self.waiting.value -= 1
+        if self.waiting.value < 1:
+            open(self.path, 'wb').close()
+            self.offset.value = 0
+
+        return item
+
+
+class DurableQueue(object):
+    """
+    Queues items between processes, and keeps them on disk until processed
+
+    Each item is appended to a log file before being queued in memory. The
+    consumer acknowledges items once they have been processed, and items
+    that have not been acknowledged are queued again when the queue is
+    created. In other terms, events received by the bot survive a crash or
+    a restart of the engine.
+
+    The log is a directory of segment files, named after the sequence
+    number of their first item, e.g., ``00000000000000000042.log``. Each
+    record is made of a header, with sequence number, length and checksum,
+    followed by the pickled item. A new segment is started when the active
+    one is large enough, and segments are deleted once all of their items
+    have been acknowledged. The highest sequence number acknowledged is
+    kept in a file named ``acked``.
+
+    Files are synchronized to disk by batch, every ``sync_count`` writes or
+    every ``sync_delay`` seconds, so that throughput stays high. Items are
+    flushed to the operating system on each write, so that only a power
+    failure can lose a partial batch. Items may be delivered more than
+    once after a crash, but never lost.
+
+    There can be multiple producers, but a single consumer, which calls
+    ``ack()`` after each item taken from the queue.
+
+    Example::
+
+        queue = DurableQueue(path='/var/lib/shellbot/ears')
+        ...
+        item = queue.get()
+        process(item)
+        queue.ack()
+
+    """
+
+    SEGMENT = 4 * 1024 * 1024  # start a new file beyond this size
+
+    SYNC_COUNT = 100  # fsync after this number of writes
+
+    SYNC_DELAY = 0.2  # or after this number of seconds
+
+    HEADER = struct.Struct('>qII')  # sequence, length, crc32
+
+    def __init__(self, path, name='ears', sync_count=None, sync_delay=None):
+        """
+        Queues items between processes, and keeps them on disk
+
+        :param path: the directory used for log files
+        :type path: str
+
+        :param name: a label for this queue, e.g., ``ears``
+        :type name: str
+
+        :param sync_count: writes between two synchronizations to disk
+        :type sync_count: positive int
+
+        :param sync_delay: seconds between two synchronizations to disk
+        :type sync_delay: float
+
+        Items that have been logged but not acknowledged are queued again
+        on creation.
+        """
+        self.path = path
+        self.name = name
+        self.sync_count = sync_count if sync_count else self.SYNC_COUNT
+        self.sync_delay = sync_delay if sync_delay else self.SYNC_DELAY
+
+        self.queue = Queue()
+        self.lock = Lock()
+        self.sequence = Value('l', 0)  # number of next item
+        self.segment = Value('l', 0)  # number of first item of active file
+        self.acked = Value('l', -1)  # all items up to this one are done
+
+        self._pid = None
+        self._log = None  # active segment, for this process
+        self._mark = None  # file of acknowledgements, for this process
+        self._segment = None
+        self._current = None  # the last item got by the consumer
+        self._acks = set()  # items acknowledged beyond the watermark
+        self._unsynced = {}  # file -> (writes, stamp of first one)
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        self.replayed = self.replay()
+
+    def replay(self):
+        """
+        Queues items that have not been acknowledged
+
+        :return: the number of items queued again
+        :rtype: int
+
+        This function is called on creation of the queue. It also starts a
+        new segment, after the last valid record found on disk.
+        """
+        acked = self.read_mark()
+        last = acked
+        count = 0
+        for start in self.list_segments():
+            for sequence, item in self.read_segment(start):
+                last = max(last, sequence)
+                if sequence > acked:
+                    self.queue.put((sequence, item))
+                    count += 1
+
+        self.acked.value = acked
+        self.sequence.value = last + 1
+        self.segment.value = last + 1
+
+        if count:
+            logger.warning(u"Replaying {} items of queue {}",
+                           count, self.name)
+        return count
+
+    def list_segments(self):
+        """
+        Lists segment files
+
+        :return: sequence numbers of first items, in ascending order
+        :rtype: list of int
+        """
+        starts = []
+        for name in os.listdir(self.path):
+            (start, extension) = os.path.splitext(name)
+            if extension == '.log' and start.isdigit():
+                starts.append(int(start))
+
+        return sorted(starts)
+
+    def get_segment_path(self, start):
+        return os.path.join(self.path, u'{:020d}.log'.format(start))
+
+    def read_segment(self, start):
+        """
+        Reads records of one segment
+
+        :param start: the sequence number of the first item
+        :type start: int
+
+        :return: an iterator of (sequence, item) tuples
+
+        Reading stops at the first incomplete or corrupted record, which
+        is the trace of a write interrupted by a crash.
+        """
+        with open(self.get_segment_path(start), 'rb') as handle:
+            while True:
+                header = handle.read(self.HEADER.size)
+                if len(header) < self.HEADER.size:
+                    return
+
+                (sequence, length, checksum) = self.HEADER.unpack(header)
+                data = handle.read(length)
+                if (len(data) < length
+                        or zlib.crc32(data) & 0xffffffff != checksum):
+                    logger.warning(u"Skipping damaged record {} of queue {}",
+                                   sequence, self.name)
+                    return
+
+                yield (sequence, pickle.loads(data))
+
+    def read_mark(self):
+        """
+        Reads the highest sequence number acknowledged
+
+        :return: the sequence number, or -1
+        :rtype: int
+        """
+        try:
+            with open(os.path.join(self.path, 'acked'), 'rb') as handle:
+                (acked,) = struct.unpack('>q', handle.read(8))
+                return acked
+        except (IOError, OSError, struct.error):
+            return -1
+
+    def get_log(self):
+        """
+        Gets a handle on the active segment
+
+        This function should be called with the lock acquired. Each process
+        has its own handle, which follows segments started by other
+        processes.
+        """
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._log = self._mark = None
+            self._unsynced = {}
+
+        if self._log is None or self._segment != self.segment.value:
+            if self._log is not None:
+                self._log.close()
+            self._segment = self.segment.value
+            self._log = open(self.get_segment_path(self._segment), 'ab')
+
+        return self._log
+
+    def put(self, item, block=True, timeout=None):
+        """
+        Logs an item and adds it to the queue
+
+        :param item: the item to be added
+        :type item: any serializable object
+
+        Poison pills, i.e., ``None`` items, are queued but not logged.
+        """
+        if item is None:
+            self.queue.put((None, None))
+            return
+
+        data = pickle.dumps(item, protocol=2)
+        checksum = zlib.crc32(data) & 0xffffffff
+
+        with self.lock:
+            handle = self.get_log()
+            if os.fstat(handle.fileno()).st_size >= self.SEGMENT:
+                self.sync(handle, force=True)
+                self.segment.value = self.sequence.value
+                handle = self.get_log()
+
+            sequence = self.sequence.value
+            handle.write(self.HEADER.pack(sequence, len(data), checksum))
+            handle.write(data)
+            handle.flush()
+            self.sequence.value += 1  # only once the write has succeeded
+
+            self.queue.put((sequence, item))
+            self.sync(handle)
+
+    def put_nowait(self, item):
+        self.put(item, block=False)
+
+    def get(self, block=True, timeout=None):
+        """
+        Takes the oldest item of the queue
+
+        :return: an item
+
+        The item should be acknowledged with ``ack()`` once processed.
+        This function raises ``Empty`` if no item is available.
+        """
+        (sequence, item) = self.queue.get(block, timeout)
+        self._current = sequence
+        return item
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def empty(self):
+        return self.queue.empty()
+
+    def full(self):
+        return False
+
+    def qsize(self):
+        return self.queue.qsize()
+
+    def ack(self):
+        """
+        Acknowledges the last item taken from the queue
+
+        The watermark moves forward when all previous items have been
+        acknowledged as well, and segments below the watermark are deleted
+        on next synchronization to disk.
+        """
+        if self._current is None:
+            return
+
+        self._acks.add(self._current)
+        self._current = None
+
+        acked = self.acked.value
+        while acked + 1 in self._acks:
+            acked += 1
+            self._acks.remove(acked)
+
+        if acked == self.acked.value:
+            return
+
+        self.acked.value = acked
+
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._log = self._mark = None
+            self._unsynced = {}
+
+        if self._mark is None:
+            path = os.path.join(self.path, 'acked')
+            self._mark = open(path, 'r+b' if os.path.exists(path) else 'wb')
+
+        self._mark.seek(0)
+        self._mark.write(struct.pack('>q', acked))
+        self._mark.flush()
+        if self.sync(self._mark):
+            self.compact()
+
+    def sync(self, handle, force=False):
+        """
+        Synchronizes one file to disk, by batch
+
+        :param handle: the file that has been written
+        :type handle: file
+
+        :param force: synchronize now
+        :type force: bool
+
+        :return: True if the file has been synchronized, else False
+        :rtype: bool
+        """
+        (count, stamp) = self._unsynced.get(handle.name, (0, time.time()))
+        count += 1
+
+        if (force
+                or count >= self.sync_count
+                or time.time() - stamp >= self.sync_delay):
+            os.fsync(handle.fileno())
+            self._unsynced.pop(handle.name, None)
+            return True
+
+        self._unsynced[handle.name] = (count, stamp)
+        return False
+
+    def flush(self):
+        """
+        Synchronizes to disk all files written by this process
+        """
+        for handle in (self._log, self._mark):
+            if handle is not None and handle.name in self._unsynced:
+                self.sync(handle, force=True)
+
+    def compact(self):
+        """
+        Deletes segments where all items have been acknowledged
+
+        :return: the number of deleted segments
+        :rtype: int
+        """
+        starts = self.list_segments()
+        count = 0
+        for start, following in zip(starts, starts[1:]):
+            if following - 1 > self.acked.value:
+                break
+
+            os.remove(self.get_segment_path(start))
+            count += 1
+
+        return count
@@ -14,13 +14,19 @@
 # limitations under the License.
 
 from .base import Route
+from .deadletters import DeadLetters
+from .metrics import Metrics
 from .notifier import Notifier
+from .profile import Profile
 from .text import Text
 from .wrapper import Wrapper
 
 __all__ = [
     'Route',
+    'DeadLetters',
+    'Metrics',
     'Notifier',
+    'Profile',
     'Text',
     'Wrapper',
 ]
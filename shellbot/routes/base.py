@@ -15,10 +15,17 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from bottle import request, response
+import hmac
+
 
 class Route(object):
     """
     Implements one route
+
+    If ``token`` is set, requests have to provide it in the header
+    ``Authorization: Bearer <token>``, and sub-classes check this with
+    ``is_authorized()``.
     """
 
     def __init__(self, context=None, **kwargs):
@@ -28,6 +35,28 @@ class Route(object):
 
     route = None      # e.g., '/wiki/<pagename>'
 
+    token = None      # required in requests, if set
+
+    def is_authorized(self):
+        """
+        Checks the token provided in the request, if any is required
+
+        :return: True if the request can be processed, else False
+        :rtype: bool
+
+        On failure, status 401 is set in the response.
+        """
+        if not self.token:
+            return True
+
+        expected = u'Bearer {}'.format(self.token).encode('utf-8')
+        provided = request.get_header('Authorization', '').encode('utf-8')
+        if hmac.compare_digest(provided, expected):
+            return True
+
+        response.status = 401
+        return False
+
     def get(self, **kwargs):     # e.g., pagename='entry_12'
         raise NotImplementedError()
 
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from bottle import request, response
+import json
+
+from shellbot.logger import Logger
+from .base import Route
+
+
+logger = Logger(__name__)
+
+
+class DeadLetters(Route):
+    """
+    Inspects and replays dead letters on web request
+
+    >>>route = DeadLetters(context, engine=engine)
+    >>>server.add_route(route)
+
+    A GET request lists items whose processing has failed, with errors,
+    in JSON. A PUT request submits them again to the engine, either all of
+    them, or only one if an ``id`` is provided. A DELETE request forgets
+    them::
+
+        $ curl http://localhost:8080/deadletters
+        $ curl -X PUT http://localhost:8080/deadletters?id=3
+        $ curl -X DELETE http://localhost:8080/deadletters
+
+    Since items can be replayed or forgotten, requests have to provide
+    the token set in ``server.admin_token``::
+
+        $ curl -H "Authorization: Bearer $TOKEN" http://localhost:8080/deadletters
+
+    The route is added by the engine when ``server.deadletters`` and
+    ``server.admin_token`` are set::
+
+        engine.configure({'server': {'deadletters': '/deadletters',
+                                     'admin_token': os.environ['TOKEN']}})
+
+    """
+
+    route = '/deadletters'
+
+    engine = None
+
+    def get(self, **kwargs):
+        logger.debug(u"GET {}", self.route)
+        if not self.is_authorized():
+            return 'Unauthorized'
+
+        response.content_type = 'application/json; charset=utf-8'
+        return json.dumps(self.engine.deadletters.list(),
+                          default=lambda x: u'{}'.format(x))
+
+    def put(self):
+        logger.debug(u"PUT {}", self.route)
+        if not self.is_authorized():
+            return 'Unauthorized'
+
+        response.content_type = 'application/json; charset=utf-8'
+        count = self.engine.deadletters.replay(id=request.query.get('id'))
+        return json.dumps({'replayed': count})
+
+    def delete(self):
+        logger.debug(u"DELETE {}", self.route)
+        if not self.is_authorized():
+            return 'Unauthorized'
+
+        response.content_type = 'application/json; charset=utf-8'
+        count = self.engine.deadletters.clear()
+        return json.dumps({'cleared': count})
@@ -0,0 +1,402 @@
+# -*- coding: utf-8 -*-
+
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from bottle import response
+import logging
+
+from .base import Route
+
+
+class Metrics(Route):
+    """
+    Exposes metrics of the engine on web request
+
+    >>>route = Metrics(context, engine=engine)
+    >>>server.add_route(route)
+
+    When the route is requested over the web, a page is returned in the
+    text format of Prometheus, with following metrics:
+
+    * ``shellbot_queue_depth`` -- items waiting in ``ears``, ``mouth``
+      and ``fan`` queues, and in ``mouth.interactive`` and ``mouth.bulk``
+      for updates of other priorities
+
+    * ``shellbot_queue_capacity`` -- maximum items in memory, for
+      queues that are bounded
+
+    * ``shellbot_queue_dropped_total`` -- items thrown away on overflow
+
+    * ``shellbot_queue_spilled_total`` -- items written to disk on overflow
+
+    * ``shellbot_events_total`` -- items processed by each component,
+      e.g., ``listener`` or ``speaker``
+
+    * ``shellbot_webhook_refused_total`` -- notifications refused with
+      status 503, because the ``ears`` queue was saturated
+
+    * ``shellbot_shards_forwarded_total`` -- notifications forwarded to
+      other engines, when sharding is enabled
+
+    * ``shellbot_shards_refused_total`` -- notifications refused with
+      status 503, because their engine was not listening to the bus
+
+    * ``shellbot_shards_lost_total`` -- forwarded notifications that have
+      been dropped by the bus before reaching this engine
+
+    * ``shellbot_bus_messages_total`` -- messages forwarded by the bus
+      broker, per topic, if the broker is ran by this engine
+
+    * ``shellbot_bus_bytes_total`` -- bytes forwarded, per topic
+
+    * ``shellbot_bus_subscribers`` -- subscribers connected to the
+      broker, per topic
+
+    * ``shellbot_bots`` -- bots that are currently loaded
+
+    * ``shellbot_machines`` -- state machines that are currently running
+
+    * ``shellbot_spark_api_calls_total`` -- requests to Cisco Spark API
+
+    * ``shellbot_spark_api_errors_total`` -- failed requests, per status
+
+    * ``shellbot_command_duration_seconds`` -- histogram of command
+      executions, per command
+
+    * ``shellbot_stage_duration_seconds`` -- histogram of processing
+      stages, per stage. This requires the ``metrics`` tracing sink::
+
+        engine.configure({'tracing': {'sink': 'metrics'}})
+
+    The route is added by the engine when ``server.metrics`` is set::
+
+        engine.configure({'server': {'metrics': '/metrics'}})
+
+    """
+
+    route = '/metrics'
+
+    engine = None
+
+    QUEUES = ('ears', 'mouth', 'mouth.interactive', 'mouth.bulk', 'fan')
+
+    COUNTERS = ('listener', 'speaker', 'observer', 'puller', 'fetcher',
+                'receiver')
+
+    def get(self, **kwargs):
+        logging.debug(u"GET {}".format(self.route))
+        response.content_type = 'text/plain; version=0.0.4; charset=utf-8'
+        return self.render()
+
+    def render(self):
+        """
+        Renders metrics in the Prometheus text format
+
+        :rtype: str
+        """
+        lines = []
+
+        self.add_metric(
+            lines,
+            name='shellbot_queue_depth',
+            kind='gauge',
+            help=u'Items waiting in a queue',
+            samples=[({'queue': x}, self.get_depth(x)) for x in self.QUEUES])
+
+        stats = [(x, self.get_stats(x)) for x in self.QUEUES]
+        stats = [(x, y) for x, y in stats if y]
+
+        self.add_metric(
+            lines,
+            name='shellbot_queue_capacity',
+            kind='gauge',
+            help=u'Maximum items kept in memory by a queue',
+            samples=[({'queue': x}, y['capacity']) for x, y in stats])
+
+        self.add_metric(
+            lines,
+            name='shellbot_queue_dropped_total',
+            kind='counter',
+            help=u'Items thrown away because a queue was full',
+            samples=[({'queue': x}, y['dropped']) for x, y in stats])
+
+        self.add_metric(
+            lines,
+            name='shellbot_queue_spilled_total',
+            kind='counter',
+            help=u'Items written to disk because a queue was full',
+            samples=[({'queue': x}, y['spilled']) for x, y in stats])
+
+        self.add_metric(
+            lines,
+            name='shellbot_events_total',
+            kind='counter',
+            help=u'Items processed by a component',
+            samples=[({'component': x},
+                      self.context.get(x + '.counter', 0))
+                     for x in self.COUNTERS])
+
+        self.add_metric(
+            lines,
+            name='shellbot_webhook_duplicates_total',
+            kind='counter',
+            help=u'Notifications received more than once',
+            samples=[({}, self.context.get('webhook.duplicates', 0))])
+
+        self.add_metric(
+            lines,
+            name='shellbot_webhook_refused_total',
+            kind='counter',
+            help=u'Notifications refused because of saturation',
+            samples=[({}, self.context.get('webhook.refused', 0))])
+
+        self.add_metric(
+            lines,
+            name='shellbot_shards_forwarded_total',
+            kind='counter',
+            help=u'Notifications forwarded to other engines',
+            samples=[({}, self.context.get('shards.forwarded', 0))])
+
+        self.add_metric(
+            lines,
+            name='shellbot_shards_refused_total',
+            kind='counter',
+            help=u'Notifications refused for engines not listening',
+            samples=[({}, self.context.get('shards.refused', 0))])
+
+        self.add_metric(
+            lines,
+            name='shellbot_shards_lost_total',
+            kind='counter',
+            help=u'Forwarded notifications dropped by the bus',
+            samples=[({}, self.context.get('shards.lost', 0))])
+
+        topics = self.context.get('broker.topics', {})
+        self.add_metric(
+            lines,
+            name='shellbot_bus_messages_total',
+            kind='counter',
+            help=u'Messages forwarded by the bus broker',
+            samples=[({'topic': x}, topics[x]['messages'])
+                     for x in sorted(topics)])
+
+        self.add_metric(
+            lines,
+            name='shellbot_bus_bytes_total',
+            kind='counter',
+            help=u'Bytes forwarded by the bus broker',
+            samples=[({'topic': x}, topics[x]['bytes'])
+                     for x in sorted(topics)])
+
+        self.add_metric(
+            lines,
+            name='shellbot_bus_subscribers',
+            kind='gauge',
+            help=u'Subscribers connected to the bus broker',
+            samples=[({'topic': x}, topics[x]['subscribers'])
+                     for x in sorted(topics)])
+
+        self.add_metric(
+            lines,
+            name='shellbot_bots',
+            kind='gauge',
+            help=u'Bots currently loaded',
+            samples=[({}, len(self.context.get('bots.ids', [])))])
+
+        self.add_metric(
+            lines,
+            name='shellbot_machines',
+            kind='gauge',
+            help=u'State machines currently running',
+            samples=[({}, self.context.get('metrics.machines', 0))])
+
+        self.add_metric(
+            lines,
+            name='shellbot_spark_api_calls_total',
+            kind='counter',
+            help=u'Requests to Cisco Spark API',
+            samples=[({}, self.context.get('metrics.spark.calls', 0))])
+
+        errors = self.context.get('metrics.spark.errors', {})
+        self.add_metric(
+            lines,
+            name='shellbot_spark_api_errors_total',
+            kind='counter',
+            help=u'Failed requests to Cisco Spark API',
+            samples=[({'status': x}, errors[x]) for x in sorted(errors)])
+
+        self.add_histograms(
+            lines,
+            name='shellbot_command_duration_seconds',
+            help=u'Execution time of commands',
+            label='command',
+            histograms=self.context.get('metrics.command', {}))
+
+        self.add_histograms(
+            lines,
+            name='shellbot_stage_duration_seconds',
+            help=u'Processing time of inbound events, stage by stage',
+            label='stage',
+            histograms=self.context.get('metrics.stage', {}))
+
+        return u'\n'.join(lines) + u'\n'
+
+    def get_queue(self, name):
+        """
+        Finds one queue of the engine
+
+        :param name: either ``ears``, ``mouth`` or ``fan``, or
+            ``mouth.<priority>``
+        :type name: str
+
+        :return: the queue, or None
+
+        """
+        if name.startswith('mouth.'):
+            mouths = getattr(self.engine, 'mouths', None) or {}
+            return mouths.get(name[len('mouth.'):])
+
+        return getattr(self.engine, name, None)
+
+    def get_depth(self, name):
+        """
+        Counts items waiting in one queue of the engine
+
+        :param name: either ``ears``, ``mouth`` or ``fan``, or
+            ``mouth.<priority>``
+        :type name: str
+
+        :return: the approximate size of the queue, or 0
+        :rtype: int
+
+        """
+        queue = self.get_queue(name)
+        if queue is None:
+            return 0
+
+        try:
+            return queue.qsize()
+        except NotImplementedError:  # not available on macOS
+            return 0
+
+    def get_stats(self, name):
+        """
+        Reports on overflows of one queue of the engine
+
+        :param name: either ``ears``, ``mouth`` or ``fan``, or
+            ``mouth.<priority>``
+        :type name: str
+
+        :return: ``capacity``, ``dropped`` and ``spilled`` items, or None
+            if the queue is not bounded
+        :rtype: dict
+
+        """
+        queue = self.get_queue(name)
+        if not hasattr(queue, 'stats'):
+            return None
+
+        return queue.stats()
+
+    def add_metric(self, lines, name, kind, help, samples):
+        """
+        Renders one metric
+
+        :param lines: the text being rendered
+        :type lines: list of str
+
+        :param name: the name of the metric
+        :type name: str
+
+        :param kind: either ``counter`` or ``gauge``
+        :type kind: str
+
+        :param help: a description of the metric
+        :type help: str
+
+        :param samples: a list of (labels, value) tuples
+        :type samples: list
+
+        """
+        lines.append(u'# HELP {} {}'.format(name, help))
+        lines.append(u'# TYPE {} {}'.format(name, kind))
+        for labels, value in samples:
+            lines.append(u'{}{} {}'.format(name, self.format_labels(labels),
+                                           value))
+
+    def add_histograms(self, lines, name, help, label, histograms):
+        """
+        Renders a family of histograms
+
+        :param lines: the text being rendered
+        :type lines: list of str
+
+        :param name: the name of the metric
+        :type name: str
+
+        :param help: a description of the metric
+        :type help: str
+
+        :param label: the label that distinguishes histograms
+        :type label: str
+
+        :param histograms: histograms recorded in the context
+        :type histograms: dict
+
+        """
+        lines.append(u'# HELP {} {}'.format(name, help))
+        lines.append(u'# TYPE {} histogram'.format(name))
+        for key in sorted(histograms):
+            histogram = histograms[key]
+            if not isinstance(histogram, dict):
+                continue
+
+            for bound, count in zip(histogram['bounds'],
+                                    histogram['buckets']):
+                labels = self.format_labels({label: key, 'le': bound})
+                lines.append(u'{}_bucket{} {}'.format(name, labels, count))
+
+            labels = self.format_labels({label: key, 'le': '+Inf'})
+            lines.append(u'{}_bucket{} {}'.format(name, labels,
+                                                  histogram['count']))
+
+            labels = self.format_labels({label: key})
+            lines.append(u'{}_sum{} {}'.format(name, labels,
+                                               histogram['sum']))
+            lines.append(u'{}_count{} {}'.format(name, labels,
+                                                 histogram['count']))
+
+    def format_labels(self, labels):
+        """
+        Renders labels of one sample
+
+        :param labels: names and values of labels
+        :type labels: dict
+
+        :return: e.g., ``{queue="ears"}``, or an empty string
+        :rtype: str
+
+        """
+        if not labels:
+            return u''
+
+        items = []
+        for key in sorted(labels, key=lambda x: (x == 'le', x)):
+            value = u'{}'.format(labels[key])
+            value = value.replace('\\', '\\\\').replace('"', '\\"')
+            items.append(u'{}="{}"'.format(key, value))
+
+        return u'{' + u','.join(items) + u'}'
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from bottle import response
+
+from shellbot.logger import Logger
+from shellbot.profiler import Profiler
+from .base import Route
+
+
+logger = Logger(__name__)
+
+
+class Profile(Route):
+    """
+    Controls the sampling profiler on web request
+
+    >>>server.add_route(Profile(context))
+
+    A PUT request switches the profiler on, in all processes of the engine,
+    and a DELETE request switches it off. A GET request returns stacks
+    sampled so far, in collapsed format, ready for a flame graph::
+
+        $ curl -X PUT http://localhost:8080/profile
+        $ sleep 30
+        $ curl -X DELETE http://localhost:8080/profile
+        $ curl http://localhost:8080/profile > shellbot.folded
+        $ flamegraph.pl shellbot.folded > shellbot.svg
+
+    Since profiling slows down the engine, requests have to provide the
+    token set in ``server.admin_token``, e.g., with
+    ``curl -H "Authorization: Bearer $TOKEN"``.
+
+    The route is added by the engine when ``server.profile`` and
+    ``server.admin_token`` are set::
+
+        engine.configure({'server': {'profile': '/profile',
+                                     'admin_token': os.environ['TOKEN']}})
+
+    """
+
+    route = '/profile'
+
+    def get(self, **kwargs):
+        logger.debug(u"GET {}", self.route)
+        if not self.is_authorized():
+            return 'Unauthorized'
+
+        response.content_type = 'text/plain; charset=utf-8'
+        return Profiler(self.context).report()
+
+    def put(self):
+        logger.debug(u"PUT {}", self.route)
+        if not self.is_authorized():
+            return 'Unauthorized'
+
+        self.context.set('profiler.switch', 'on')
+        return 'OK'
+
+    def delete(self):
+        logger.debug(u"DELETE {}", self.route)
+        if not self.is_authorized():
+            return 'Unauthorized'
+
+        self.context.set('profiler.switch', 'off')
+        return 'OK'
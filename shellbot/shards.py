@@ -0,0 +1,491 @@
+# -*- coding: utf-8 -*-
+
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from bisect import bisect
+from bottle import request, response
+import hashlib
+from multiprocessing import Process
+from six import string_types
+import time
+
+from .logger import Logger
+
+
+logger = Logger(__name__)
+
+
+class HashRing(object):
+    """
+    Spreads keys over nodes with consistent hashing
+
+    Each node is put at multiple points of a ring, and a key belongs to the
+    first node found after the hash of the key. When a node is added or
+    removed, only keys of this node move to other nodes.
+
+    Example::
+
+        ring = HashRing(['node1', 'node2', 'node3'])
+        node = ring.get_node(channel_id)
+
+    """
+
+    REPLICAS = 64  # points of each node on the ring
+
+    def __init__(self, nodes=(), replicas=None):
+        """
+        Spreads keys over nodes with consistent hashing
+
+        :param nodes: names of nodes
+        :type nodes: list of str
+
+        :param replicas: points of each node on the ring
+        :type replicas: positive int
+
+        """
+        self.replicas = replicas if replicas else self.REPLICAS
+        self.points = []  # sorted hashes
+        self.owners = {}  # hash -> node
+        for node in nodes:
+            self.add(node)
+
+    @property
+    def nodes(self):
+        """
+        Lists nodes of the ring
+
+        :rtype: list of str
+        """
+        return sorted(set(self.owners.values()))
+
+    def hash(self, key):
+        """
+        Computes the position of a key on the ring
+
+        :param key: the key to hash
+        :type key: str
+
+        :rtype: int
+        """
+        return int(hashlib.md5(key.encode('utf-8')).hexdigest()[:16], 16)
+
+    def add(self, node):
+        """
+        Adds a node to the ring
+
+        :param node: the name of the node
+        :type node: str
+
+        """
+        for index in range(self.replicas):
+            point = self.hash(u'{}#{}'.format(node, index))
+            if point not in self.owners:
+                self.points.insert(bisect(self.points, point), point)
+            self.owners[point] = node
+
+    def remove(self, node):
+        """
+        Removes a node from the ring
+
+        :param node: the name of the node
+        :type node: str
+
+        """
+        for index in range(self.replicas):
+            point = self.hash(u'{}#{}'.format(node, index))
+            if self.owners.get(point) == node:
+                del self.owners[point]
+                self.points.remove(point)
+
+    def get_node(self, key):
+        """
+        Finds the node that owns a key
+
+        :param key: the key, e.g., a channel id
+        :type key: str
+
+        :return: the name of the node, or None if the ring is empty
+        :rtype: str
+        """
+        if not self.points:
+            return None
+
+        index = bisect(self.points, self.hash(key)) % len(self.points)
+        return self.owners[self.points[index]]
+
+
+class Shards(object):
+    """
+    Routes inbound events to the engine that owns their channel
+
+    Multiple engines can share the load of a single bot, each of them
+    handling a shard of channels. Notifications received by the web
+    front end are either processed locally, or forwarded over the bus to
+    the engine that owns the channel. Channels are assigned to engines
+    with consistent hashing, so that few channels move when an engine
+    joins or leaves.
+
+    Sharding is activated in the context of each engine:
+
+    * ``shards.node`` - the name of this engine, e.g., ``node1``
+
+    * ``shards.nodes`` - the names of all engines, including this one
+
+    Since engines run on different computers, the bus is bound by the
+    front end, and other engines connect to it::
+
+        # on the front end
+        engine.configure({
+            'bus': {'address': 'tcp://10.0.0.1:5555', 'bind': 'tcp://*:5555'},
+            'shards': {'node': 'node1', 'nodes': ['node1', 'node2']},
+            })
+
+        # on another computer
+        engine.configure({
+            'bus': {'address': 'tcp://10.0.0.1:5555',
+                    'bind': 'tcp://127.0.0.1:5555'},
+            'shards': {'node': 'node2', 'nodes': ['node1', 'node2']},
+            })
+
+    When the front end runs the broker of the bus, with ``bus.serve``, the
+    nodes that share the load are the ones that have subscribed to their
+    bus channel. A node joins when its shard receiver starts, and leaves
+    when it stops, or when its connection is lost, so that its channels
+    move to surviving nodes without any manual step. Else, nodes are listed
+    in ``shards.nodes``, and can be changed with ``join()`` or ``leave()``.
+
+    Channels are re-assigned on next notification after a change of
+    nodes. Bots are loaded again by their new engine, and any state kept
+    in memory by the previous one is lost.
+
+    Forwarding over the bus is best effort. A notification is acknowledged
+    to Cisco Spark once it has been published, and it is lost if the owner
+    is down, or too slow to keep up. When the front end runs the broker of
+    the bus, with ``bus.serve``, it knows which engines are listening, and
+    notifications for an engine that is not subscribed are refused with
+    status 503, so that Cisco Spark delivers them again later on. This can
+    happen until the departure of a node is reported by the broker. Losses
+    that cannot be prevented are detected by the receiving engine, and
+    counted in ``shards.lost``.
+    """
+
+    CHANNEL = u'shard/{}/'  # bus channel of each node
+
+    def __init__(self, engine):
+        """
+        Routes inbound events to the engine that owns their channel
+
+        :param engine: the local engine
+        :type engine: Engine
+
+        """
+        self.engine = engine
+        self.ring = None
+        self._nodes = None
+
+    @property
+    def is_enabled(self):
+        """
+        Checks if sharding has been configured
+
+        :rtype: bool
+        """
+        return bool(self.engine.get('shards.node')
+                    and self.engine.get('shards.nodes'))
+
+    @property
+    def node(self):
+        return self.engine.get('shards.node')
+
+    @classmethod
+    def get_channel(cls, node):
+        """
+        Provides the bus channel used to forward notifications to a node
+
+        :param node: the name of the node
+        :type node: str
+
+        :return: e.g., ``shard/node2/``
+        :rtype: str
+
+        The channel is terminated, so that subscribers of ``node1`` do not
+        receive notifications sent to ``node10``.
+        """
+        return cls.CHANNEL.format(node)
+
+    def get_configured_nodes(self):
+        """
+        Lists the nodes set in ``shards.nodes``
+
+        :rtype: list of str
+        """
+        nodes = self.engine.get('shards.nodes', [])
+        if isinstance(nodes, string_types):
+            nodes = [nodes]
+        return list(nodes)
+
+    def get_nodes(self):
+        """
+        Lists the nodes that share the load
+
+        :return: names of nodes
+        :rtype: tuple of str
+
+        If the broker of the bus runs along with this engine, live nodes are
+        those that have subscribed to their bus channel. If none has, this
+        engine handles every notification. Without broker, nodes are listed
+        in ``shards.nodes``.
+        """
+        topics = self.engine.get('broker.topics')
+        if topics is None:
+            return tuple(sorted(self.get_configured_nodes()))
+
+        head, tail = self.CHANNEL.split(u'{}')
+        nodes = []
+        for topic, stats in topics.items():
+            if not (topic.startswith(head) and topic.endswith(tail)):
+                continue
+
+            node = topic[len(head):len(topic)-len(tail)]
+            if node and u'/' not in node and stats.get('subscribers', 0) > 0:
+                nodes.append(node)
+
+        return tuple(sorted(nodes))
+
+    def get_ring(self):
+        """
+        Provides the ring of nodes
+
+        :rtype: HashRing
+
+        The ring is updated when the list of nodes has changed, see
+        ``get_nodes()``.
+        """
+        nodes = self.get_nodes()
+
+        if self.ring is None:
+            self.ring = HashRing(nodes)
+
+        elif nodes != self._nodes:
+            logger.info(u"Rebalancing shards over {}", u', '.join(nodes))
+            for node in set(self._nodes) - set(nodes):
+                self.ring.remove(node)
+            for node in set(nodes) - set(self._nodes):
+                self.ring.add(node)
+
+        self._nodes = nodes
+        return self.ring
+
+    def join(self, node):
+        """
+        Adds a node to the shards
+
+        :param node: the name of the node
+        :type node: str
+
+        This updates ``shards.nodes``, which is used only when the broker
+        does not run along with this engine.
+        """
+        nodes = set(self.get_configured_nodes())
+        nodes.add(node)
+        self.engine.set('shards.nodes', sorted(nodes))
+
+    def leave(self, node):
+        """
+        Removes a node from the shards
+
+        :param node: the name of the node
+        :type node: str
+
+        This updates ``shards.nodes``, which is used only when the broker
+        does not run along with this engine.
+        """
+        nodes = set(self.get_configured_nodes())
+        nodes.discard(node)
+        self.engine.set('shards.nodes', sorted(nodes))
+
+    def get_owner(self, item):
+        """
+        Finds the node that owns a notification
+
+        :param item: the notification received from Cisco Spark
+        :type item: dict
+
+        :return: the name of the node
+        :rtype: str
+        """
+        data = item.get('data', {})
+        key = data.get('roomId') or data.get('id') or u''
+        return self.get_ring().get_node(key)
+
+    def webhook(self, item=None):
+        """
+        Receives a notification, and routes it to its owner
+
+        :param item: if provided, do not invoke the ``request`` object
+        :type item: dict
+
+        This function is used as web hook by the engine when sharding is
+        enabled. It wraps the web hook of the space.
+        """
+        if not item:
+            item = request.json
+
+        owner = self.get_owner(item)
+        if owner in (None, self.node):
+            return self.engine.space.webhook(item)
+
+        channel = self.get_channel(owner)
+        if not self.is_listening(channel):
+            logger.warning(u"- {} is not listening, notification refused",
+                           owner)
+            self.engine.context.increment('shards.refused')
+            response.status = 503
+            return 'Service Unavailable'
+
+        logger.debug(u"- forwarding notification to {}", owner)
+        sequence = self.engine.context.increment(
+            u'shards.sequence.{}'.format(owner))
+        self.engine.publisher.put(channel, {'node': self.node,
+                                            'sequence': sequence,
+                                            'item': item})
+        self.engine.context.increment('shards.forwarded')
+        return 'OK'
+
+    def is_listening(self, channel):
+        """
+        Checks if some engine has subscribed to a channel
+
+        :param channel: the bus channel of a node
+        :type channel: str
+
+        :rtype: bool
+
+        This is known only if the broker of the bus runs along with this
+        engine. Else the channel is supposed to be listened to.
+        """
+        topics = self.engine.get('broker.topics')
+        if topics is None:
+            return True
+
+        return topics.get(channel, {}).get('subscribers', 0) > 0
+
+
+class ShardReceiver(Process):
+    """
+    Receives notifications forwarded by the front end
+
+    This process is started by each engine when sharding is enabled. It
+    subscribes to the bus channel of the engine, e.g., ``shard/node2/``, and
+    passes notifications received there to the local space.
+
+    Notifications are numbered by the front end that forwards them. A gap
+    in numbers means that some notifications have been dropped by the bus,
+    and they are counted in ``shards.lost``. When the local queue of
+    inbound events is saturated, the receiver waits before passing more
+    notifications.
+    """
+
+    EMPTY_DELAY = 0.005   # time to wait if nothing has been received
+
+    def __init__(self, engine=None):
+        """
+        Receives notifications forwarded by the front end
+
+        :param engine: the local engine
+        :type engine: Engine
+
+        """
+        Process.__init__(self)
+        self.daemon = True
+        self.engine = engine
+        self.sequences = {}  # last number received from each front end
+
+    def run(self):
+        """
+        Continuously receives notifications
+
+        The loop is stopped when ``general.switch`` is changed in the
+        context.
+        """
+        channel = Shards.get_channel(self.engine.get('shards.node'))
+        logger.info(u"Starting shard receiver on {}", channel)
+
+        subscriber = self.engine.bus.subscribe(channel)
+        try:
+            self.engine.set('receiver.counter', 0)
+            while self.engine.get('general.switch', 'on') == 'on':
+
+                try:
+                    item = subscriber.get()
+                    if item is None:
+                        time.sleep(self.EMPTY_DELAY)
+                        continue
+
+                    self.engine.context.increment('receiver.counter')
+                    self.process(item)
+
+                except Exception as feedback:
+                    logger.exception(feedback)
+
+        except KeyboardInterrupt:
+            pass
+
+        logger.info(u"Shard receiver has been stopped")
+
+    def process(self, message):
+        """
+        Passes a forwarded notification to the local space
+
+        :param message: the message received from the bus
+        :type message: dict
+
+        """
+        item = message
+        if 'sequence' in message:
+            self.check(message.get('node'), message['sequence'])
+            item = message['item']
+
+        while (getattr(self.engine.ears, 'is_saturated', False)
+               and self.engine.get('general.switch', 'on') == 'on'):
+            time.sleep(self.EMPTY_DELAY)
+
+        self.engine.space.webhook(item)
+
+    def check(self, node, sequence):
+        """
+        Detects notifications dropped by the bus
+
+        :param node: the front end that has forwarded the notification
+        :type node: str
+
+        :param sequence: the number given by the front end
+        :type sequence: int
+
+        :return: the number of notifications lost before this one
+        :rtype: int
+        """
+        last = self.sequences.get(node)
+        self.sequences[node] = sequence
+
+        if last is None or sequence <= last:  # first one, or a restart
+            return 0
+
+        lost = sequence - last - 1
+        if lost:
+            logger.warning(u"Lost {} notifications from {}", lost, node)
+            self.engine.context.increment('shards.lost', lost)
+        return lost
@@ -17,12 +17,17 @@
 
 from builtins import str
 import importlib
-import logging
 from multiprocessing import Process, Queue
 from six import string_types
 
 from shellbot.commands import Default
+from shellbot.events import AttachmentName
 from shellbot.i18n import _
+from shellbot.logger import Logger
+from shellbot.tracing import clock, tracer
+
+
+logger = Logger(__name__)
 
 
 class Shell(object):
@@ -196,9 +201,9 @@ class Shell(object):
         if isinstance(command, string_types):
             try:
                 module = importlib.import_module(command)
-                logging.debug(u"Loading command '{}'".format(command))
+                logger.debug(u"Loading command '{}'", command)
             except ImportError:
-                logging.error(u"Unable to import '{}'".format(command))
+                logger.error(u"Unable to import '{}'", command)
                 return
 
             name = command.rsplit('.', 1)[1].capitalize()
@@ -210,8 +215,7 @@ class Shell(object):
         command.keyword = command.keyword.lower()  # align across devices
 
         if command.keyword in self._commands.keys():
-            logging.debug(u"Command '{}' has been replaced".format(
-                command.keyword))
+            logger.debug(u"Command '{}' has been replaced", command.keyword)
 
         self._commands[command.keyword] = command
 
@@ -256,16 +260,24 @@ class Shell(object):
         - ``attachment`` - When a file has been uploaded, this attribute
           provides its external name, e.g., ``picture024.png``. This can be used
           in the executed command, if you keep in mind that the same name can be
-          used multiple times in a conversation.
+          used multiple times in a conversation. If the name has not been set
+          by the space, an ``AttachmentName`` is provided instead, and the
+          name is asked to the space only when the command reads it.
 
         - ``url`` - When a file has been uploaded, this is the handle by which
           actual content can be retrieved. Usually, ask the underlying space
           to get a local copy of the document.
 
+        While the command is executed, messages sent by the bot have the
+        priority ``interactive``, so that they are not delayed by
+        notifications and broadcasts.
+
         """
         line = str(line) if line else ''  # sanity check
 
-        logging.info(u"Handling: {}".format(line))
+        tracer.mark(received, 'shell')
+
+        logger.info(u"Handling: {}", line)
         self.line = line
         self.count += 1
 
@@ -285,9 +297,6 @@ class Shell(object):
         else:
             kwargs['arguments'] = ''
 
-        if received and received.attachment:
-            kwargs['attachment'] = received.attachment
-
         if received and received.url:
             kwargs['url'] = received.url
 
@@ -297,8 +306,16 @@ class Shell(object):
         if bot.channel is None:
             return
 
+        if received and received.attachment:
+            kwargs['attachment'] = received.attachment
+
+        elif received and received.url:  # resolved only if used
+            kwargs['attachment'] = AttachmentName(bot.space, received.url)
+
         sorry_message = _(u"Sorry, I do not know how to handle '{}'")
 
+        previous = getattr(bot, 'priority', 'normal')
+        bot.priority = 'interactive'  # replies to chat participants
         try:
             if verb in self._commands.keys():
                 command = self._commands[verb]
@@ -307,17 +324,19 @@ class Shell(object):
                     or (command.in_group and not bot.channel.is_direct) ):
 
                     self.verb = verb
-                    command.execute(bot, **kwargs)
+                    tracer.mark(received, 'command')
+                    self._execute(command, bot, kwargs)
 
                 else:
 
-                    logging.debug(u"- command cannot be used in this channel")
+                    logger.debug(u"- command cannot be used in this channel")
                     bot.say(sorry_message.format(verb))
 
             elif _(u'*default') in self._commands.keys():
                 kwargs['arguments'] = line  # provide full input line
                 command = self._commands[_(u'*default')]
-                command.execute(bot, **kwargs)
+                tracer.mark(received, 'command')
+                self._execute(command, bot, kwargs)
 
             else:
                 bot.say(sorry_message.format(verb))
@@ -325,3 +344,30 @@ class Shell(object):
         except Exception:
             bot.say(sorry_message.format(verb))
             raise
+
+        finally:
+            bot.priority = previous
+
+    def _execute(self, command, bot, kwargs):
+        """
+        Executes a command and measures its duration
+
+        :param command: the command that will be executed
+        :type command: Command
+
+        :param bot: the bot in charge of the channel
+        :type bot: ShellBot
+
+        :param kwargs: arguments of the command
+        :type kwargs: dict
+
+        Durations are recorded in the context, in a histogram named after
+        the command, e.g., ``metrics.command.echo``.
+        """
+        start = clock()
+        try:
+            command.execute(bot, **kwargs)
+        finally:
+            self.engine.context.observe(
+                u'metrics.command.{}'.format(command.keyword),
+                clock() - start)
@@ -113,6 +113,8 @@ class Space(object):
     DEFAULT_SPACE_TITLE = _(u'Collaboration space')
 
     PULL_INTERVAL = 0.05  # time between pulls, when not hooked
+    PULL_MAX_INTERVAL = 5.0  # time between pulls, when idle
+    PULL_BACKOFF = 2.0  # slow down pulls by this factor, when idle
 
     def __init__(self,
                  context=None,
@@ -561,7 +563,10 @@ class Space(object):
         messages = []
 
         scanned = 10 * quantity
-        for message in self.walk_messages(id=id, **kwargs):
+        for message in self.walk_messages(id=id,
+                                          stop_id=stop_id,
+                                          up_to=up_to,
+                                          **kwargs):
 
             if stop_id and message.id == stop_id:
                 logging.debug(u"- hit stop id")
@@ -589,6 +594,8 @@ class Space(object):
 
     def walk_messages(self,
                       id=None,
+                      stop_id=None,
+                      up_to=None,
                       **kwargs):
         """
         Walk messages
@@ -596,15 +603,49 @@ class Space(object):
         :param id: the unique id of an existing channel
         :type id: str
 
+        :param stop_id: no message is needed past this one (optional)
+        :type stop_id: str
+
+        :param up_to: no message is needed before this date (optional)
+        :type up_to: str of ISO date and time
+
         :return: a iterator of Message objects
 
         This function returns messages from a channel, from the newest to
         the oldest.
 
+        Parameters ``stop_id`` and ``up_to`` are hints that can be used to
+        avoid the fetching of messages that will not be consumed. Messages
+        that match these limits are still provided.
+
         This function should be implemented in sub-class
         """
         raise NotImplementedError
 
+    def name_attachment(self, url, **kwargs):
+        """
+        Retrieves the external name of a document attached to a channel
+
+        :param url: link to the attached document
+        :type url: str
+
+        :return: the name of the document, e.g., ``some_file.pdf``
+        :rtype: str
+
+        This function is called lazily, e.g., by the shell when some command
+        actually needs the name of an uploaded file.
+
+        This function should be expanded in sub-class, where necessary.
+
+        Example::
+
+            def name_attachment(self, url, **kwargs):
+                response = requests.head(url=url)
+                return response.headers['X-Name']
+
+        """
+        return os.path.basename(url)
+
     def post_message(self,
                      id=None,
                      text=None,
@@ -766,18 +807,30 @@ class Space(object):
         Note: this function should not be invoked if a webhok has been
         configured.
 
+        Pulls are spaced by ``PULL_INTERVAL`` while updates are coming.
+        When ``pull()`` reports that nothing new has been found, the delay
+        is multiplied by ``PULL_BACKOFF``, up to ``PULL_MAX_INTERVAL``, so
+        that an idle space does not consume the quota of the back-end API.
+
         """
 
         logging.info(u'Pulling updates')
 
         try:
             self.context.set('puller.counter', 0)
+            delay = self.PULL_INTERVAL
             while self.context.get('general.switch', 'on') == 'on':
 
                 try:
-                    self.pull()
+                    count = self.pull()
                     self.context.increment('puller.counter')
-                    time.sleep(self.PULL_INTERVAL)
+
+                    if count == 0:  # nothing new
+                        delay = min(delay * self.PULL_BACKOFF,
+                                    self.PULL_MAX_INTERVAL)
+                    else:
+                        delay = self.PULL_INTERVAL
+                    time.sleep(delay)
 
                 except Exception as feedback:
                     logging.warning(feedback)
@@ -792,16 +845,25 @@ class Space(object):
         """
         Fetches updates
 
+        :return: the number of new items, or None
+        :rtype: int
+
         This function senses most recent items, and pushes them
         to the listening queue.
 
+        When no new item is reported, next pulls are delayed progressively.
+        If None is returned, then pulls happen every ``PULL_INTERVAL``.
+
         This function should be implemented in sub-class.
 
         Example::
 
             def pull(self):
+                count = 0
                 for message in self.api.list_message():
                     self.ears.put(message)
+                    count += 1
+                return count
 
         """
         raise NotImplementedError()
@@ -15,29 +15,78 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from bottle import request
+from bottle import request, response
 from functools import wraps
+import hashlib
 from io import BytesIO
 import itertools
-import logging
 from multiprocessing import Process, Queue
 import os
 import re
 import requests
-import shutil
 from six import string_types
+from six.moves.queue import Empty, Full, Queue as ThreadQueue
 import tempfile
+from threading import Event as ThreadEvent, Lock, Thread
 import time
+import zlib
 
+from shellbot.cache import Cache
 from shellbot.channel import Channel
 from shellbot.events import Event, Message, Join, Leave
+from shellbot.logger import Logger
+from shellbot.tracing import tracer
 from .base import Space
 
 
+logger = Logger(__name__)
+
+
+_sessions = {}  # one HTTP session per process
+_sessions_lock = Lock()
+
+
+def get_session(pool_size=10):
+    """
+    Provides the HTTP session of the current process
+
+    :param pool_size: connections to keep alive per host
+    :type pool_size: positive integer
+
+    :return: a session shared by all calls made from this process
+    :rtype: requests.Session
+
+    Since connections cannot be shared safely across processes, a new
+    session is created on first call in each process, e.g., after a fork.
+
+    Example::
+
+        response = get_session().get(url, headers=headers, timeout=10)
+
+    """
+    pid = os.getpid()
+    with _sessions_lock:
+        session = _sessions.get(pid)
+        if session is None:
+            logger.debug(u"Creating HTTP session with {} connections",
+                         pool_size)
+            adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size,
+                                                    pool_maxsize=pool_size)
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+
+            _sessions.clear()  # forget sessions of the parent process
+            _sessions[pid] = session
+
+        return session
+
+
 def retry(give_up="Unable to request Cisco Spark API",
           silent=False,
           delays=(0.1, 1, 5),
-          skipped=(401, 403, 404, 409)):
+          skipped=(401, 403, 404, 409),
+          context=None):
     """
     Improves a call to Cisco Spark API
 
@@ -53,6 +102,9 @@ def retry(give_up="Unable to request Cisco Spark API",
     :param skipped: do not retry for these status codes
     :type skipped: a list of web status codes
 
+    :param context: where API calls and errors are counted, if any
+    :type context: Context
+
     This decorator compensates for common transient communication issues
     with the Cisco Spark platform in the cloud.
 
@@ -64,6 +116,10 @@ def retry(give_up="Unable to request Cisco Spark API",
 
         me = api_call()
 
+    When a context is provided, each attempt increments the counter
+    ``metrics.spark.calls``, and each failure increments a counter named
+    after the status code, e.g., ``metrics.spark.errors.429``.
+
     credit: http://code.activestate.com/recipes/580745-retry-decorator-in-python/
     """
     def wrapper(function):
@@ -73,10 +129,18 @@ def retry(give_up="Unable to request Cisco Spark API",
 
             for delay in itertools.chain(delays, [ None ]):
 
+                if context:
+                    context.increment('metrics.spark.calls')
+
                 try:
                     return function(*args, **kwargs)
 
                 except Exception as feedback:
+                    if context:
+                        code = getattr(feedback, 'response_code', None)
+                        context.increment(u'metrics.spark.errors.{}'.format(
+                            code or 'other'))
+
                     if isinstance(feedback, SparkApiError) and feedback.response_code in skipped:
                         delay = None
 
@@ -84,18 +148,18 @@ def retry(give_up="Unable to request Cisco Spark API",
                         delay = None
 
                     if delay is None:
-                        logging.warning(give_up)
+                        logger.warning(give_up)
 
                         if silent:
-                            logging.debug(feedback)
+                            logger.debug(feedback)
                             return
 
                         else:
                             raise
 
                     else:
-                        logging.debug(feedback)
-                        logging.warning(u"Retrying the API request...")
+                        logger.debug(feedback)
+                        logger.warning(u"Retrying the API request...")
                         time.sleep(delay)
 
         return wrapped
@@ -127,7 +191,7 @@ def no_exception(function, return_value=None):
             return function(*args, **kwargs)
 
         except Exception as feedback:
-            logging.debug(feedback)
+            logger.debug(feedback)
             return return_value
 
     return wrapper
@@ -156,6 +220,30 @@ class SparkSpace(Space):
 
     }
 
+    FETCHERS = 2  # background processes that fetch notified messages
+
+    EMPTY_DELAY = 0.005  # time to wait if inbox is empty
+
+    RECENT_SIZE = 2000  # number of recent notifications to remember
+    RECENT_DURATION = 900  # seconds to remember a notification
+
+    ATTACHMENTS_SIZE = 500  # number of attachment names to remember
+
+    AUDIT_URLS = 'space.audit_urls'  # documents fetched with the audit token
+
+    CHUNK_SIZE = 65536  # bytes written to disk at once on download
+
+    POOL_SIZE = 10  # HTTP connections kept alive per host, in each process
+
+    PULL_PAGE = 50  # messages listed per page on pull
+    PULL_LIMIT = 500  # messages processed at most on pull
+
+    HISTORY_PAGE = 50  # messages listed per page on walk
+    HISTORY_ROOMS = 50  # rooms with history in cache
+    HISTORY_DEPTH = 200  # messages in cache, per room
+    HISTORY_DURATION = 10.0  # seconds before cached history is stale
+    TIMEOUT = 60  # seconds to wait for an answer from the API
+
     def on_init(self,
                 token=None,
                 **kwargs):
@@ -175,9 +263,21 @@ class SparkSpace(Space):
 
         self.api = None
         self.audit_api = None
+        self.session = None  # set by get_session()
 
         self._last_message_id = 0
 
+        self.inboxes = []  # populated by start_fetchers()
+        self.fetchers = []
+
+        self.recent = Cache(size=self.RECENT_SIZE,
+                            duration=self.RECENT_DURATION)
+
+        self.attachments = Cache(size=self.ATTACHMENTS_SIZE)
+
+        self.history = Cache(size=self.HISTORY_ROOMS,
+                             duration=self.HISTORY_DURATION)
+
     def check(self):
         """
         Checks settings of the space
@@ -228,6 +328,28 @@ class SparkSpace(Space):
           If ``space.audit_token`` is not provided, then the function looks
           for an environment variable ``CISCO_SPARK_AUDIT_TOKEN``.
 
+        * ``space.fetchers`` - number of background processes that fetch
+          messages notified over the web hook. Default value is ``FETCHERS``.
+
+        * ``space.downloads`` - directory where attachments are downloaded.
+          Default value is ``shellbot-downloads`` in the temporary directory
+          of the system.
+
+        * ``space.max_download`` - maximum size of a downloaded attachment,
+          in bytes. There is no limit by default.
+
+        * ``space.pool_size`` - number of HTTP connections kept alive to the
+          Cisco Spark API, in each process. Default value is ``POOL_SIZE``.
+
+        * ``space.timeout`` - maximum time to wait for an answer from the
+          Cisco Spark API, in seconds. Default value is ``TIMEOUT``.
+
+        * ``space.cursor`` - path of a file where the id of the last pulled
+          message is saved. This is used only when there is no webhook.
+
+        * ``space.api_url`` - base URL of the Cisco Spark API. This can be
+          changed to use a local stand-in, such as ``FakeSpark``.
+
         If a single value is provided for ``participants`` then it is turned
         automatically to a list.
 
@@ -277,37 +399,106 @@ class SparkSpace(Space):
 
         This function loads two instances of Cisco Spark API, one using
         the bot token, and one using the audit token, if this is available.
+        Both instances share the HTTP connections of the process, as provided
+        by ``get_session()``.
         """
+        options = {}
         if not factory:
             from ciscosparkapi import CiscoSparkAPI
             factory = CiscoSparkAPI
+            options['single_request_timeout'] = int(
+                self.context.get('space.timeout', self.TIMEOUT))
+            if self.context.get('space.api_url'):
+                options['base_url'] = self.context.get('space.api_url')
 
-        logging.debug(u"Loading Cisco Spark API")
+        logger.debug(u"Loading Cisco Spark API")
 
         bot_token = self.context.get('space.token')
         assert bot_token  # some token is needed
 
+        self.session = None  # bind new instances to the session
         self.api = None
         try:
-            logging.debug(u"- token: {}".format(bot_token))
-            self.api = factory(access_token=bot_token)
+            logger.debug(u"- token: {}", bot_token)
+            self.api = factory(access_token=bot_token, **options)
 
         except Exception as feedback:
-            logging.error(u"Unable to load Cisco Spark API")
-            logging.exception(feedback)
+            logger.error(u"Unable to load Cisco Spark API")
+            logger.exception(feedback)
 
         audit_token = self.context.get('space.audit_token')
         self.audit_api = None
         if audit_token:
             try:
-                logging.debug(u"- audit token: {}".format(audit_token))
-                self.audit_api = factory(access_token=audit_token)
+                logger.debug(u"- audit token: {}", audit_token)
+                self.audit_api = factory(access_token=audit_token, **options)
 
             except Exception as feedback:
-                logging.warning(feedback)
+                logger.warning(feedback)
 
+        self.get_session()
         self.on_connect()
 
+    def get_session(self):
+        """
+        Provides the HTTP session of the current process
+
+        :return: the session to use for calls to the Cisco Spark API
+        :rtype: requests.Session
+
+        The connection pool of this session is also used by API instances
+        loaded on ``connect()``, so that connections are kept alive and
+        reused across messages, attachments and audit. This function should
+        be called once after a fork, so that the new process gets its own
+        connections.
+        """
+        session = get_session(
+            pool_size=self.context.get('space.pool_size', self.POOL_SIZE))
+
+        if session is not self.session:
+            self.session = session
+            for api in (self.api, self.audit_api):
+                if api is not None:
+                    self.share_connections(api, session)
+
+        return session
+
+    def share_connections(self, api, session):
+        """
+        Makes an API instance use the connections of a session
+
+        :param api: an instance of the Cisco Spark API
+        :type api: CiscoSparkAPI
+
+        :param session: the HTTP session of the current process
+        :type session: requests.Session
+
+        :return: True if connections are shared, else False
+        :rtype: bool
+
+        ciscosparkapi does not accept a session, nor does it expose the one
+        it uses. Therefore this function relies on private attributes of
+        the library, i.e., ``api._session._req_session``, and mounts there
+        the adapters of the shared session. If these attributes cannot be
+        found, e.g., after an upgrade of the library, the API keeps its own
+        connections.
+        """
+        rest = getattr(api, '_session', None)
+        target = getattr(rest, '_req_session', None)
+        if not callable(getattr(target, 'mount', None)):
+            logger.debug(u"- API connections are not shared")
+            return False
+
+        try:
+            for prefix in ('https://', 'http://'):
+                target.mount(prefix, session.get_adapter(prefix))
+
+        except Exception as feedback:
+            logger.warning(u"Unable to share API connections: {}", feedback)
+            return False
+
+        return True
+
     def on_connect(self):
         """
         Retrieves attributes of this bot
@@ -318,26 +509,23 @@ class SparkSpace(Space):
         """
         assert self.api is not None  # connect() is prerequisite
 
-        @retry(u"Unable to retrieve bot information")
+        @retry(u"Unable to retrieve bot information", context=self.context)
         def bot_identity():
             return self.api.people.me()
 
-        logging.debug(u"Retrieving bot information")
+        logger.debug(u"Retrieving bot information")
         me = bot_identity()
 #       logging.debug(u"- {}".format(str(me)))
 
         self.context.set('bot.address', str(me.emails[0]))
-        logging.debug(u"- bot email: {}".format(
-            self.context.get('bot.address')))
+        logger.debug(u"- bot email: {}", self.context.get('bot.address'))
 
         self.context.set('bot.name',
                      str(me.displayName))
-        logging.debug(u"- bot name: {}".format(
-            self.context.get('bot.name')))
+        logger.debug(u"- bot name: {}", self.context.get('bot.name'))
 
         self.context.set('bot.id', me.id)
-        logging.debug(u"- bot id: {}".format(
-            self.context.get('bot.id')))
+        logger.debug(u"- bot id: {}", self.context.get('bot.id'))
 
     def list_group_channels(self, quantity=10, **kwargs):
         """
@@ -354,9 +542,9 @@ class SparkSpace(Space):
         if not quantity:
             return []
 
-        logging.info(u"Listing {} recent rooms".format(quantity))
+        logger.info(u"Listing {} recent rooms", quantity)
 
-        @retry(u"Unable to list rooms", silent=True)
+        @retry(u"Unable to list rooms", silent=True, context=self.context)
         def list_rooms():
             return [self._to_channel(x) \
                         for x in self.api.rooms.list(type='group',
@@ -395,9 +583,9 @@ class SparkSpace(Space):
                 if team and team.id:
                     teamId = team.id
 
-        logging.info(u"Creating Cisco Spark room '{}'".format(title))
+        logger.info(u"Creating Cisco Spark room '{}'", title)
 
-        @retry(u"Unable to create room", silent=True)
+        @retry(u"Unable to create room", silent=True, context=self.context)
         def do_it():
 
             room = self.api.rooms.create(title=title,
@@ -422,18 +610,18 @@ class SparkSpace(Space):
         assert title
         assert self.api is not None  # connect() is prerequisite
 
-        logging.info(u"Looking for Cisco Spark room '{}'".format(title))
+        logger.info(u"Looking for Cisco Spark room '{}'", title)
 
-        @retry(u"Unable to list rooms", silent=True)
+        @retry(u"Unable to list rooms", silent=True, context=self.context)
         def do_it():
 
             for room in self.api.rooms.list(type='group'):
 
                 if title == room.title:
-                    logging.info(u"- found it")
+                    logger.info(u"- found it")
                     return self._to_channel(room)
 
-            logging.info(u"- not found")
+            logger.info(u"- not found")
 
         return do_it()
 
@@ -450,17 +638,17 @@ class SparkSpace(Space):
         assert id
         assert self.api is not None  # connect() is prerequisite
 
-        logging.info(u"Using Cisco Spark room '{}'".format(id))
+        logger.info(u"Using Cisco Spark room '{}'", id)
 
-        @retry(u"Unable to list rooms", silent=True)
+        @retry(u"Unable to list rooms", silent=True, context=self.context)
         def do_it():
 
             room = self.api.rooms.get(id)
             if room:
-                logging.info(u"- found it")
+                logger.info(u"- found it")
                 return self._to_channel(room)
 
-            logging.info(u"- not found")
+            logger.info(u"- not found")
 
         return do_it()
 
@@ -480,19 +668,18 @@ class SparkSpace(Space):
         assert label
         assert self.api is not None  # connect() is prerequisite
 
-        logging.info(
-            u"Looking for Cisco Spark private room with '{}'".format(label))
+        logger.info(u"Looking for Cisco Spark private room with '{}'", label)
 
-        @retry(u"Unable to list rooms", silent=True)
+        @retry(u"Unable to list rooms", silent=True, context=self.context)
         def do_it():
 
             for room in self.api.rooms.list(type='direct'):
 
                 if room.title.startswith(label):
-                    logging.info(u"- found it")
+                    logger.info(u"- found it")
                     return self._to_channel(room)
 
-            logging.info(u"- not found")
+            logger.info(u"- not found")
 
         return do_it()
 
@@ -514,7 +701,7 @@ class SparkSpace(Space):
         assert channel is not None
         assert self.api is not None  # connect() is prerequisite
 
-        @retry(u"Unable to update room", silent=True)
+        @retry(u"Unable to update room", silent=True, context=self.context)
         def do_it():
             self.api.rooms.update(channel.id, channel.title)
 
@@ -531,9 +718,9 @@ class SparkSpace(Space):
         assert id
         assert self.api is not None  # connect() is prerequisite
 
-        logging.info(u"Deleting Cisco Spark room '{}'".format(id))
+        logger.info(u"Deleting Cisco Spark room '{}'", id)
 
-        @retry(u"Unable to delete room", silent=True)
+        @retry(u"Unable to delete room", silent=True, context=self.context)
         def do_it():
             self.api.rooms.delete(roomId=id)
 
@@ -560,18 +747,18 @@ class SparkSpace(Space):
         assert name
         assert self.api is not None  # connect() is prerequisite
 
-        logging.info(u"Looking for Cisco Spark team '{}'".format(name))
+        logger.info(u"Looking for Cisco Spark team '{}'", name)
 
-        @retry(u"Unable to list teams", silent=True)
+        @retry(u"Unable to list teams", silent=True, context=self.context)
         def do_it():
 
             for team in self.api.teams.list():
 
                 if name == team.name:
-                    logging.info(u"- found team")
+                    logger.info(u"- found team")
                     return team
 
-            logging.info(u"- team not found")
+            logger.info(u"- team not found")
 
         return do_it()
 
@@ -589,10 +776,11 @@ class SparkSpace(Space):
         """
         assert id  # target channel is required
 
-        logging.debug(
+        logger.debug(
             u"Looking for Cisco Spark room participants")
 
-        @retry(u"Unable to list memberships", silent=True)
+        @retry(u"Unable to list memberships", silent=True,
+               context=self.context)
         def do_it():
 
             participants = set()
@@ -605,7 +793,7 @@ class SparkSpace(Space):
                 if person in avoided:
                     continue
 
-                logging.debug(u"- {}".format(item.personEmail))
+                logger.debug(u"- {}", item.personEmail)
                 participants.add(person)
 
             return participants
@@ -632,7 +820,8 @@ class SparkSpace(Space):
         assert is_moderator in (True, False)
         assert self.api is not None  # connect() is prerequisite
 
-        @retry(u"Unable to add participant '{}'".format(person), silent=True)
+        @retry(u"Unable to add participant '{}'".format(person), silent=True,
+               context=self.context)
         def do_it():
             self.api.memberships.create(roomId=id,
                                         personEmail=person,
@@ -656,7 +845,8 @@ class SparkSpace(Space):
         assert person  # target person
         assert self.api is not None  # connect() is prerequisite
 
-        @retry(u"Unable to remove participant '{}'".format(person), silent=True)
+        @retry(u"Unable to remove participant '{}'".format(person), silent=True,
+               context=self.context)
         def do_it():
             self.api.memberships.delete(roomId=id,
                                         personEmail=person)
@@ -665,6 +855,8 @@ class SparkSpace(Space):
 
     def walk_messages(self,
                       id=None,
+                      stop_id=None,
+                      up_to=None,
                       **kwargs):
         """
         Walk messages from a Cisco Spark room
@@ -672,14 +864,119 @@ class SparkSpace(Space):
         :param id: the unique id of an existing room
         :type id: str
 
+        :param stop_id: no message is needed past this one (optional)
+        :type stop_id: str
+
+        :param up_to: no message is needed before this date (optional)
+        :type up_to: str of ISO date and time
+
         :return: an iterator of Message objects
 
+        Pages of ``HISTORY_PAGE`` messages are fetched in the background,
+        so that next page is already there when the current one has been
+        consumed. No page is fetched after ``stop_id`` or ``up_to``.
+
+        Recent history of each room is cached for ``HISTORY_DURATION``
+        seconds, so that multiple walks do not hit the API again.
+
         """
         assert self.api is not None  # connect() is prerequisite
 
-        for item in self.api.messages.list(roomId=id):
-            item._json['hook'] = 'shellbot-messages'
-            yield self.on_message(item._json)
+        def is_last(item):
+            if stop_id and item.get('id') == stop_id:
+                return True
+            if up_to and item.get('created', up_to) < up_to:
+                return True
+            return False
+
+        items = self.history.get(id) or []
+        for item in items:
+            yield self.on_message(item)
+            if is_last(item):
+                return
+
+        if len(items) >= self.HISTORY_DEPTH:
+            items = list(items)  # stop caching, but continue the walk
+            cached = False
+        else:
+            cached = True
+
+        queue = ThreadQueue(maxsize=self.HISTORY_PAGE)
+        stop = ThreadEvent()
+        prefetcher = Thread(target=self.prefetch_messages,
+                            args=(id,
+                                  items[-1].get('id') if items else None,
+                                  is_last,
+                                  queue,
+                                  stop))
+        prefetcher.daemon = True
+        prefetcher.start()
+
+        try:
+            while True:
+                item = queue.get()
+                if item is None:
+                    break
+
+                if isinstance(item, Exception):
+                    raise item
+
+                if cached:
+                    items = items + [item]
+                    if len(items) <= self.HISTORY_DEPTH:
+                        self.history.put(id, items)
+
+                yield self.on_message(item)
+
+        finally:
+            stop.set()
+
+    def prefetch_messages(self, id, before, is_last, queue, stop):
+        """
+        Fetches messages from a room in the background
+
+        :param id: the unique id of an existing room
+        :type id: str
+
+        :param before: fetch messages before this one, if any
+        :type before: str or None
+
+        :param is_last: tells if an item is the last one needed
+        :type is_last: function
+
+        :param queue: where messages are pushed
+        :type queue: Queue
+
+        :param stop: set when messages are not needed anymore
+        :type stop: threading.Event
+
+        Messages are pushed to the queue, followed by ``None``. If some
+        exception is raised, then it is pushed to the queue as well.
+        """
+        def push(item):
+            while not stop.is_set():
+                try:
+                    queue.put(item, True, 0.1)
+                    return True
+                except Full:
+                    pass
+            return False
+
+        try:
+            kwargs = {'roomId': id, 'max': self.HISTORY_PAGE}
+            if before:
+                kwargs['beforeMessage'] = before
+
+            for item in self.api.messages.list(**kwargs):
+                item = item._json.copy()
+                item['hook'] = 'shellbot-messages'
+                if not push(item) or is_last(item):
+                    break
+
+        except Exception as feedback:
+            push(feedback)
+
+        push(None)
 
     def post_message(self,
                      id=None,
@@ -730,23 +1027,24 @@ class SparkSpace(Space):
 
             space.post_message(person='foo.bar@acme.com', text='hello guy')
 
+        This function returns False if the message could not be posted,
+        after multiple attempts.
         """
         assert id or person  # need a recipient
         assert id is None or person is None  # only one recipient
         assert self.api is not None  # connect() is prerequisite
 
-        logging.info(u"Posting message")
-        if text:
-            logging.debug(u"- text: {}".format(
-                text[:50] + (text[50:] and '...')))
-        if content:
-            logging.debug(u"- content: {}".format(
-                content[:50] + (content[50:] and '...')))
-        if file:
-            logging.debug(u"- file: {}".format(
-                file[:50] + (file[50:] and '...')))
-
-        @retry(u"Unable to post message", silent=True)
+        logger.info(u"Posting message")
+        if logger.is_enabled():  # skip truncations at higher levels
+            if text:
+                logger.debug(u"- text: {}", text[:50] + (text[50:] and '...'))
+            if content:
+                logger.debug(u"- content: {}",
+                             content[:50] + (content[50:] and '...'))
+            if file:
+                logger.debug(u"- file: {}", file[:50] + (file[50:] and '...'))
+
+        @retry(u"Unable to post message", silent=True, context=self.context)
         def do_it():
             files = [file] if file else None
             self.api.messages.create(roomId=id,
@@ -754,8 +1052,9 @@ class SparkSpace(Space):
                                      text=text,
                                      markdown=content,
                                      files=files)
+            return True
 
-        do_it()
+        return do_it() is True
 
     def register(self, hook_url):
         """
@@ -790,13 +1089,16 @@ class SparkSpace(Space):
         registration. This means that only the most recent instance of the bot
         will be notified of new invitations.
 
+        Fetchers are started as well, so that the web server can acknowledge
+        notifications without waiting for the Cisco Spark API.
+
         """
         assert hook_url
         assert self.api is not None  # connect() is prerequisite
 
         self.deregister()
 
-        @retry(u"Unable to create webhook", silent=True)
+        @retry(u"Unable to create webhook", silent=True, context=self.context)
         def create_webhook(api, name, resource, event, filter):
             api.webhooks.create(name=name,
                                 targetUrl=hook_url,
@@ -804,17 +1106,17 @@ class SparkSpace(Space):
                                 event=event,
                                 filter=filter)
 
-        logging.info(u"Registering webhook to Cisco Spark")
-        logging.debug(u"- url: {}".format(hook_url))
+        logger.info(u"Registering webhook to Cisco Spark")
+        logger.debug(u"- url: {}", hook_url)
 
-        logging.debug(u"- registering 'shellbot-memberships'")
+        logger.debug(u"- registering 'shellbot-memberships'")
         create_webhook(api=self.api,
                        name='shellbot-memberships',
                        resource='memberships',
                        event='all',
                        filter=None)
 
-        logging.debug(u"- registering 'shellbot-messages'")
+        logger.debug(u"- registering 'shellbot-messages'")
         create_webhook(api=self.api,
                        name='shellbot-messages',
                        resource='messages',
@@ -823,13 +1125,15 @@ class SparkSpace(Space):
 
         if self.audit_api and self.fan:
             self.context.set('audit.has_been_armed', True)
-            logging.debug(u"- registering 'shellbot-audit'")
+            logger.debug(u"- registering 'shellbot-audit'")
             create_webhook(api=self.audit_api,
                            name='shellbot-audit',
                            resource='messages',
                            event='created',
                            filter=None)
 
+        self.start_fetchers()
+
     def deregister(self):
         """
         Stops inbound flow from Cisco Spark
@@ -846,27 +1150,27 @@ class SparkSpace(Space):
         """
         assert self.api is not None  # connect() is prerequisite
 
-        @retry(u"Unable to list webhooks", silent=True)
+        @retry(u"Unable to list webhooks", silent=True, context=self.context)
         def list_webhooks(api):
             return [x for x in api.webhooks.list()]
 
-        @retry(u"Unable to delete webhook", silent=True)
+        @retry(u"Unable to delete webhook", silent=True, context=self.context)
         def delete_webhook(api, id):
             api.webhooks.delete(webhookId=id)
 
-        logging.info(u"Purging webhooks")
+        logger.info(u"Purging webhooks")
         for webhook in list_webhooks(self.api):
-            logging.debug(u"- deleting '{}'".format(webhook.name))
+            logger.debug(u"- deleting '{}'", webhook.name)
             delete_webhook(self.api, webhook.id)
 
         if self.audit_api:
             for webhook in list_webhooks(self.audit_api):
-                logging.debug(u"- deleting '{}'".format(webhook.name))
+                logger.debug(u"- deleting '{}'", webhook.name)
                 delete_webhook(self.audit_api, webhook.id)
 
     def webhook(self, item=None):
         """
-        Processes the flow of events from Cisco Spark
+        Receives the flow of events from Cisco Spark
 
         :param item: if provided, do not invoke the ``request`` object
         :type item: dict
@@ -887,22 +1191,96 @@ class SparkSpace(Space):
                 "name": "shellbot-audit"
             }
 
+        The web request is acknowledged as quickly as possible, so that
+        Cisco Spark does not time out and deliver the same event again.
+        If fetchers have been started, the notification is only validated
+        and put in the inbox, and actual calls to the Cisco Spark API are
+        made in the background. Else the notification is processed
+        immediately, within the web request.
+
+        Notifications related to the same room always go to the same inbox,
+        so that their order is preserved.
+
+        Cisco Spark delivers notifications again when they are not
+        acknowledged fast enough. Recent notifications are remembered, and
+        duplicates are thrown away before any further processing. A
+        notification that fails is forgotten, so that it is processed again
+        when Cisco Spark delivers it again.
+
+        When the queue of inbound events is saturated, notifications are
+        refused with status 503, so that Cisco Spark delivers them again
+        later on.
         """
 
-        logging.debug(u'Receiving data from webhook')
+        logger.debug(u'Receiving data from webhook')
 
         if not item:
             item = request.json
         assert isinstance(item, dict)
 
-#        logging.debug(u"- {}".format(item))
+        for key in ('resource', 'event', 'data', 'name'):
+            if key not in item:
+                raise KeyError(u"Missing '{}' in notification".format(key))
+
+        if (item['resource'] == 'messages'
+            and item['name'] != 'shellbot-audit'):
+
+            filter_id = self.context.get('bot.id')
+            if filter_id and item['data'].get('personId') == filter_id:
+                logger.debug(u"- sent by me, thrown away")
+                return 'OK'
+
+        if getattr(self.ears, 'is_saturated', False):
+            logger.warning(u"- ears are saturated, notification refused")
+            self.context.increment('webhook.refused')
+            response.status = 503
+            return 'Service Unavailable'
+
+        key = u"{}:{}:{}:{}".format(item['name'],
+                                    item['resource'],
+                                    item['event'],
+                                    item['data'].get('id'))
+        if self.recent.seen(key):
+            logger.debug(u"- duplicate notification, thrown away")
+            self.context.increment('webhook.duplicates')
+            return 'OK'
+
+        tracer.mark(item, 'webhook')
+
+        try:
+            if self.inboxes:
+                room = (item['data'].get('roomId')
+                        or item['data'].get('id') or '')
+                index = zlib.crc32(room.encode('utf-8')) % len(self.inboxes)
+                logger.debug(u"- putting notification to inbox {}", index)
+                self.inboxes[index].put(item)
+
+            else:
+                self.process_notification(item)
+
+        except Exception:
+            self.recent.forget(key)  # accept next delivery of this one
+            raise
+
+        return 'OK'
+
+    def process_notification(self, item):
+        """
+        Processes one notification received from Cisco Spark
+
+        :param item: the notification sent over the web hook
+        :type item: dict
+
+        This function fetches resources from the Cisco Spark API, if needed,
+        and pushes resulting events either to the listener or to the observer.
+        """
         resource = item['resource']
         event = item['event']
         data = item['data']
         hook = item['name']
 
         if hook == 'shellbot-audit':
-            logging.debug(u"- for audit")
+            logger.debug(u"- for audit")
             api = self.audit_api
             queue = self.fan
 
@@ -911,73 +1289,221 @@ class SparkSpace(Space):
             queue = self.ears
 
         if resource == 'messages' and event == 'created':
+            logger.debug(u"- handling '{}:{}'", resource, event)
 
-            if hook != 'shellbot-audit':
-
-                filter_id = self.context.get('bot.id')
-                if filter_id and data.get('personId') == filter_id:
-                    logging.debug(u"- sent by me, thrown away")
-                    return 'OK'
-
-            logging.debug(u"- handling '{}:{}'".format(resource, event))
-
-            @retry(u"Unable to retrieve new message")
+            @retry(u"Unable to retrieve new message", context=self.context)
             def fetch_message():
 
                 item = api.messages.get(messageId=data['id'])
                 item._json['hook'] = hook
                 return item._json
 
-            self.on_message(fetch_message(), queue)
+            tracer.mark(item, 'fetch')
+            message = fetch_message()
+            if item.get('trace'):
+                message['trace'] = item['trace']
+            self.on_message(message, queue)
 
         elif resource == 'memberships' and event == 'created':
-            logging.debug(u"- handling '{}:{}'".format(resource, event))
+            logger.debug(u"- handling '{}:{}'", resource, event)
             self.on_join(data, queue)
 
         elif resource == 'memberships' and event == 'deleted':
-            logging.debug(u"- handling '{}:{}'".format(resource, event))
+            logger.debug(u"- handling '{}:{}'", resource, event)
             self.on_leave(data, queue)
 
         else:
-            logging.debug(u"- throwing away {}:{}".format(resource, event))
-            logging.debug(u"- {}".format(data))
+            logger.debug(u"- throwing away {}:{}", resource, event)
+            logger.debug(u"- {}", data)
+
+    def start_fetchers(self, quantity=None):
+        """
+        Starts background processes that handle notifications
+
+        :param quantity: number of fetchers to start (optional)
+        :type quantity: positive integer
+
+        :return: the list of started processes
+
+        If no quantity is provided, the value of ``space.fetchers`` is used,
+        or ``FETCHERS`` if this has not been configured. Each fetcher
+        has its own inbox, and is started as a daemonic process.
+
+        This function is called on webhook registration, so that fetchers
+        are shared with the web server that will receive notifications.
+        """
+        if quantity is None:
+            quantity = self.context.get('space.fetchers', self.FETCHERS)
+
+        if self.fetchers or quantity < 1:
+            return self.fetchers
+
+        logger.debug(u"Starting {} fetchers", quantity)
+        self.inboxes = [Queue() for index in range(quantity)]
+        for inbox in self.inboxes:
+            p = Process(target=self.fetch, args=(inbox,))
+            p.daemon = True
+            p.start()
+            self.fetchers.append(p)
+
+        return self.fetchers
+
+    def fetch(self, inbox):
+        """
+        Continuously handles notifications put in an inbox
 
-        return "OK"
+        :param inbox: the queue of notifications to process
+        :type inbox: Queue
+
+        The recommended way for stopping the process is to change the
+        parameter ``general.switch`` in the context. For example::
+
+            engine.set('general.switch', 'off')
+
+        Alternatively, the loop is also broken when a poison pill is pushed
+        to the inbox. For example::
+
+            inbox.put(None)
+
+        """
+        logger.info(u"Starting fetcher")
+
+        self.get_session()  # connections of this process
+
+        try:
+            while self.context.get('general.switch', 'on') == 'on':
+
+                try:
+                    item = inbox.get(True, self.EMPTY_DELAY)
+                except Empty:
+                    continue
+
+                if item is None:
+                    break
+
+                try:
+                    self.context.increment('fetcher.counter')
+                    self.process_notification(item)
+
+                except Exception as feedback:
+                    logger.exception(feedback)
+
+        except KeyboardInterrupt:
+            pass
+
+        logger.info(u"Fetcher has been stopped")
 
     def pull(self):
         """
         Fetches events from Cisco Spark
 
+        :return: the number of new messages
+        :rtype: int
+
         This function senses most recent items, and pushes them
         to a processing queue.
+
+        Messages are listed from the newest to the oldest, and pages of
+        ``PULL_PAGE`` messages are fetched until the last message seen on
+        previous pull. Therefore no message is missed, even if many have been
+        posted since then. Up to ``PULL_LIMIT`` messages are handled at once.
+        On first pull, only the first page is considered.
+
+        If ``space.cursor`` is set, this is the path of a file where the id
+        of last message is saved, so that a restarted bot resumes from there.
         """
         assert self.api is not None  # connect() is prerequisite
 
-        logging.info(u'Pulling messages')
+        logger.info(u'Pulling messages')
         self.context.increment(u'puller.counter')
 
-        @retry(u"Unable to pull messages", silent=True)
+        self.get_session()  # in case of fork
+
+        if not self._last_message_id:
+            self._last_message_id = self.load_cursor()
+
+        limit = self.PULL_LIMIT if self._last_message_id else self.PULL_PAGE
+
+        @retry(u"Unable to pull messages", silent=True, context=self.context)
         def call_api():
-            return self.api.messages.list(mentionedPeople=['me'],
-                                          max=10)
+            items = []
+            for item in self.api.messages.list(mentionedPeople=['me'],
+                                               max=self.PULL_PAGE):
 
-        new_items = []
-        items = call_api()
-        for item in items:
+                if item.id == self._last_message_id:
+                    break
 
-            if item.id == self._last_message_id:
-                break
+                items.append(item)
+                if len(items) >= limit:
+                    logger.warning(u"Too many messages to pull")
+                    break
 
-            new_items.append(item)
+            return items
 
+        new_items = call_api() or []
         if len(new_items):
-            logging.info(u"Pulling {} new messages".format(len(new_items)))
+            logger.info(u"Pulling {} new messages", len(new_items))
 
+        count = 0
         while len(new_items):
             item = new_items.pop()
             self._last_message_id = item.id
+
+            if self.recent.seen(u"pull:{}".format(item.id)):
+                logger.debug(u"- duplicate message, thrown away")
+                continue
+
             item._json['hook'] = 'pull'
             self.on_message(item._json, self.ears)
+            count += 1
+
+        if count:
+            self.save_cursor(self._last_message_id)
+
+        return count
+
+    def load_cursor(self):
+        """
+        Retrieves the id of the last pulled message
+
+        :return: the id saved in the file ``space.cursor``, or 0
+        :rtype: str or 0
+
+        """
+        path = self.context.get('space.cursor')
+        if not path:
+            return 0
+
+        try:
+            with open(path, 'r') as handle:
+                cursor = handle.read().strip()
+                logger.debug(u"- pulling from cursor {}", cursor)
+                return cursor or 0
+
+        except IOError:
+            return 0
+
+    def save_cursor(self, cursor):
+        """
+        Remembers the id of the last pulled message
+
+        :param cursor: the id of the last pulled message
+        :type cursor: str
+
+        The id is saved in the file ``space.cursor``, if this is set.
+        """
+        path = self.context.get('space.cursor')
+        if not path:
+            return
+
+        try:
+            with open(path + '.tmp', 'w') as handle:
+                handle.write(cursor)
+            os.rename(path + '.tmp', path)  # atomic on posix
+
+        except (IOError, OSError) as feedback:
+            logger.warning(u"Unable to save cursor")
+            logger.debug(feedback)
 
     def on_message(self, item, queue=None):
         """
@@ -1004,6 +1530,11 @@ class SparkSpace(Space):
         * ``mentioned_ids`` is a copy of ``mentionedPeople``
         * ``channel_id`` is a copy of ``roomId``
         * ``stamp`` is a copy of ``created``
+        * ``url`` is the link to the first attached file, if any
+
+        Note that the external name of an attached file is not resolved here,
+        since this would require a request to the Cisco Spark API for every
+        message. Use ``name_attachment()`` to get it when actually needed.
 
         """
         message = Message(item.copy())
@@ -1017,18 +1548,17 @@ class SparkSpace(Space):
 
         files = item.get('files', [])
         if files:
-            url = files[0]
-            message.url = url
+            message.url = files[0]
 
-            if message.hook == 'shellbot-audit':
-                token = self.context.get('space.audit_token', '*no*token')
-            else:
-                token = self.context.get('space.token', '*no*token')
+            if message.hook == 'shellbot-audit':  # remember the token to use
+                self.context.append(self.AUDIT_URLS,
+                                    message.url,
+                                    limit=self.ATTACHMENTS_SIZE)
 
-            message.attachment = self.name_attachment(url, token=token)
+        tracer.mark(message, 'ears')
 
         if queue:
-            logging.debug(u"- putting message to queue")
+            logger.debug(u"- putting message to queue")
             queue.put(str(message))
 
         return message
@@ -1036,45 +1566,205 @@ class SparkSpace(Space):
     def download_attachment(self, url, token=None):
         """
         Copies a shared document locally
+
+        :param url: link to the attached document
+        :type url: str
+
+        :param token: authentication token to use (optional)
+        :type token: str
+
+        :return: the path to the local copy
+        :rtype: str
+
+        The document is streamed to disk by chunks of ``CHUNK_SIZE`` bytes,
+        so that large files are never loaded in memory. An exception is
+        raised if the size of the document exceeds ``space.max_download``.
+
+        Local copies are named after their content, e.g.,
+        ``/tmp/shellbot-downloads/<sha256>/some_file.pdf``, and URLs are
+        indexed in the same directory. Therefore a document is downloaded
+        only once, even if it is processed multiple times, or from
+        different processes.
         """
-        path = os.path.join(tempfile.gettempdir(),
-                            self.name_attachment(url, token=token))
-        logging.debug(u"- writing to {}".format(path))
-        with open(path, "wb") as handle:
-            shutil.copyfileobj(self.get_attachment(url, token=token),
-                               handle)
+        directory = self.context.get('space.downloads')
+        if not directory:
+            directory = os.path.join(tempfile.gettempdir(),
+                                     'shellbot-downloads')
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:  # created by another process
+                pass
+
+        index = os.path.join(
+            directory,
+            hashlib.sha256(url.encode('utf-8')).hexdigest() + '.url')
+        try:
+            with open(index, 'r') as handle:
+                path = handle.read().strip()
+            if os.path.isfile(path):
+                logger.debug(u"- using local copy {}", path)
+                return path
+        except IOError:
+            pass
+
+        response = self.stream_attachment(url, token=token)
+        try:
+            if 'Content-Disposition' in response.headers:
+                name = self.name_attachment(url, response=response)
+            else:
+                name = self.name_attachment(url, token=token)
+            name = os.path.basename(name) or 'downloadable'
+
+            limit = self.context.get('space.max_download')
+            length = response.headers.get('Content-Length')
+            if limit and length and int(length) > limit:
+                raise ValueError(u"Attachment is too large")
+
+            (handle, temporary) = tempfile.mkstemp(dir=directory)
+            try:
+                digest = hashlib.sha256()
+                size = 0
+                with os.fdopen(handle, 'wb') as stream:
+                    for chunk in response.iter_content(
+                            chunk_size=self.CHUNK_SIZE):
+                        size += len(chunk)
+                        if limit and size > limit:
+                            raise ValueError(u"Attachment is too large")
+                        digest.update(chunk)
+                        stream.write(chunk)
+
+                folder = os.path.join(directory, digest.hexdigest())
+                if not os.path.isdir(folder):
+                    os.mkdir(folder)
+
+                path = os.path.join(folder, name)
+                if os.path.isfile(path):
+                    os.remove(temporary)
+                else:
+                    os.rename(temporary, path)
+
+            except Exception:
+                if os.path.exists(temporary):
+                    os.remove(temporary)
+                raise
+
+        finally:
+            response.close()
+
+        logger.debug(u"- written to {}", path)
+        with open(index, 'w') as handle:
+            handle.write(path)
 
         return path
 
     def name_attachment(self, url, token=None, response=None):
         """
-        Retrieves a document attached to a room
+        Retrieves the external name of a document attached to a room
+
+        :param url: link to the attached document
+        :type url: str
+
+        :param token: authentication token to use (optional)
+        :type token: str
+
+        :return: the name of the document, e.g., ``some_file.pdf``
+        :rtype: str
+
+        Names are remembered per URL, so that the Cisco Spark API is asked
+        only on first call for a given document.
         """
-        logging.debug(u"- sensing {}".format(url))
+        if not response:
+            name = self.attachments.get(url)
+            if name:
+                return name
+
+        logger.debug(u"- sensing {}", url)
 
         if not token:
-            token = self.context.get('space.token', '*no*token')
+            token = self.get_token(url)
 
         headers = {}
         headers['Authorization'] = 'Bearer '+token
 
         if not response:
-            response = requests.head(url=url, headers=headers)
+            response = self.get_session().head(
+                url=url,
+                headers=headers,
+                timeout=self.context.get('space.timeout', self.TIMEOUT))
 
 #        logging.debug(u"- status: {}".format(response.status_code))
         if response.status_code != 200:
             raise Exception(u"Unable to download attachment")
 
 #        logging.debug(u"- headers: {}".format(response.headers))
+        name = 'downloadable'
         line = response.headers['Content-Disposition']
         match = re.search('filename=(.+)', line)
         if match:
             name = match.group(1).strip()
             if name.startswith('"') and name.endswith('"'):
                 name = name[1:-1]
-            return name
 
-        return 'downloadable'
+        self.attachments.put(url, name)
+        return name
+
+    def get_token(self, url):
+        """
+        Selects the token used to fetch an attached document
+
+        :param url: link to the attached document
+        :type url: str
+
+        :return: ``space.audit_token`` for documents received over the audit
+            web hook, else ``space.token``
+        :rtype: str
+
+        Documents are remembered by ``on_message()`` in the context, so
+        that the right token is used by any process, and long after the
+        message has been received.
+        """
+        if url in self.context.get(self.AUDIT_URLS, []):
+            return self.context.get('space.audit_token', '*no*token')
+
+        return self.context.get('space.token', '*no*token')
+
+    def stream_attachment(self, url, token=None, response=None):
+        """
+        Opens a document attached to a room
+
+        :param url: link to the attached document
+        :type url: str
+
+        :param token: authentication token to use (optional)
+        :type token: str
+
+        :return: a response that has not been read yet
+        :rtype: requests.Response
+
+        Use ``response.iter_content()`` to get actual content by chunks,
+        and ``response.close()`` when done.
+        """
+        logger.debug(u"- streaming {}", url)
+
+        if not token:
+            token = self.get_token(url)
+
+        headers = {}
+        headers['Authorization'] = 'Bearer '+token
+
+        if not response:
+            response = self.get_session().get(
+                url=url,
+                headers=headers,
+                stream=True,
+                timeout=self.context.get('space.timeout', self.TIMEOUT))
+
+        if response.status_code != 200:
+            response.close()
+            raise Exception(u"Unable to download attachment")
+
+        return response
 
     def get_attachment(self, url, token=None, response=None):
         """
@@ -1083,21 +1773,22 @@ class SparkSpace(Space):
         :return: a stream of BytesIO
         :rtype: BytesIO
 
-        #TODO: stream from requests
-        response = requests.get(url, stream=True)
-        response.decode_content = True
-        shutil.copyfileobj(response.raw, target)
+        The document is loaded in memory. For large documents, consider
+        ``download_attachment()`` or ``stream_attachment()`` instead.
         """
-        logging.debug(u"- fetching {}".format(url))
+        logger.debug(u"- fetching {}", url)
 
         if not token:
-            token = self.context.get('space.token', '*no*token')
+            token = self.get_token(url)
 
         headers = {}
         headers['Authorization'] = 'Bearer '+token
 
         if not response:
-            response = requests.get(url=url, headers=headers)
+            response = self.get_session().get(
+                url=url,
+                headers=headers,
+                timeout=self.context.get('space.timeout', self.TIMEOUT))
 
 #        logging.debug(u"- status: {}".format(response.status_code))
         if response.status_code != 200:
@@ -1105,7 +1796,7 @@ class SparkSpace(Space):
 
 #        logging.debug(u"- headers: {}".format(response.headers))
 #        logging.debug(u"- encoding: {}".format(response.encoding))
-        logging.debug(u"- length: {}".format(len(response.content)))
+        logger.debug(u"- length: {}", len(response.content))
         return BytesIO(response.content)
 
     def on_join(self, item, queue=None):
@@ -1149,7 +1840,7 @@ class SparkSpace(Space):
         join.stamp = join.get('created')
 
         if queue:
-            logging.debug(u"- putting join to queue")
+            logger.debug(u"- putting join to queue")
             queue.put(str(join))
 
         return join
@@ -1195,7 +1886,7 @@ class SparkSpace(Space):
         leave.stamp = leave.get('created')
 
         if queue:
-            logging.debug(u"- putting leave to queue")
+            logger.debug(u"- putting leave to queue")
             queue.put(str(leave))
 
         return leave
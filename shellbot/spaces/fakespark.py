@@ -0,0 +1,729 @@
+# -*- coding: utf-8 -*-
+
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from bottle import Bottle, request, response
+from collections import OrderedDict
+from datetime import datetime
+import itertools
+import json
+import logging
+import random
+import requests
+from six.moves.queue import Queue
+from six.moves.socketserver import ThreadingMixIn
+from six.moves.urllib.parse import urlencode
+from threading import RLock, Thread
+import time
+from wsgiref.simple_server import make_server, WSGIServer, WSGIRequestHandler
+
+
+class FakeSpark(object):
+    """
+    Serves a subset of the Cisco Spark API locally
+
+    This is a stand-in for the Cisco Spark cloud service, for tests and
+    benchmarks. It supports resources used by ``SparkSpace``: rooms, teams,
+    memberships, messages, webhooks, and people. Everything is kept in
+    memory, and the web server runs in a background thread.
+
+    Example::
+
+        fake = FakeSpark(latency=0.01, throttle_rate=0.01)
+        fake.start()
+
+        engine = Engine(type='spark', settings={
+            'space': {
+                'room': 'Benchmark room',
+                'token': '*bot*token',
+                'api_url': fake.url,
+            },
+            ...
+        })
+        ...
+
+        fake.post(room_id, 'hello world', person='alice@acme.com')
+        ...
+
+        fake.stop()
+
+    Notifications are sent to the target URL of registered webhooks,
+    e.g., to the route exposed by ``Engine.hook()``, when messages are
+    created and when memberships are created or deleted. Webhooks are
+    notified only for rooms where their owner is a member.
+
+    Some faults can be injected in answers to API requests:
+
+    - ``latency`` - seconds to wait before each answer
+    - ``error_rate`` - ratio of requests that fail with status 500
+    - ``throttle_rate`` - ratio of requests that fail with status 429
+
+    """
+
+    RETRY_AFTER = 1  # seconds, in answers with status 429
+
+    PAGE_SIZE = 50  # default number of items per page
+
+    def __init__(self,
+                 latency=0.0,
+                 error_rate=0.0,
+                 throttle_rate=0.0,
+                 seed=None,
+                 binding='127.0.0.1',
+                 port=0):
+        """
+        Serves a subset of the Cisco Spark API locally
+
+        :param latency: time to wait before each answer, in seconds
+        :type latency: positive number
+
+        :param error_rate: ratio of requests that fail with status 500
+        :type error_rate: float between 0.0 and 1.0
+
+        :param throttle_rate: ratio of requests that fail with status 429
+        :type throttle_rate: float between 0.0 and 1.0
+
+        :param seed: seed of random fault injection, for repeatable runs
+        :type seed: int
+
+        :param binding: network interface to listen to
+        :type binding: str
+
+        :param port: port to listen to, or 0 to pick a free port
+        :type port: int
+
+        """
+        assert latency >= 0.0
+        self.latency = latency
+
+        assert 0.0 <= error_rate <= 1.0
+        self.error_rate = error_rate
+
+        assert 0.0 <= throttle_rate <= 1.0
+        self.throttle_rate = throttle_rate
+
+        self.random = random.Random(seed)
+
+        self.binding = binding
+        self.port = port
+
+        self.lock = RLock()
+        self.ids = itertools.count(1)
+
+        self.people = OrderedDict()
+        self.tokens = {}
+        self.rooms = OrderedDict()
+        self.memberships = OrderedDict()
+        self.messages = OrderedDict()
+        self.webhooks = OrderedDict()
+
+        self.counters = {
+            'requests': 0,
+            'errors': 0,
+            'throttles': 0,
+            'notifications': 0,
+        }
+
+        self.httpd = None
+        self.notifications = Queue()
+
+        self.app = Bottle()
+        for (path, method, handler) in [
+            ('/people/me', 'GET', self.get_me),
+            ('/people/<id>', 'GET', self.get_person),
+            ('/rooms', 'GET', self.list_rooms),
+            ('/rooms', 'POST', self.create_room),
+            ('/rooms/<id>', 'GET', self.get_room),
+            ('/rooms/<id>', 'PUT', self.update_room),
+            ('/rooms/<id>', 'DELETE', self.delete_room),
+            ('/teams', 'GET', self.list_teams),
+            ('/memberships', 'GET', self.list_memberships),
+            ('/memberships', 'POST', self.create_membership),
+            ('/memberships/<id>', 'DELETE', self.delete_membership),
+            ('/messages', 'GET', self.list_messages),
+            ('/messages', 'POST', self.create_message),
+            ('/messages/<id>', 'GET', self.get_message),
+            ('/messages/<id>', 'DELETE', self.delete_message),
+            ('/webhooks', 'GET', self.list_webhooks),
+            ('/webhooks', 'POST', self.create_webhook),
+            ('/webhooks/<id>', 'DELETE', self.delete_webhook),
+            ]:
+
+            self.app.route('/v1'+path, method, self.wrap(handler))
+
+    @property
+    def url(self):
+        """
+        Provides the base URL of the API
+
+        :rtype: str
+
+        This can be used as ``space.api_url`` in the configuration of a
+        ``SparkSpace``.
+        """
+        return u"http://{}:{}/v1/".format(self.binding, self.port)
+
+    def start(self):
+        """
+        Starts the web server and the notifier in the background
+        """
+
+        class Server(ThreadingMixIn, WSGIServer):
+            daemon_threads = True
+
+        class Handler(WSGIRequestHandler):
+            def log_message(self, *args, **kwargs):
+                pass
+
+        self.httpd = make_server(self.binding,
+                                 self.port,
+                                 self.app,
+                                 server_class=Server,
+                                 handler_class=Handler)
+        self.port = self.httpd.server_port
+        logging.debug(u"Fake Cisco Spark API at {}".format(self.url))
+
+        server = Thread(target=self.httpd.serve_forever)
+        server.daemon = True
+        server.start()
+
+        notifier = Thread(target=self.notify)
+        notifier.daemon = True
+        notifier.start()
+
+    def stop(self):
+        """
+        Stops the web server and the notifier
+        """
+        self.notifications.put(None)
+
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    def wrap(self, handler):
+        """
+        Adds authentication and fault injection to a request handler
+
+        :param handler: the function that actually handles a request
+        :type handler: callable
+
+        The handler is given the person that is authenticated by the token,
+        and returns either a dict, or a tuple (status, dict).
+        """
+
+        def wrapped(**kwargs):
+
+            with self.lock:
+                self.counters['requests'] += 1
+
+            if self.latency:
+                time.sleep(self.latency)
+
+            response.content_type = 'application/json;charset=utf-8'
+
+            if self.random.random() < self.throttle_rate:
+                with self.lock:
+                    self.counters['throttles'] += 1
+                response.status = 429
+                response.set_header('Retry-After', str(self.RETRY_AFTER))
+                return json.dumps({'message': 'Too many requests'})
+
+            if self.random.random() < self.error_rate:
+                with self.lock:
+                    self.counters['errors'] += 1
+                response.status = 500
+                return json.dumps({'message': 'Injected error'})
+
+            authorization = request.headers.get('Authorization', '')
+            if not authorization.startswith('Bearer '):
+                response.status = 401
+                return json.dumps({'message': 'Missing token'})
+
+            with self.lock:
+                me = self.add_person(token=authorization[len('Bearer '):])
+                answer = handler(me, **kwargs)
+
+            if isinstance(answer, tuple):
+                (response.status, answer) = answer
+
+            if answer is None:
+                return ''
+
+            return json.dumps(answer)
+
+        return wrapped
+
+    def next_id(self, kind):
+        """
+        Provides a unique identifier
+
+        :param kind: the kind of resource, e.g., 'room'
+        :type kind: str
+
+        :rtype: str
+        """
+        return u"{}-{}".format(kind, next(self.ids))
+
+    def stamp(self):
+        """
+        Provides current date and time, as formatted by Cisco Spark
+
+        :rtype: str
+        """
+        return datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3]+'Z'
+
+    def add_person(self, email=None, name=None, token=None):
+        """
+        Remembers a person
+
+        :param email: the address of this person
+        :type email: str
+
+        :param name: the display name of this person
+        :type name: str
+
+        :param token: the token used by this person, if any
+        :type token: str
+
+        :return: attributes of the person
+        :rtype: dict
+
+        Persons are created on first use of a token, or on first mention of
+        an e-mail address. Call this function beforehand to set names.
+        """
+        with self.lock:
+            if token and token in self.tokens:
+                return self.people[self.tokens[token]]
+
+            if email:
+                for person in self.people.values():
+                    if email in person['emails']:
+                        if token:
+                            self.tokens[token] = person['id']
+                        return person
+
+            id = self.next_id('person')
+            person = {
+                'id': id,
+                'emails': [email or u"{}@fake.spark".format(id)],
+                'displayName': name or email or id,
+                'created': self.stamp(),
+                'type': 'person',
+            }
+
+            self.people[id] = person
+            if token:
+                self.tokens[token] = id
+
+            return person
+
+    def get_me(self, me):
+        return me
+
+    def get_person(self, me, id):
+        if id not in self.people:
+            return (404, {'message': 'Unknown person'})
+        return self.people[id]
+
+    def list_rooms(self, me):
+        type = request.query.get('type')
+        rooms = []
+        for room in reversed(list(self.rooms.values())):
+            if type and room['type'] != type:
+                continue
+            if not self.find_membership(room['id'], me['id']):
+                continue
+            rooms.append(room)
+        return {'items': rooms}
+
+    def create_room(self, me):
+        data = request.json or {}
+        if not data.get('title'):
+            return (400, {'message': 'Missing title'})
+
+        room = {
+            'id': self.next_id('room'),
+            'title': data['title'],
+            'type': 'group',
+            'isLocked': False,
+            'lastActivity': self.stamp(),
+            'created': self.stamp(),
+            'creatorId': me['id'],
+        }
+        if data.get('teamId'):
+            room['teamId'] = data['teamId']
+
+        self.rooms[room['id']] = room
+        self.join(room['id'], me, is_moderator=True)
+        return room
+
+    def get_room(self, me, id):
+        if id not in self.rooms:
+            return (404, {'message': 'Unknown room'})
+        return self.rooms[id]
+
+    def update_room(self, me, id):
+        if id not in self.rooms:
+            return (404, {'message': 'Unknown room'})
+        data = request.json or {}
+        if data.get('title'):
+            self.rooms[id]['title'] = data['title']
+        return self.rooms[id]
+
+    def delete_room(self, me, id):
+        if id not in self.rooms:
+            return (404, {'message': 'Unknown room'})
+
+        for membership in list(self.memberships.values()):
+            if membership['roomId'] == id:
+                del self.memberships[membership['id']]
+
+        for message in list(self.messages.values()):
+            if message['roomId'] == id:
+                del self.messages[message['id']]
+
+        del self.rooms[id]
+        return (204, None)
+
+    def list_teams(self, me):
+        return {'items': []}
+
+    def find_membership(self, room_id, person_id):
+        """
+        Finds the membership of a person in a room
+
+        :rtype: dict or None
+        """
+        for membership in self.memberships.values():
+            if (membership['roomId'] == room_id
+                    and membership['personId'] == person_id):
+                return membership
+        return None
+
+    def join(self, room_id, person, is_moderator=False):
+        """
+        Adds a person to a room
+
+        :param room_id: the target room
+        :type room_id: str
+
+        :param person: attributes of the person
+        :type person: dict
+
+        :return: attributes of the new membership, or None
+        :rtype: dict
+
+        Webhooks on memberships are notified.
+        """
+        with self.lock:
+            if self.find_membership(room_id, person['id']):
+                return None
+
+            membership = {
+                'id': self.next_id('membership'),
+                'roomId': room_id,
+                'personId': person['id'],
+                'personEmail': person['emails'][0],
+                'personDisplayName': person['displayName'],
+                'isModerator': is_moderator,
+                'isMonitor': False,
+                'created': self.stamp(),
+            }
+            self.memberships[membership['id']] = membership
+            self.trigger('memberships', 'created', membership)
+            return membership
+
+    def list_memberships(self, me):
+        room_id = request.query.get('roomId')
+        email = request.query.get('personEmail')
+        items = []
+        for membership in self.memberships.values():
+            if room_id and membership['roomId'] != room_id:
+                continue
+            if email and membership['personEmail'] != email:
+                continue
+            items.append(membership)
+        return {'items': items}
+
+    def create_membership(self, me):
+        data = request.json or {}
+        if data.get('roomId') not in self.rooms:
+            return (404, {'message': 'Unknown room'})
+
+        if data.get('personId') in self.people:
+            person = self.people[data['personId']]
+        elif data.get('personEmail'):
+            person = self.add_person(email=data['personEmail'])
+        else:
+            return (400, {'message': 'Missing person'})
+
+        membership = self.join(data['roomId'],
+                               person,
+                               is_moderator=data.get('isModerator', False))
+        if membership is None:
+            return (409, {'message': 'Already a member'})
+        return membership
+
+    def delete_membership(self, me, id):
+        if id not in self.memberships:
+            return (404, {'message': 'Unknown membership'})
+
+        membership = self.memberships.pop(id)
+        self.trigger('memberships', 'deleted', membership)
+        return (204, None)
+
+    def post(self, room_id, text, person=None, mentions=[], files=[]):
+        """
+        Posts a message on behalf of someone
+
+        :param room_id: the target room
+        :type room_id: str
+
+        :param text: content of the message
+        :type text: str
+
+        :param person: the e-mail address of the sender
+        :type person: str
+
+        :param mentions: ids of persons mentioned in the message
+        :type mentions: list of str
+
+        :param files: links to attached files
+        :type files: list of str
+
+        :return: attributes of the new message
+        :rtype: dict
+
+        This function is used to simulate people chatting with a bot. The
+        sender is added to the room, if needed, and webhooks are notified.
+        """
+        with self.lock:
+            person = self.add_person(email=person)
+            self.join(room_id, person)
+            return self.add_message(room_id, person, text=text,
+                                    mentions=mentions, files=files)
+
+    def add_message(self, room_id, person, text=None, markdown=None,
+                    mentions=[], files=[]):
+        """
+        Adds a message to a room
+
+        :rtype: dict
+        """
+        room = self.rooms[room_id]
+        message = {
+            'id': self.next_id('message'),
+            'roomId': room_id,
+            'roomType': room['type'],
+            'text': text or '',
+            'personId': person['id'],
+            'personEmail': person['emails'][0],
+            'created': self.stamp(),
+        }
+        if markdown:
+            message['markdown'] = markdown
+            message['html'] = markdown
+        if mentions:
+            message['mentionedPeople'] = list(mentions)
+        if files:
+            message['files'] = list(files)
+
+        self.messages[message['id']] = message
+        room['lastActivity'] = message['created']
+        self.trigger('messages', 'created', message)
+        return message
+
+    def list_messages(self, me):
+        room_id = request.query.get('roomId')
+        if room_id not in self.rooms:
+            return (404, {'message': 'Unknown room'})
+
+        mentioned = request.query.get('mentionedPeople')
+        if mentioned == 'me':
+            mentioned = me['id']
+        before = request.query.get('beforeMessage')
+        size = int(request.query.get('max', self.PAGE_SIZE))
+
+        items = []
+        for message in reversed(list(self.messages.values())):
+            if message['roomId'] != room_id:
+                continue
+            if before:
+                if message['id'] == before:
+                    before = None
+                continue
+            if mentioned and mentioned not in message.get('mentionedPeople',
+                                                          []):
+                continue
+            items.append(message)
+
+        if len(items) > size:
+            query = dict(request.query)
+            query['max'] = size
+            query['beforeMessage'] = items[size-1]['id']
+            url = request.urlparts
+            link = u"{}://{}{}?{}".format(url.scheme,
+                                         url.netloc,
+                                         url.path,
+                                         urlencode(sorted(query.items())))
+            response.set_header('Link', u'<{}>; rel="next"'.format(link))
+            items = items[:size]
+
+        return {'items': items}
+
+    def create_message(self, me):
+        data = request.json or {}
+
+        room_id = data.get('roomId')
+        if not room_id and data.get('toPersonEmail'):
+            person = self.add_person(email=data['toPersonEmail'])
+            room_id = self.direct_room(me, person)['id']
+
+        if room_id not in self.rooms:
+            return (404, {'message': 'Unknown room'})
+
+        return self.add_message(room_id,
+                                me,
+                                text=data.get('text'),
+                                markdown=data.get('markdown'),
+                                files=data.get('files', []))
+
+    def direct_room(self, me, person):
+        """
+        Finds or creates a direct room between two persons
+
+        :rtype: dict
+        """
+        for room in self.rooms.values():
+            if room['type'] != 'direct':
+                continue
+            if (self.find_membership(room['id'], me['id'])
+                    and self.find_membership(room['id'], person['id'])):
+                return room
+
+        room = {
+            'id': self.next_id('room'),
+            'title': person['displayName'],
+            'type': 'direct',
+            'isLocked': False,
+            'lastActivity': self.stamp(),
+            'created': self.stamp(),
+            'creatorId': me['id'],
+        }
+        self.rooms[room['id']] = room
+        self.join(room['id'], me)
+        self.join(room['id'], person)
+        return room
+
+    def get_message(self, me, id):
+        if id not in self.messages:
+            return (404, {'message': 'Unknown message'})
+        return self.messages[id]
+
+    def delete_message(self, me, id):
+        if id not in self.messages:
+            return (404, {'message': 'Unknown message'})
+        del self.messages[id]
+        return (204, None)
+
+    def list_webhooks(self, me):
+        items = [x for x in self.webhooks.values()
+                 if x['ownerId'] == me['id']]
+        return {'items': items}
+
+    def create_webhook(self, me):
+        data = request.json or {}
+        for key in ('name', 'targetUrl', 'resource', 'event'):
+            if not data.get(key):
+                return (400, {'message': u"Missing {}".format(key)})
+
+        webhook = {
+            'id': self.next_id('webhook'),
+            'name': data['name'],
+            'targetUrl': data['targetUrl'],
+            'resource': data['resource'],
+            'event': data['event'],
+            'ownerId': me['id'],
+            'status': 'active',
+            'created': self.stamp(),
+        }
+        self.webhooks[webhook['id']] = webhook
+        return webhook
+
+    def delete_webhook(self, me, id):
+        if id not in self.webhooks:
+            return (404, {'message': 'Unknown webhook'})
+        del self.webhooks[id]
+        return (204, None)
+
+    def trigger(self, resource, event, data):
+        """
+        Queues notifications for matching webhooks
+
+        :param resource: 'messages' or 'memberships'
+        :type resource: str
+
+        :param event: 'created' or 'deleted'
+        :type event: str
+
+        :param data: attributes of the resource
+        :type data: dict
+
+        """
+        for webhook in self.webhooks.values():
+            if webhook['resource'] != resource:
+                continue
+            if webhook['event'] not in ('all', event):
+                continue
+            if not self.find_membership(data['roomId'], webhook['ownerId']):
+                if not (resource == 'memberships' and event == 'deleted'):
+                    continue
+
+            notification = {
+                'id': webhook['id'],
+                'name': webhook['name'],
+                'resource': resource,
+                'event': event,
+                'actorId': data.get('personId'),
+                'createdBy': webhook['ownerId'],
+                'data': data.copy(),
+            }
+            self.notifications.put((webhook['targetUrl'], notification))
+
+    def notify(self):
+        """
+        Posts notifications to webhooks, in the order of events
+
+        This function is running in the background until a ``None`` is
+        pushed to the queue of notifications.
+        """
+        session = requests.Session()
+        while True:
+            item = self.notifications.get()
+            if item is None:
+                break
+
+            (url, notification) = item
+            try:
+                session.post(url, json=notification, timeout=10)
+                with self.lock:
+                    self.counters['notifications'] += 1
+
+            except Exception as feedback:
+                logging.warning(u"Unable to notify {}".format(url))
+                logging.debug(feedback)
@@ -15,6 +15,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import io
+import itertools
+import json
 import logging
 from multiprocessing import Process, Queue
 import os
@@ -23,8 +26,9 @@ import sys
 import time
 
 from shellbot.channel import Channel
-from shellbot.events import Message
+from shellbot.events import Event, Message, Join, Leave
 from shellbot.i18n import _
+from shellbot.tracing import tracer
 from .base import Space
 
 
@@ -51,17 +55,37 @@ class LocalSpace(Space):
     so that you can play interactively with your bot. This setup is handy
     since it does not require access to a real chat back-end.
 
+    Events recorded from a real chat space can also be replayed, for example
+    to profile a bot under realistic load. The file contains one event per
+    line, in JSON, as produced by ``str(event)``. Messages, joins and leaves
+    can be related to any channel and to any person::
+
+        {"type": "message", "text": "shelly help", "from_id": "*123", ...
+        {"type": "join", "actor_id": "*456", "channel_id": "*channel", ...
+
+    Example of a replay at 200 events per second::
+
+        engine = Engine(command=Hello(), type='local')
+        engine.configure({'space': {'replay': 'capture.json',
+                                    'replay_rate': 200}})
+        engine.run()
+
     """
 
     DEFAULT_PROMPT = u'> '
 
-    def on_init(self, input=None, **kwargs):
+    REPLAY_BATCH = 500  # events pushed on each pull, when there is no rate
+
+    def on_init(self, input=None, replay=None, **kwargs):
         """
         Handles extended initialisation parameters
 
         :param input: Lines of text to be submitted to the chat
         :type input: str or list of str
 
+        :param replay: Path of a file with recorded events
+        :type replay: str
+
         Example::
 
             space = LocalSpace(input='hello world')
@@ -73,6 +97,13 @@ class LocalSpace(Space):
         self.input = []
         self.push(input)
 
+        if replay:
+            self.context.set('space.replay', replay)
+
+        self._events = None  # set by check() in replay mode
+        self._replay_started = None
+        self._replayed = 0
+
         self.prompt = self.DEFAULT_PROMPT
 
         self.participants = []
@@ -81,6 +112,11 @@ class LocalSpace(Space):
         """
         Adds processing on engine start
         """
+        if self.context.get('space.replay'):
+            logging.info(u"Replaying events from '{}'".format(
+                self.context.get('space.replay')))
+            return
+
         sys.stdout.write(_(u"Type 'help' for guidance, or Ctl-C to exit.")+'\n')
         sys.stdout.flush()
 
@@ -107,17 +143,33 @@ class LocalSpace(Space):
         the context accordingly.
 
         This function also selects the right input for this local space.
-        If some content has been provided during initialisation, it is used
-        to simulate user input. Else stdin is read one line at a time.
+        If ``space.replay`` has been set, recorded events are read from this
+        file. If some content has been provided during initialisation, it is
+        used to simulate user input. Else stdin is read one line at a time.
+
+        This function handles following parameters:
+
+        * ``space.replay`` - path of a file with recorded events, one JSON
+          object per line. Empty lines and lines starting with ``#`` are
+          ignored.
+
+        * ``space.replay_rate`` - number of events to replay per second.
+          Events are replayed as fast as possible by default.
+
         """
         self.context.check('space.title',
                            _(u'Collaboration space'), filter=True)
         self.context.check('space.participants',
                            '$CHANNEL_DEFAULT_PARTICIPANTS', filter=True)
+        self.context.check('space.replay', filter=True)
+        self.context.check('space.replay_rate', 0)
 
         self.context.set('server.binding', None)  # no web server at all
 
-        if self.input:
+        if self.context.get('space.replay'):
+            self._events = self.read_events(self.context.get('space.replay'))
+
+        elif self.input:
 
             def read_list():
                 for line in self.input:
@@ -336,21 +388,31 @@ class LocalSpace(Space):
         """
         Fetches updates
 
+        :return: the number of new items
+        :rtype: int
+
         This function senses most recent item, and pushes it
         to the listening queue.
 
+        In replay mode, all recorded events that are due are pushed at once.
         """
+        if self._events is not None:
+            return self.replay()
+
         sys.stdout.write(self.prompt)
         sys.stdout.flush()
 
         try:
             line = next(self._lines)
             self.on_message({'text': line}, self.ears)
+            return 1
+
         except StopIteration:
             sys.stdout.write(u'^C\n')
             sys.stdout.flush()
             time.sleep(1.0)
             self.context.set('general.switch', 'off')
+            return 0
 
     def on_message(self, item, queue):
         """
@@ -370,5 +432,87 @@ class LocalSpace(Space):
         message.mentioned_ids = [self.context.get('bot.id')]
         message.channel_id = '*local'
 
+        tracer.mark(message, 'ears')
+
         logging.debug(u"- putting message to ears")
         queue.put(str(message))
+
+    def read_events(self, path):
+        """
+        Reads recorded events
+
+        :param path: path of the file to read
+        :type path: str
+
+        :return: an iterator of dict
+
+        Empty lines and lines starting with ``#`` are skipped.
+        """
+        with io.open(path, 'r', encoding='utf-8') as handle:
+            for line in handle:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                yield json.loads(line)
+
+    def replay(self):
+        """
+        Pushes recorded events to the listening queue
+
+        :return: the number of events pushed, or None if none is due yet
+        :rtype: int
+
+        If ``space.replay_rate`` has been set, events are pushed as soon
+        as they are due since the beginning of the replay. Else up to
+        ``REPLAY_BATCH`` events are pushed on each call.
+
+        At the end of the file, the listening queue is drained and then
+        the engine is stopped.
+        """
+        rate = self.context.get('space.replay_rate', 0)
+        if self._replay_started is None:
+            self._replay_started = time.time()
+
+        if rate:
+            elapsed = time.time() - self._replay_started
+            due = int(elapsed * rate) + 1 - self._replayed
+        else:
+            due = self.REPLAY_BATCH
+
+        if due < 1:
+            return None
+
+        count = 0
+        for item in itertools.islice(self._events, due):
+            self.on_event(item, self.ears)
+            count += 1
+        self._replayed += count
+
+        if count < due:
+            logging.info(u"Replayed {} events".format(self._replayed))
+            while not self.ears.empty():
+                time.sleep(self.PULL_INTERVAL)
+            time.sleep(1.0)
+            self.context.set('general.switch', 'off')
+
+        return count
+
+    def on_event(self, item, queue):
+        """
+        Pushes a recorded event to the listener
+
+        :param item: attributes of the recorded event
+        :type item: dict
+
+        :param queue: the processing queue
+        :type queue: Queue
+
+        Events that are not related to a channel are put in ``*local``.
+        """
+        classes = {'message': Message, 'join': Join, 'leave': Leave}
+        event = classes.get(item.get('type'), Event)(item)
+        if not event.get('channel_id'):
+            event.channel_id = '*local'
+
+        tracer.mark(event, 'ears')
+        queue.put(str(event))
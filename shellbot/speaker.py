@@ -15,10 +15,19 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import logging
 from multiprocessing import Process
 from six import string_types
+from six.moves.queue import Empty, Queue as ThreadQueue
+from threading import Thread
 import time
+import zlib
+
+from .logger import Logger
+from .profiler import profiler
+from .tracing import tracer
+
+
+logger = Logger(__name__)
 
 
 class Vibes(object):
@@ -27,12 +36,17 @@ class Vibes(object):
                  content=None,
                  file=None,
                  channel_id=None,
-                 person=None):
+                 person=None,
+                 priority='normal'):
         self.text = text
         self.content = content
         self.file = file
         self.channel_id = channel_id
         self.person = person
+        self.priority = priority
+        self.key = None  # set on journaling
+        self.keys = []  # set on merging
+        self.trace = None  # set on tracing
 
     def __str__(self):
         """
@@ -45,10 +59,69 @@ class Vibes(object):
 class Speaker(Process):
     """
     Sends updates to a business messaging space
+
+    By default updates are posted one at a time. With a slow messaging
+    platform, it is more efficient to post updates to different channels
+    concurrently, and this is done by a pool of threads:
+
+    * ``speaker.workers`` - the number of threads that post updates.
+      Default value is 1, meaning that updates are posted directly by the
+      speaker.
+
+    * ``speaker.backlog`` - the number of updates waiting for each thread.
+      Default value is 10.
+
+    Updates are assigned to threads by channel, or by person for direct
+    messages, so that order is kept within each channel. When all
+    threads are busy, the speaker stops reading the queue ``mouth`` until
+    some update has been posted.
+
+    Example::
+
+        engine.configure({'speaker': {'workers': 8}})
+
+    Bursts of updates can also be merged before being posted, so that the
+    messaging platform is requested less often:
+
+    * ``speaker.coalesce`` - the time, in seconds, during which consecutive
+      updates to the same channel are merged together. Default value is 0,
+      meaning that updates are never merged.
+
+    Updates with a file attachment are never merged, and merged updates
+    do not exceed ``COALESCE_LIMIT`` characters.
+
+    Example::
+
+        engine.configure({'speaker': {'coalesce': 0.2}})
+
+    Updates have a priority, either ``interactive``, ``normal`` or
+    ``bulk``, and each priority has its own queue in the engine. Queues are
+    served in weighted round-robin, so that a large broadcast does not
+    delay interactive responses:
+
+    * ``speaker.weights`` - the number of updates taken from each queue
+      in one round. Default is 4 interactive, 2 normal and 1 bulk.
+
+    Example::
+
+        engine.configure({'speaker': {'weights': {'interactive': 8,
+                                                  'normal': 2,
+                                                  'bulk': 1}}})
+
     """
 
     EMPTY_DELAY = 0.005   # time to wait if queue is empty
 
+    WORKERS = 1  # threads posting updates
+
+    BACKLOG = 10  # updates waiting for each thread
+
+    COALESCE_LIMIT = 7000  # below the size limit of Cisco Spark messages
+
+    PRIORITIES = ('interactive', 'normal', 'bulk')
+
+    WEIGHTS = {'interactive': 4, 'normal': 2, 'bulk': 1}
+
     def __init__(self, engine=None):
         """
         Sends updates to a business messaging space
@@ -59,6 +132,11 @@ class Speaker(Process):
         """
         Process.__init__(self)
         self.engine = engine
+        self.lanes = []
+        self.workers = []
+        self.pending = {}
+        self.schedule = []
+        self.cursor = 0
 
     def run(self):
         """
@@ -84,30 +162,339 @@ class Speaker(Process):
             engine.mouth.put(None)
 
         """
-        logging.info(u"Starting speaker")
+        logger.info(u"Starting speaker")
+        profiler.start(self.engine.context, 'speaker')
+
+        self.start_workers()
+        self.replay()
+        window = self.engine.get('speaker.coalesce', 0)
+        self.schedule = self.build_schedule(
+            self.engine.get('speaker.weights', self.WEIGHTS))
 
         try:
             self.engine.set('speaker.counter', 0)
             while self.engine.get('general.switch', 'on') == 'on':
 
-                if self.engine.mouth.empty():
+                if self.pending:
+                    self.release()
+
+                try:
+                    item = self.get_item()
+                except Empty:
                     time.sleep(self.EMPTY_DELAY)
                     continue
 
+                started = time.time()
                 try:
-                    item = self.engine.mouth.get(True, 0.1)
                     if item is None:
                         break
 
-                    self.process(item)
+                    if window:
+                        self.coalesce(item, window)
+                    else:
+                        self.submit(item)
 
                 except Exception as feedback:
-                    logging.exception(feedback)
+                    logger.exception(feedback)
+                    self.engine.deadletters.add('speaker', item, feedback,
+                                                started)
 
         except KeyboardInterrupt:
             pass
 
-        logging.info(u"Speaker has been stopped")
+        self.release(force=True)
+        self.stop_workers()
+
+        profiler.stop()
+        logger.info(u"Speaker has been stopped")
+
+    def replay(self):
+        """
+        Submits updates that have not been posted before last stop
+
+        This function has no effect if no journal has been configured.
+        """
+        journal = getattr(self.engine, 'journal', None)
+        if not journal:
+            return
+
+        journal.purge()
+        for item in journal.pending():
+            logger.debug(u"- replaying update {}", item.key)
+            self.submit(item)
+
+    def build_schedule(self, weights):
+        """
+        Plans a round of reads from queues of different priorities
+
+        :param weights: number of reads for each priority
+        :type weights: dict
+
+        :return: priorities to read from, in order
+        :rtype: list of str
+
+        Reads are spread across the round, e.g., with weights 4, 2 and 1,
+        the round is ``interactive``, ``normal``, ``interactive``,
+        ``bulk``, ``interactive``, ``normal``, ``interactive``.
+        """
+        weights = dict((x, max(int(weights.get(x, 0)), 0))
+                       for x in self.PRIORITIES)
+        weights['normal'] = max(weights['normal'], 1)  # poison pill is there
+        total = sum(weights.values())
+
+        schedule = []
+        current = dict((x, 0) for x in self.PRIORITIES)
+        for step in range(total):  # smooth weighted round-robin
+            for priority in self.PRIORITIES:
+                current[priority] += weights[priority]
+            selected = max(self.PRIORITIES, key=lambda x: current[x])
+            current[selected] -= total
+            schedule.append(selected)
+
+        return schedule
+
+    def get_item(self):
+        """
+        Takes the next update from queues of the engine
+
+        :return: an update, or None if the speaker should stop
+
+        This function raises ``Empty`` if no update is waiting.
+        """
+        schedule = self.schedule or ['normal']
+        for step in range(len(schedule)):
+            priority = schedule[self.cursor % len(schedule)]
+            self.cursor += 1
+
+            queue = self.engine.get_mouth(priority)
+            if queue is self.engine.mouth and priority != 'normal':
+                continue  # no queue for this priority
+
+            try:
+                return queue.get_nowait()
+            except Empty:
+                pass
+
+        raise Empty()
+
+    def start_workers(self, quantity=None):
+        """
+        Starts threads that post updates concurrently
+
+        :param quantity: number of threads to start (optional)
+        :type quantity: positive integer
+
+        :return: the list of started threads
+
+        If no quantity is provided, the value of ``speaker.workers`` is used,
+        or ``WORKERS`` if this has not been configured. No thread is
+        started for a single worker.
+        """
+        if quantity is None:
+            quantity = self.engine.get('speaker.workers', self.WORKERS)
+
+        if self.workers or quantity < 2:
+            return self.workers
+
+        backlog = self.engine.get('speaker.backlog', self.BACKLOG)
+
+        logger.debug(u"Starting {} speaker workers", quantity)
+        self.lanes = [ThreadQueue(maxsize=backlog)
+                      for index in range(quantity)]
+        for lane in self.lanes:
+            thread = Thread(target=self.work, args=(lane,))
+            thread.daemon = True
+            thread.start()
+            self.workers.append(thread)
+
+        return self.workers
+
+    def stop_workers(self):
+        """
+        Waits for threads to post all their updates
+        """
+        for lane in self.lanes:
+            lane.put(None)
+
+        for thread in self.workers:
+            thread.join()
+
+        self.lanes = []
+        self.workers = []
+
+    def submit(self, item):
+        """
+        Posts one update, directly or through a thread
+
+        :param item: the update to be transmitted
+        :type item: str or object
+
+        This function blocks when the thread in charge of the channel
+        has too many updates to post already.
+        """
+        if not self.lanes:
+            self.process(item)
+            return
+
+        key = self.get_key(item)
+        index = zlib.crc32(key.encode('utf-8')) % len(self.lanes)
+        self.lanes[index].put(item)
+
+    def coalesce(self, item, window):
+        """
+        Delays an update, to merge it with next ones
+
+        :param item: the update to be transmitted
+        :type item: str or object
+
+        :param window: time to wait for other updates, in seconds
+        :type window: float
+
+        """
+        key = self.get_key(item)
+        if key in self.pending:
+            (vibes, deadline) = self.pending[key]
+            merged = self.merge(vibes, item)
+            if merged:
+                self.pending[key] = (merged, deadline)
+                return
+
+            del self.pending[key]
+            self.flush(vibes)  # keep order in this channel
+
+        if isinstance(item, Vibes) and not item.file:
+            self.pending[key] = (item, time.time() + window)
+
+        else:
+            self.submit(item)
+
+    def merge(self, first, second):
+        """
+        Merges two updates into a single one
+
+        :param first: an update waiting to be transmitted
+        :type first: Vibes
+
+        :param second: the next update to the same channel
+        :type second: Vibes
+
+        :return: the merged update, or None
+        :rtype: Vibes
+
+        Updates cannot be merged if the second one has a file attachment,
+        or if the result would be too large.
+        """
+        if not isinstance(second, Vibes) or second.file:
+            return None
+
+        text = u'\n'.join(x for x in (first.text, second.text) if x)
+
+        content = None
+        if first.content or second.content:
+            content = u'\n\n'.join(x for x in (first.content or first.text,
+                                                 second.content or second.text)
+                                     if x)
+
+        if max(len(text), len(content or '')) > self.COALESCE_LIMIT:
+            return None
+
+        merged = Vibes(text=text or None,
+                       content=content,
+                       channel_id=first.channel_id,
+                       person=first.person,
+                       priority=first.priority)
+        merged.trace = first.trace
+        merged.keys = self.get_keys(first) + self.get_keys(second)
+        return merged
+
+    def release(self, force=False):
+        """
+        Posts updates that have been delayed long enough
+
+        :param force: post all delayed updates, whatever their age
+        :type force: bool
+
+        Updates that cannot be posted are captured as dead letters, so that
+        the speaker keeps running.
+        """
+        now = time.time()
+        for key in list(self.pending.keys()):
+            (vibes, deadline) = self.pending[key]
+            if force or deadline <= now:
+                del self.pending[key]
+                self.flush(vibes)
+
+    def flush(self, vibes):
+        """
+        Posts an update that has been delayed
+
+        :param vibes: the update to be transmitted
+        :type vibes: Vibes
+
+        Exceptions are captured here, because the update is not the item
+        that the speaker is currently handling.
+        """
+        started = time.time()
+        try:
+            self.submit(vibes)
+
+        except Exception as feedback:
+            logger.exception(feedback)
+            self.engine.deadletters.add('speaker', vibes, feedback, started)
+
+    def get_keys(self, item):
+        """
+        Lists journal keys of an update
+
+        :param item: the update to be transmitted
+        :type item: str or object
+
+        :return: keys of all updates merged into this one
+        :rtype: list of str
+        """
+        keys = getattr(item, 'keys', None)
+        if keys:
+            return list(keys)
+
+        key = getattr(item, 'key', None)
+        return [key] if key else []
+
+    def get_key(self, item):
+        """
+        Identifies the recipient of an update
+
+        :param item: the update to be transmitted
+        :type item: str or object
+
+        :return: the channel id, or the person, or ``*default``
+        :rtype: str
+        """
+        return (getattr(item, 'channel_id', None)
+                or getattr(item, 'person', None)
+                or u'*default')
+
+    def work(self, lane):
+        """
+        Posts updates received from the speaker
+
+        :param lane: the updates assigned to this thread
+        :type lane: Queue
+
+        This function is looping in a background thread, until
+        it gets None from the queue.
+        """
+        while True:
+            item = lane.get()
+            if item is None:
+                break
+
+            started = time.time()
+            try:
+                self.process(item)
+
+            except Exception as feedback:
+                logger.exception(feedback)
+                self.engine.deadletters.add('speaker', item, feedback, started)
 
     def process(self, item):
         """
@@ -119,16 +506,35 @@ class Speaker(Process):
         """
 
         counter = self.engine.context.increment('speaker.counter')
-        logging.debug(u'Speaker is working on {}'.format(counter))
+        logger.debug(u'Speaker is working on {}', counter)
+
+        tracer.mark(item, 'speaker')
+
+        journal = getattr(self.engine, 'journal', None)
+        keys = self.get_keys(item) if journal else []
+        if keys and all(journal.is_posted(x) for x in keys):
+            logger.debug(u"- already posted, thrown away")
+            return
 
+        posted = None
         if self.engine.space is not None:
             if isinstance(item, string_types):
                 self.engine.space.post_message(id='*default', text=item)
             else:
-                self.engine.space.post_message(id=item.channel_id,
-                                               text=item.text,
-                                               content=item.content,
-                                               file=item.file,
-                                               person=item.person)
+                posted = self.engine.space.post_message(
+                    id=item.channel_id,
+                    text=item.text,
+                    content=item.content,
+                    file=item.file,
+                    person=item.person)
         else:
-            logging.info(item)
+            logger.info(item)
+
+        for key in keys:
+            if posted is False:
+                journal.fail(key)
+            else:
+                journal.complete(key)
+
+        tracer.export(item, 'posted',
+                      channel_id=getattr(item, 'channel_id', None))
@@ -0,0 +1,517 @@
+# -*- coding: utf-8 -*-
+
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import binascii
+from collections import deque
+import io
+import json
+import os
+from six import string_types
+from threading import Lock, local
+import time
+
+from .logger import Logger
+
+
+logger = Logger(__name__)
+
+try:
+    clock = time.monotonic  # shared by all processes of the system
+except AttributeError:  # python 2.7
+    clock = time.time
+
+
+class Sink(object):
+    """
+    Receives completed spans
+
+    A span is a dict with following keys:
+
+    * ``trace_id`` -- shared by all spans related to the same inbound event
+    * ``span_id`` -- unique identifier of this span
+    * ``parent_id`` -- identifier of the previous span, or None
+    * ``name`` -- the stage measured by this span, e.g., ``listener``
+    * ``start`` and ``end`` -- monotonic time stamps, in seconds
+    * ``attributes`` -- a dict of additional information
+
+    Provide your own implementation in a sub-class where required.
+
+    Example::
+
+        class MySink(Sink):
+            def put(self, spans):
+                for span in spans:
+                    statsd.timing(span['name'], span['end'] - span['start'])
+
+        tracer.sink = MySink()
+
+    """
+
+    def put(self, spans):
+        """
+        Handles some spans
+
+        :param spans: completed spans
+        :type spans: list of dict
+
+        """
+        raise NotImplementedError()
+
+
+class MemorySink(Sink):
+    """
+    Keeps most recent spans in memory
+
+    This is a ring of spans, where oldest spans are dropped silently. It
+    is visible only from the process that has completed spans.
+
+    Example::
+
+        sink = MemorySink(size=100)
+        tracer.sink = sink
+        ...
+        for span in sink.spans():
+            print(span['name'])
+
+    """
+
+    def __init__(self, size=1000):
+        """
+        Keeps most recent spans in memory
+
+        :param size: maximum number of spans to remember
+        :type size: positive int
+
+        """
+        assert size > 0
+        self.ring = deque(maxlen=size)
+
+    def put(self, spans):
+        self.ring.extend(spans)
+
+    def spans(self):
+        """
+        Lists remembered spans
+
+        :return: spans, from the oldest to the most recent one
+        :rtype: list of dict
+        """
+        return list(self.ring)
+
+
+class FileSink(Sink):
+    """
+    Appends spans to a file
+
+    Each span is written as a JSON object on a single line, so that
+    multiple processes can append safely to the same file.
+
+    Example::
+
+        tracer.sink = FileSink(path='/var/log/shellbot-spans.json')
+
+    """
+
+    def __init__(self, path='shellbot-spans.json'):
+        """
+        Appends spans to a file
+
+        :param path: the file to append to
+        :type path: str
+
+        """
+        self.path = path
+        self.lock = Lock()
+
+    def put(self, spans):
+        lines = u''.join(self.format(span) + u'\n' for span in spans)
+        with self.lock:
+            with io.open(self.path, 'a', encoding='utf-8') as handle:
+                handle.write(lines)
+
+    def format(self, span):
+        """
+        Formats one span
+
+        :param span: a completed span
+        :type span: dict
+
+        :return: a line of text
+        :rtype: str
+
+        """
+        return u'{}'.format(json.dumps(span, sort_keys=True))
+
+
+class OtelSink(FileSink):
+    """
+    Appends spans to a file, in the OpenTelemetry format
+
+    Each line is an export request in the JSON encoding of the
+    OpenTelemetry protocol (OTLP), that can be submitted as-is to an
+    OpenTelemetry collector, or loaded by the file receiver of the collector.
+
+    Example::
+
+        tracer.sink = OtelSink(path='/var/log/shellbot-otlp.json')
+
+    """
+
+    SERVICE_NAME = 'shellbot'
+
+    def put(self, spans):
+        if not spans:
+            return
+
+        offset = time.time() - clock()  # monotonic to wall clock
+        request = {
+            'resourceSpans': [{
+                'resource': {'attributes': [
+                    self.attribute('service.name', self.SERVICE_NAME)]},
+                'scopeSpans': [{
+                    'scope': {'name': 'shellbot'},
+                    'spans': [self.convert(x, offset) for x in spans],
+                }],
+            }],
+        }
+
+        line = u'{}\n'.format(json.dumps(request, sort_keys=True))
+        with self.lock:
+            with io.open(self.path, 'a', encoding='utf-8') as handle:
+                handle.write(line)
+
+    def convert(self, span, offset=0.0):
+        """
+        Converts one span to the OpenTelemetry format
+
+        :param span: a completed span
+        :type span: dict
+
+        :param offset: to change monotonic time stamps to wall clock
+        :type offset: float
+
+        :return: dict
+        """
+        converted = {
+            'traceId': span['trace_id'],
+            'spanId': span['span_id'],
+            'name': span['name'],
+            'kind': 1,  # internal
+            'startTimeUnixNano': str(int((span['start'] + offset) * 1e9)),
+            'endTimeUnixNano': str(int((span['end'] + offset) * 1e9)),
+            'attributes': [self.attribute(key, value) for (key, value)
+                           in sorted(span.get('attributes', {}).items())],
+        }
+        if span.get('parent_id'):
+            converted['parentSpanId'] = span['parent_id']
+        return converted
+
+    def attribute(self, key, value):
+        """
+        Converts one attribute to the OpenTelemetry format
+
+        :return: dict
+        """
+        if isinstance(value, bool):
+            return {'key': key, 'value': {'boolValue': value}}
+        if isinstance(value, int):
+            return {'key': key, 'value': {'intValue': str(value)}}
+        if isinstance(value, float):
+            return {'key': key, 'value': {'doubleValue': value}}
+        return {'key': key, 'value': {'stringValue': u'{}'.format(value)}}
+
+
+class MetricsSink(Sink):
+    """
+    Records span durations in the context
+
+    Each span updates a histogram named after its stage, e.g.,
+    ``metrics.stage.listener``. Histograms are exposed over the web by the
+    route :class:`shellbot.routes.Metrics`.
+
+    Example::
+
+        engine.configure({'tracing': {'sink': 'metrics'}})
+
+    """
+
+    def __init__(self, context):
+        """
+        Records span durations in the context
+
+        :param context: the context that stores histograms
+        :type context: Context
+
+        """
+        self.context = context
+
+    def put(self, spans):
+        for span in spans:
+            self.context.observe(
+                u'metrics.stage.{}'.format(span['name']),
+                span['end'] - span['start'])
+
+
+class Tracer(object):
+    """
+    Measures the processing of inbound events, stage by stage
+
+    A trace is attached to each inbound event, and it is carried through
+    queues as the attribute ``trace`` of the event. At each stage a
+    monotonic time stamp is added to the trace. Updates sent in response
+    to an event inherit from its trace, so that the full path from the
+    webhook down to the speaker can be measured::
+
+        webhook > fetch > ears > listener > shell > command > done
+                                                       |
+                                            mouth > speaker > posted
+
+    Each stage becomes a span that lasts until the next stage. Spans are
+    exported to the sink when the listener is done with an event, and when
+    the speaker has posted an update.
+
+    Tracing is off by default. It is activated by a sink, that is either
+    set directly, or configured in the context:
+
+    * ``tracing.sink`` - either ``memory``, ``file``, ``otel`` or ``metrics``
+
+    * ``tracing.path`` - the file used by ``file`` and ``otel`` sinks.
+      Default value is ``shellbot-spans.json``.
+
+    * ``tracing.size`` - the number of spans kept by a ``memory`` sink.
+      Default value is 1000.
+
+    Example::
+
+        engine.configure({'tracing': {'sink': 'otel',
+                                      'path': '/var/log/shellbot.json'}})
+
+    """
+
+    DEFAULT_PATH = 'shellbot-spans.json'
+    DEFAULT_SIZE = 1000
+
+    def __init__(self, context=None, sink=None):
+        """
+        Measures the processing of inbound events, stage by stage
+
+        :param context: the settings of this engine
+        :type context: Context
+
+        :param sink: the component that receives completed spans
+        :type sink: Sink
+
+        """
+        self.sink = sink
+        self.set_context(context)
+        self.local = local()
+
+    def set_context(self, context):
+        """
+        Uses context settings for tracing
+
+        :param context: the settings of this engine
+        :type context: Context
+
+        """
+        self.context = context
+        self._pid = None  # read settings again on next use
+
+    @property
+    def is_enabled(self):
+        """
+        Checks if events are traced in this process
+
+        :rtype: bool
+
+        Settings are read once per process, so that tracing costs nothing
+        when it has not been activated.
+        """
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._sink = self.sink or self.build_sink()
+
+        return self._sink is not None
+
+    def build_sink(self):
+        """
+        Builds a sink from context settings
+
+        :return: a Sink, or None
+        """
+        if not self.context:
+            return None
+
+        label = self.context.get('tracing.sink')
+        if not label:
+            return None
+
+        if label == 'memory':
+            return MemorySink(size=self.context.get('tracing.size',
+                                                    self.DEFAULT_SIZE))
+
+        if label == 'metrics':
+            return MetricsSink(context=self.context)
+
+        path = self.context.get('tracing.path', self.DEFAULT_PATH)
+        if label == 'file':
+            return FileSink(path=path)
+
+        if label == 'otel':
+            return OtelSink(path=path)
+
+        logger.warning(u"Unknown tracing sink '{}'", label)
+        return None
+
+    @property
+    def current(self):
+        """
+        Provides the trace of the event being processed in this thread
+
+        :rtype: dict or None
+        """
+        return getattr(self.local, 'trace', None)
+
+    @current.setter
+    def current(self, trace):
+        self.local.trace = trace
+
+    def mark(self, item, stage):
+        """
+        Adds a stage to the trace of an item
+
+        :param item: an event, an update, or the dict of a notification
+        :type item: Event or Vibes or dict
+
+        :param stage: the name of the stage that starts now
+        :type stage: str
+
+        :return: the trace of this item, or None if tracing is off
+        :rtype: dict
+
+        If the item has no trace yet, a new one is started and attached
+        to it.
+        """
+        if item is None or isinstance(item, string_types):
+            return None
+
+        if not self.is_enabled:
+            return None
+
+        if isinstance(item, dict):
+            trace = item.get('trace')
+        else:
+            trace = getattr(item, 'trace', None)
+
+        if not trace:
+            trace = {'id': self.new_id(32), 'parent': None, 'stamps': []}
+            if isinstance(item, dict):
+                item['trace'] = trace
+            else:
+                item.trace = trace
+
+        trace['stamps'].append([stage, clock(), self.new_id(16)])
+        return trace
+
+    def inherit(self, item, stage):
+        """
+        Attaches the current trace to an item produced in response
+
+        :param item: an update sent to the chat space
+        :type item: Vibes
+
+        :param stage: the name of the first stage of the item
+        :type stage: str
+
+        :return: the new trace, or None
+
+        The new trace has the same identifier than the current one,
+        and its first span has the last span of the current one as parent.
+        """
+        current = self.current
+        if not current or not current.get('stamps') or not self.is_enabled:
+            return None
+
+        item.trace = {'id': current['id'],
+                      'parent': current['stamps'][-1][2],
+                      'stamps': []}
+        return self.mark(item, stage)
+
+    def export(self, item, stage, **attributes):
+        """
+        Ends the trace of an item and exports its spans
+
+        :param item: an event or an update
+        :type item: Event or Vibes or dict
+
+        :param stage: the name of the final stage
+        :type stage: str
+
+        :param attributes: information added to every span
+
+        :return: the list of exported spans
+        :rtype: list of dict
+
+        Example::
+
+            tracer.export(event, 'done', channel_id=event.channel_id)
+
+        """
+        trace = self.mark(item, stage)
+        if not trace:
+            return []
+
+        attributes['pid'] = os.getpid()
+
+        spans = []
+        parent = trace.get('parent')
+        stamps = trace['stamps']
+        for index in range(len(stamps) - 1):
+            (name, start, span_id) = stamps[index]
+            spans.append({
+                'trace_id': trace['id'],
+                'span_id': span_id,
+                'parent_id': parent,
+                'name': name,
+                'start': start,
+                'end': stamps[index + 1][1],
+                'attributes': attributes,
+            })
+            parent = span_id
+
+        if spans:
+            try:
+                self._sink.put(spans)
+            except Exception as feedback:
+                logger.warning(u"Unable to export spans")
+                logger.exception(feedback)
+
+        return spans
+
+    def new_id(self, length):
+        """
+        Provides a random identifier
+
+        :param length: the number of hexadecimal digits
+        :type length: int
+
+        :rtype: str
+        """
+        return binascii.hexlify(os.urandom(length // 2)).decode('ascii')
+
+
+tracer = Tracer()
@@ -0,0 +1,604 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+End-to-end benchmarks of the engine
+
+A full engine is started with its listener, speaker and observer processes,
+and synthetic messages are injected at the entrance of the pipeline. The
+time of each message is measured again when the related answer reaches
+``Speaker.process()``, or when the audited copy reaches an updater.
+
+Following scenarios are available:
+
+* ``commands`` -- many ``echo`` commands sent to a single channel
+
+* ``rooms`` -- the same commands spread over many channels, so that
+  many bots are created on the fly
+
+* ``input`` -- one ``Input`` state machine per channel, answered once
+
+* ``audit`` -- ``echo`` commands in many channels, with audit enabled
+
+Every scenario runs with a ``local`` space, where messages are pushed
+directly to the listening queue, and with a ``spark`` space, where messages
+are posted to a ``FakeSpark`` stand-in and fetched back over HTTP.
+
+Results are written as JSON, so that runs can be compared between releases.
+A scenario that did not get all its answers in time has an ``error`` field,
+and the program then exits with status 1.
+
+Example::
+
+    python -m tests.benchmarks.bench_engine --output results.json
+
+    python -m tests.benchmarks.bench_engine --space local \\
+        --scenario commands --quantity 5000 --rate 500
+
+"""
+
+import argparse
+import json
+import logging
+import math
+from multiprocessing import Queue
+import os
+import platform
+from six.moves.queue import Empty
+import sys
+import time
+
+import shellbot
+from shellbot import Context, Engine
+from shellbot.events import Message
+from shellbot.machines import MachineFactory
+from shellbot.speaker import Speaker
+from shellbot.updaters import Updater
+
+
+BOT_TOKEN = '*bot*token'
+AUDIT_TOKEN = '*audit*token'
+
+SCENARIOS = ('commands', 'rooms', 'input', 'audit')
+SPACES = ('local', 'spark')
+
+
+class TimingSpeaker(Speaker):
+    """
+    Stamps every update that reaches the speaker
+    """
+
+    def __init__(self, engine=None, timings=None):
+        Speaker.__init__(self, engine=engine)
+        self.timings = timings
+
+    def process(self, item):
+        self.timings.put(('speaker', getattr(item, 'text', item), time.time()))
+        Speaker.process(self, item)
+
+
+class TimingUpdater(Updater):
+    """
+    Stamps every audited event
+    """
+
+    def on_init(self, timings=None, **kwargs):
+        self.timings = timings
+
+    def put(self, event):
+        self.timings.put(('audit', event.text, time.time()))
+
+
+class TimingUpdaterFactory(object):
+    def __init__(self, timings):
+        self.timings = timings
+
+    def get_updater(self, id):
+        return TimingUpdater(timings=self.timings)
+
+
+def percentile(values, ratio):
+    """
+    Computes a percentile with the nearest-rank method
+
+    :param values: sorted measurements
+    :type values: list of float
+
+    :param ratio: the percentile to compute, e.g., 0.99
+    :type ratio: float
+
+    :return: float or None
+    """
+    if not values:
+        return None
+    index = max(0, int(math.ceil(ratio * len(values))) - 1)
+    return values[min(index, len(values) - 1)]
+
+
+def summarize(latencies):
+    """
+    Summarizes a list of latencies
+
+    :param latencies: measurements in seconds
+    :type latencies: list of float
+
+    :return: dict with p50, p99, mean and max, in milliseconds
+    """
+    values = sorted(latencies)
+    if not values:
+        return {'p50': None, 'p99': None, 'mean': None, 'max': None}
+
+    return {
+        'p50': round(1000.0 * percentile(values, 0.50), 3),
+        'p99': round(1000.0 * percentile(values, 0.99), 3),
+        'mean': round(1000.0 * sum(values) / len(values), 3),
+        'max': round(1000.0 * values[-1], 3),
+    }
+
+
+def sequence_of(text):
+    """
+    Extracts the sequence number at the end of some text
+
+    :return: int or None
+    """
+    try:
+        return int(text.split()[-1])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def resident_memory(pid):
+    """
+    Reads the resident memory of a process, in bytes
+
+    :return: int or None if this is not available on this platform
+    """
+    try:
+        with open('/proc/{}/status'.format(pid)) as handle:
+            for line in handle:
+                if line.startswith('VmRSS:'):
+                    return 1024 * int(line.split()[1])
+    except (IOError, OSError, ValueError):
+        pass
+    return None
+
+
+def process_tree(pid):
+    """
+    Lists a process and all its descendants
+
+    :return: list of pids, or only the provided one if /proc is not there
+    """
+    parents = {}
+    try:
+        for name in os.listdir('/proc'):
+            if not name.isdigit():
+                continue
+            try:
+                with open('/proc/{}/stat'.format(name)) as handle:
+                    fields = handle.read().rsplit(')', 1)[1].split()
+                parents[int(name)] = int(fields[1])
+            except (IOError, OSError, IndexError, ValueError):
+                continue
+    except OSError:
+        return [pid]
+
+    tree = [pid]
+    for current in tree:
+        tree += [x for x, y in parents.items() if y == current]
+    return tree
+
+
+class Benchmark(object):
+    """
+    Runs one scenario against a full engine
+    """
+
+    READY_TIMEOUT = 60.0  # to let processes and machines start
+    DRAIN_TIMEOUT = 60.0  # to wait for the last answers
+
+    def __init__(self,
+                 scenario='commands',
+                 space='local',
+                 quantity=1000,
+                 rooms=10,
+                 rate=None,
+                 latency=0.0):
+        """
+        Runs one scenario against a full engine
+
+        :param scenario: one of ``SCENARIOS``
+        :type scenario: str
+
+        :param space: either ``local`` or ``spark``
+        :type space: str
+
+        :param quantity: number of messages to inject
+        :type quantity: int
+
+        :param rooms: number of channels for multi-channel scenarios
+        :type rooms: int
+
+        :param rate: messages per second, or None to inject at full speed
+        :type rate: float
+
+        :param latency: delay added to every call of the Spark stand-in
+        :type latency: float
+
+        """
+        assert scenario in SCENARIOS
+        self.scenario = scenario
+
+        assert space in SPACES
+        self.space = space
+
+        if scenario == 'commands':
+            rooms = 1
+        elif scenario == 'input':
+            quantity = rooms  # one answer per machine
+
+        self.quantity = quantity
+        self.rooms = rooms
+        self.rate = rate
+        self.latency = latency
+
+        self.timings = Queue()
+        self.fake = None
+        self.engine = None
+        self.channels = []
+        self.sent = {}
+        self.received = {'speaker': {}, 'audit': {}}
+
+    def run(self):
+        """
+        Runs the scenario
+
+        :return: measurements
+        :rtype: dict
+        """
+        self.before = set(process_tree(os.getpid()))  # from other runs
+        self.build()
+        try:
+            self.engine.start()
+            if self.space == 'spark':
+                self.engine.space.start_fetchers()
+
+            self.wait_for_ready()
+            baseline = resident_memory(self.engine.listener.pid)
+
+            started = time.time()
+            self.inject()
+            complete = self.drain()
+            duration = max(self.received['speaker'].values()
+                           or [time.time()]) - started
+
+            result = self.report(duration, baseline)
+            if not complete:
+                result['error'] = self.describe_missing()
+            return result
+
+        finally:
+            self.stop()
+
+    def build(self):
+        """
+        Builds an engine for the scenario
+        """
+        context = Context()
+        settings = {
+            'bot': {'name': 'shelly'},
+            'space': {'title': 'Benchmark', 'room': 'Benchmark'},
+            'server': {'binding': None},
+        }
+
+        if self.space == 'spark':
+            from shellbot.spaces.fakespark import FakeSpark
+            self.fake = FakeSpark(latency=self.latency, seed=0)
+            self.fake.start()
+            self.fake.add_person(email='shelly@fake.spark',
+                                 name='shelly',
+                                 token=BOT_TOKEN)
+            settings['space']['token'] = BOT_TOKEN
+            settings['space']['api_url'] = self.fake.url
+            if self.scenario == 'audit':
+                self.auditor = self.fake.add_person(email='audit@fake.spark',
+                                                    name='auditor',
+                                                    token=AUDIT_TOKEN)
+                settings['space']['audit_token'] = AUDIT_TOKEN
+
+        machine_factory = None
+        if self.scenario == 'input':
+            machine_factory = MachineFactory(module='shellbot.machines.input',
+                                             question='Value?',
+                                             on_answer='{}')
+
+        updater_factory = None
+        if self.scenario == 'audit':
+            updater_factory = TimingUpdaterFactory(self.timings)
+
+        self.engine = Engine(context=context,
+                             type=self.space,
+                             command='shellbot.commands.echo',
+                             machine_factory=machine_factory,
+                             updater_factory=updater_factory)
+        self.engine.configure(settings)
+        self.engine.speaker = TimingSpeaker(engine=self.engine,
+                                            timings=self.timings)
+
+        for index in range(self.rooms):
+            if self.space == 'spark':
+                channel = self.engine.space.create(
+                    title=u'Benchmark {}'.format(index))
+                id = channel.id
+                if self.scenario == 'audit':
+                    self.fake.join(id, self.auditor)
+            else:
+                id = u'*local-{}'.format(index)
+            self.channels.append(id)
+
+            self.engine.bots_to_load.add(id)
+            if self.scenario == 'audit':
+                self.engine.set(u'audit.switch.{}'.format(id), 'on')
+
+    def wait_for_ready(self):
+        """
+        Waits for bots and machines to be loaded
+        """
+        expected = len(self.channels)
+        deadline = time.time() + self.READY_TIMEOUT
+        while time.time() < deadline:
+            if self.scenario == 'input':  # machines listen to their channel
+                loaded = len([x for x in self.channels
+                              if time.time() - self.engine.get('fan.'+x, 0)
+                              < self.engine.listener.FRESH_DURATION])
+            else:
+                loaded = len(self.engine.get('bots.ids', []))
+
+            if loaded >= expected:
+                return
+            time.sleep(0.05)
+
+        raise Exception(u"Engine is not ready after {} seconds".format(
+            self.READY_TIMEOUT))
+
+    def inject(self):
+        """
+        Pushes messages at the entrance of the engine
+        """
+        name = self.engine.get('bot.name')
+        bot_id = self.engine.get('bot.id')
+        started = time.time()
+        for index in range(self.quantity):
+            if self.rate:
+                delay = index / float(self.rate) - (time.time() - started)
+                if delay > 0:
+                    time.sleep(delay)
+
+            channel_id = self.channels[index % len(self.channels)]
+            if self.scenario == 'input':
+                text = u'{}'.format(index)
+            else:
+                text = u'{} echo {}'.format(name, index)
+
+            self.sent[index] = time.time()
+            if self.space == 'spark':
+                message = self.fake.post(channel_id,
+                                         text,
+                                         person='person@acme.com',
+                                         mentions=[bot_id])
+                self.notify('shellbot-messages', message)
+                if self.scenario == 'audit':
+                    self.notify('shellbot-audit', message)
+
+            else:
+                message = Message({'type': 'message',
+                                   'text': text,
+                                   'from_id': '*user',
+                                   'mentioned_ids': [bot_id],
+                                   'channel_id': channel_id})
+                self.engine.ears.put(str(message))
+                if self.scenario == 'audit':
+                    self.engine.fan.put(str(message))
+
+    def notify(self, name, message):
+        """
+        Submits a notification to the Spark space, as the web hook would do
+        """
+        self.engine.space.webhook(item={
+            'name': name,
+            'resource': 'messages',
+            'event': 'created',
+            'data': {'id': message['id'],
+                     'roomId': message['roomId'],
+                     'personId': message['personId']},
+        })
+
+    def collect(self):
+        """
+        Collects stamps recorded by engine processes
+        """
+        while True:
+            try:
+                (kind, text, stamp) = self.timings.get_nowait()
+            except Empty:
+                return
+
+            index = sequence_of(text)
+            if index is not None:
+                self.received[kind].setdefault(index, stamp)
+
+    def drain(self):
+        """
+        Waits until all answers have been stamped
+
+        :return: True if all answers have been received, False on timeout
+        :rtype: bool
+        """
+        deadline = time.time() + self.DRAIN_TIMEOUT
+        while time.time() < deadline:
+            self.collect()
+            if not self.describe_missing():
+                return True
+            time.sleep(0.05)
+
+        self.collect()
+        return not self.describe_missing()
+
+    def describe_missing(self):
+        """
+        Describes answers that have not been received
+
+        :return: a message, or None if all answers have been received
+        :rtype: str
+        """
+        if len(self.received['speaker']) < self.quantity:
+            return u"Received {} answers out of {}".format(
+                len(self.received['speaker']), self.quantity)
+
+        if (self.scenario == 'audit'
+                and len(self.received['audit']) < self.quantity):
+            return u"Audited {} messages out of {}".format(
+                len(self.received['audit']), self.quantity)
+
+        return None
+
+    def report(self, duration, baseline):
+        """
+        Computes measurements of the run
+
+        :return: dict
+        """
+        processes = [x for x in process_tree(os.getpid())
+                     if x == os.getpid() or x not in self.before]
+        memory = [resident_memory(x) for x in processes]
+
+        bots = len(self.engine.get('bots.ids', [])) or 1
+        current = resident_memory(self.engine.listener.pid)
+        per_bot = None
+        if baseline and current:
+            per_bot = max(0, current - baseline) // bots
+
+        def latencies(kind):
+            return [stamp - self.sent[index]
+                    for index, stamp in self.received[kind].items()
+                    if index in self.sent]
+
+        result = {
+            'scenario': self.scenario,
+            'space': self.space,
+            'rate': self.rate,
+            'sent': len(self.sent),
+            'received': len(self.received['speaker']),
+            'bots': bots,
+            'duration': round(duration, 3),
+            'throughput': (round(len(self.received['speaker']) / duration, 1)
+                           if duration > 0 else None),
+            'latency': summarize(latencies('speaker')),
+            'memory': {
+                'per_bot': per_bot,
+                'listener': current,
+                'total': sum(x for x in memory if x),
+            },
+            'processes': len(processes),
+        }
+
+        if self.scenario == 'audit':
+            result['audited'] = len(self.received['audit'])
+            result['audit_latency'] = summarize(latencies('audit'))
+
+        if self.fake:
+            result['api'] = dict(self.fake.counters)
+
+        return result
+
+    def stop(self):
+        """
+        Stops the engine and related processes
+        """
+        if self.engine:
+            self.engine.context.set('general.switch', 'off')
+            for process in (self.engine.speaker,
+                            self.engine.listener,
+                            self.engine.observer,
+                            self.engine.publisher):
+                if process.pid is None:
+                    continue
+                process.join(2.0)
+                if process.is_alive():
+                    process.terminate()
+
+            for process in getattr(self.engine.space, 'fetchers', []):
+                process.join(2.0)
+                if process.is_alive():
+                    process.terminate()
+
+        if self.fake:
+            self.fake.stop()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='End-to-end benchmarks of shellbot')
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                        help='scenario to run, default is all of them')
+    parser.add_argument('--space', action='append', choices=SPACES,
+                        help='space to use, default is all of them')
+    parser.add_argument('--quantity', type=int, default=1000,
+                        help='number of messages for each scenario')
+    parser.add_argument('--rooms', type=int, default=10,
+                        help='number of channels for multi-channel scenarios')
+    parser.add_argument('--rate', type=float, default=None,
+                        help='messages per second, default is full speed')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='delay of each call to the Spark stand-in')
+    parser.add_argument('--output', default=None,
+                        help='file where JSON results are written')
+    options = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.ERROR)
+
+    results = {
+        'shellbot': shellbot.__version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'started': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'results': [],
+    }
+
+    output = sys.stdout
+    sys.stdout = open(os.devnull, 'w')  # local space prints everything
+    try:
+        for space in options.space or SPACES:
+            for scenario in options.scenario or SCENARIOS:
+                benchmark = Benchmark(scenario=scenario,
+                                      space=space,
+                                      quantity=options.quantity,
+                                      rooms=options.rooms,
+                                      rate=options.rate,
+                                      latency=options.latency)
+                try:
+                    result = benchmark.run()
+                except Exception as feedback:
+                    logging.exception(feedback)
+                    result = {'scenario': scenario,
+                              'space': space,
+                              'error': str(feedback)}
+
+                results['results'].append(result)
+    finally:
+        sys.stdout = output
+
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, 'w') as handle:
+            handle.write(text + '\n')
+    else:
+        sys.stdout.write(text + '\n')
+
+    return results
+
+
+if __name__ == '__main__':
+    results = main()
+    sys.exit(1 if any('error' in x for x in results['results']) else 0)
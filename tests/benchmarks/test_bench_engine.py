@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+import gc
+import logging
+import os
+import sys
+
+from shellbot import Context
+from tests.benchmarks.bench_engine import (Benchmark, percentile,
+                                           process_tree, resident_memory,
+                                           sequence_of, summarize)
+
+
+class BenchmarkTests(unittest.TestCase):
+
+    def tearDown(self):
+        collected = gc.collect()
+        if collected:
+            logging.info("Garbage collector: collected %d objects." % (collected))
+
+    def test_percentile(self):
+
+        logging.info("*** percentile")
+
+        self.assertEqual(percentile([], 0.5), None)
+        values = [float(x) for x in range(1, 101)]
+        self.assertEqual(percentile(values, 0.50), 50.0)
+        self.assertEqual(percentile(values, 0.99), 99.0)
+        self.assertEqual(percentile(values, 1.0), 100.0)
+        self.assertEqual(percentile([3.0], 0.99), 3.0)
+
+    def test_summarize(self):
+
+        logging.info("*** summarize")
+
+        self.assertEqual(summarize([]),
+                         {'p50': None, 'p99': None, 'mean': None, 'max': None})
+
+        summary = summarize([0.003, 0.001, 0.002])
+        self.assertEqual(summary, {'p50': 2.0, 'p99': 3.0,
+                                   'mean': 2.0, 'max': 3.0})
+
+    def test_sequence_of(self):
+
+        logging.info("*** sequence_of")
+
+        self.assertEqual(sequence_of(u'shelly echo 123'), 123)
+        self.assertEqual(sequence_of(u'42'), 42)
+        self.assertEqual(sequence_of(u'Value?'), None)
+        self.assertEqual(sequence_of(u''), None)
+        self.assertEqual(sequence_of(None), None)
+
+    def test_processes(self):
+
+        logging.info("*** processes")
+
+        tree = process_tree(os.getpid())
+        self.assertEqual(tree[0], os.getpid())
+
+        memory = resident_memory(os.getpid())
+        self.assertTrue(memory is None or memory > 0)
+
+    def test_init(self):
+
+        logging.info("*** init")
+
+        benchmark = Benchmark(scenario='commands', quantity=10, rooms=5)
+        self.assertEqual(benchmark.quantity, 10)
+        self.assertEqual(benchmark.rooms, 1)
+
+        benchmark = Benchmark(scenario='input', quantity=10, rooms=5)
+        self.assertEqual(benchmark.quantity, 5)
+        self.assertEqual(benchmark.rooms, 5)
+
+        with self.assertRaises(AssertionError):
+            Benchmark(scenario='*unknown')
+
+        with self.assertRaises(AssertionError):
+            Benchmark(space='*unknown')
+
+    def test_drain(self):
+
+        logging.info("*** drain")
+
+        benchmark = Benchmark(scenario='audit', quantity=2)
+        benchmark.DRAIN_TIMEOUT = 0.1
+        self.assertFalse(benchmark.drain())
+        self.assertEqual(benchmark.describe_missing(),
+                         u"Received 0 answers out of 2")
+
+        benchmark.received['speaker'] = {1: 1.0, 2: 2.0}
+        self.assertFalse(benchmark.drain())
+        self.assertEqual(benchmark.describe_missing(),
+                         u"Audited 0 messages out of 2")
+
+        benchmark.received['audit'] = {1: 1.0, 2: 2.0}
+        self.assertTrue(benchmark.drain())
+        self.assertEqual(benchmark.describe_missing(), None)
+
+
+if __name__ == '__main__':
+
+    Context.set_logger()
+    sys.exit(unittest.main())
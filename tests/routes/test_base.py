@@ -4,6 +4,7 @@
 import unittest
 import gc
 import logging
+import mock
 import os
 from multiprocessing import Queue
 import sys
@@ -40,6 +41,26 @@ class RouteTests(unittest.TestCase):
         with self.assertRaises(NotImplementedError):
             r.delete()
 
+    def test_is_authorized(self):
+
+        r = Route(Context())
+        self.assertTrue(r.is_authorized())  # no token required
+
+        r = Route(Context(), token='*secret')
+        with mock.patch('shellbot.routes.base.request') as request, \
+                mock.patch('shellbot.routes.base.response') as response:
+
+            request.get_header.return_value = 'Bearer *secret'
+            self.assertTrue(r.is_authorized())
+            request.get_header.assert_called_with('Authorization', '')
+
+            request.get_header.return_value = 'Bearer *guess'
+            self.assertFalse(r.is_authorized())
+            self.assertEqual(response.status, 401)
+
+            request.get_header.return_value = ''
+            self.assertFalse(r.is_authorized())
+
     def test_from_base(self):
 
         w = ['world']
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+import gc
+import json
+import logging
+import mock
+from multiprocessing import Queue
+import sys
+
+from shellbot import Context, Engine, Vibes
+from shellbot.routes.deadletters import DeadLetters
+
+
+class DeadLettersTests(unittest.TestCase):
+
+    def tearDown(self):
+        collected = gc.collect()
+        if collected:
+            logging.info("Garbage collector: collected %d objects." % (collected))
+
+    def test_deadletters(self):
+
+        engine = Engine(context=Context(), ears=Queue(), mouth=Queue())
+        r = DeadLetters(engine.context, engine=engine)
+        self.assertEqual(r.route, '/deadletters')
+        self.assertEqual(json.loads(r.get()), [])
+
+        engine.deadletters.add('listener', '*inbound', Exception('TEST'))
+        engine.deadletters.add('speaker', Vibes(text='*outbound'),
+                               Exception('TEST'))
+        letters = json.loads(r.get())
+        self.assertEqual([x['id'] for x in letters], [1, 2])
+        self.assertEqual(letters[0]['item'], '*inbound')
+        self.assertEqual(letters[0]['error'], 'Exception: TEST')
+        self.assertTrue(letters[1]['item'].startswith('text=*outbound'))
+
+        with mock.patch('shellbot.routes.deadletters.request') as request:
+            request.query = {'id': '2'}
+            self.assertEqual(json.loads(r.put()), {'replayed': 1})
+        self.assertEqual(engine.mouth.get(True, 1.0).text, '*outbound')
+
+        self.assertEqual(json.loads(r.delete()), {'cleared': 1})
+        self.assertEqual(json.loads(r.get()), [])
+
+    def test_token(self):
+
+        engine = Engine(context=Context(), ears=Queue(), mouth=Queue())
+        engine.deadletters.add('listener', '*inbound', Exception('TEST'))
+        r = DeadLetters(engine.context, engine=engine, token='*secret')
+        with mock.patch('shellbot.routes.base.request') as request, \
+                mock.patch('shellbot.routes.base.response') as response:
+
+            request.get_header.return_value = ''
+            self.assertEqual(r.get(), 'Unauthorized')
+            self.assertEqual(r.put(), 'Unauthorized')
+            self.assertEqual(r.delete(), 'Unauthorized')
+            self.assertEqual(response.status, 401)
+            self.assertEqual(len(engine.deadletters.list()), 1)
+
+            request.get_header.return_value = 'Bearer *secret'
+            self.assertEqual(json.loads(r.delete()), {'cleared': 1})
+
+
+if __name__ == '__main__':
+
+    Context.set_logger()
+    sys.exit(unittest.main())
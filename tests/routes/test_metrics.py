@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+import gc
+import logging
+import mock
+from multiprocessing import Queue
+import sys
+
+from shellbot import Context
+from shellbot.queues import BoundedQueue
+from shellbot.routes.metrics import Metrics
+
+
+class FakeEngine(object):
+    def __init__(self):
+        self.ears = Queue()
+        self.mouth = Queue()
+        self.mouths = {'bulk': Queue()}
+        self.fan = None
+
+
+class MetricsTests(unittest.TestCase):
+
+    def tearDown(self):
+        collected = gc.collect()
+        if collected:
+            logging.info("Garbage collector: collected %d objects." % (collected))
+
+    def test_init(self):
+
+        r = Metrics(Context())
+        self.assertEqual(r.route, '/metrics')
+        self.assertEqual(r.engine, None)
+        self.assertEqual(r.get_depth('ears'), 0)
+
+    def test_get(self):
+
+        context = Context()
+        engine = FakeEngine()
+        engine.ears.put('hello')
+        engine.ears.put('world')
+        engine.mouth.put('hello')
+
+        context.set('listener.counter', 12)
+        context.set('bots.ids', ['*id1', '*id2'])
+        context.increment('metrics.machines')
+        context.increment('metrics.spark.calls', 5)
+        context.increment('metrics.spark.errors.429', 2)
+        context.observe('metrics.command.echo', 0.02, buckets=[0.01, 0.1])
+        context.observe('metrics.stage.listener', 0.5, buckets=[0.1, 1.0])
+
+        r = Metrics(context, engine=engine, route='/here')
+        with mock.patch.object(engine.ears, 'qsize', return_value=2):
+            with mock.patch.object(engine.mouth, 'qsize', return_value=1):
+                text = r.get()
+
+        lines = text.split('\n')
+        self.assertTrue('# TYPE shellbot_queue_depth gauge' in lines)
+        self.assertTrue('shellbot_queue_depth{queue="ears"} 2' in lines)
+        self.assertTrue('shellbot_queue_depth{queue="mouth"} 1' in lines)
+        self.assertTrue('shellbot_queue_depth{queue="fan"} 0' in lines)
+        self.assertTrue(
+            'shellbot_queue_depth{queue="mouth.bulk"} 0' in lines)
+        self.assertTrue(
+            'shellbot_queue_depth{queue="mouth.interactive"} 0' in lines)
+        self.assertTrue(
+            'shellbot_events_total{component="listener"} 12' in lines)
+        self.assertTrue(
+            'shellbot_events_total{component="speaker"} 0' in lines)
+        self.assertTrue('shellbot_bots 2' in lines)
+        self.assertTrue('shellbot_machines 1' in lines)
+        self.assertTrue('shellbot_spark_api_calls_total 5' in lines)
+        self.assertTrue(
+            'shellbot_spark_api_errors_total{status="429"} 2' in lines)
+
+        self.assertTrue('# TYPE shellbot_command_duration_seconds histogram'
+                        in lines)
+        self.assertTrue('shellbot_command_duration_seconds_bucket'
+                        '{command="echo",le="0.01"} 0' in lines)
+        self.assertTrue('shellbot_command_duration_seconds_bucket'
+                        '{command="echo",le="0.1"} 1' in lines)
+        self.assertTrue('shellbot_command_duration_seconds_bucket'
+                        '{command="echo",le="+Inf"} 1' in lines)
+        self.assertTrue('shellbot_command_duration_seconds_sum'
+                        '{command="echo"} 0.02' in lines)
+        self.assertTrue('shellbot_command_duration_seconds_count'
+                        '{command="echo"} 1' in lines)
+        self.assertTrue('shellbot_stage_duration_seconds_bucket'
+                        '{stage="listener",le="1.0"} 1' in lines)
+
+        self.assertEqual(r.format_labels({}), '')
+        self.assertEqual(r.format_labels({'a': 'x"y'}), '{a="x\\"y"}')
+
+
+    def test_overflows(self):
+
+        context = Context()
+        context.increment('webhook.refused', 3)
+        engine = FakeEngine()
+        engine.ears = BoundedQueue(name='ears', maxsize=1,
+                                   policy='drop_newest')
+        engine.ears.put('hello')
+        engine.ears.put('world')
+
+        r = Metrics(context, engine=engine)
+        self.assertEqual(r.get_stats('mouth'), None)
+        self.assertEqual(r.get_stats('ears'),
+                         {'capacity': 1, 'dropped': 1, 'spilled': 0})
+
+        lines = r.render().split('\n')
+        self.assertTrue('shellbot_queue_capacity{queue="ears"} 1' in lines)
+        self.assertTrue(
+            'shellbot_queue_dropped_total{queue="ears"} 1' in lines)
+        self.assertTrue(
+            'shellbot_queue_spilled_total{queue="ears"} 0' in lines)
+        self.assertFalse(
+            'shellbot_queue_dropped_total{queue="mouth"} 0' in lines)
+        self.assertTrue('shellbot_webhook_refused_total 3' in lines)
+
+    def test_broker(self):
+
+        context = Context()
+        context.set('broker.topics', {'channel_A': {'messages': 2,
+                                                    'bytes': 33,
+                                                    'subscribers': 1}})
+        r = Metrics(context, engine=FakeEngine())
+        lines = r.render().split('\n')
+        self.assertTrue(
+            'shellbot_bus_messages_total{topic="channel_A"} 2' in lines)
+        self.assertTrue(
+            'shellbot_bus_bytes_total{topic="channel_A"} 33' in lines)
+        self.assertTrue(
+            'shellbot_bus_subscribers{topic="channel_A"} 1' in lines)
+
+if __name__ == '__main__':
+
+    Context.set_logger()
+    sys.exit(unittest.main())
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+import gc
+import logging
+import mock
+import sys
+
+from shellbot import Context
+from shellbot.routes.profile import Profile
+
+
+class ProfileTests(unittest.TestCase):
+
+    def test_profile(self):
+
+        context = Context()
+        r = Profile(context)
+        self.assertEqual(r.route, '/profile')
+        self.assertEqual(r.get(), '')
+
+        self.assertEqual(r.put(), 'OK')
+        self.assertEqual(context.get('profiler.switch'), 'on')
+
+        self.assertEqual(r.delete(), 'OK')
+        self.assertEqual(context.get('profiler.switch'), 'off')
+
+        context.set('profiler.stacks.speaker-1', {'speaker;run (speaker.py)': 7})
+        self.assertEqual(r.get(), 'speaker;run (speaker.py) 7\n')
+
+    def test_token(self):
+
+        context = Context()
+        r = Profile(context, token='*secret')
+        with mock.patch('shellbot.routes.base.request') as request, \
+                mock.patch('shellbot.routes.base.response'):
+
+            request.get_header.return_value = 'Bearer *guess'
+            self.assertEqual(r.put(), 'Unauthorized')
+            self.assertEqual(r.delete(), 'Unauthorized')
+            self.assertEqual(r.get(), 'Unauthorized')
+            self.assertEqual(context.get('profiler.switch'), None)
+
+            request.get_header.return_value = 'Bearer *secret'
+            self.assertEqual(r.put(), 'OK')
+            self.assertEqual(context.get('profiler.switch'), 'on')
+
+
+if __name__ == '__main__':
+
+    Context.set_logger()
+    sys.exit(unittest.main())
@@ -271,6 +271,14 @@ class SpaceTests(unittest.TestCase):
         with self.assertRaises(NotImplementedError):
             message = next(self.space.walk_messages(id='*id'))
 
+    def test_name_attachment(self):
+
+        logging.info("*** name_attachment")
+
+        self.assertEqual(
+            self.space.name_attachment('http://a.server/files/report.pdf'),
+            'report.pdf')
+
     def test_post_message(self):
 
         logging.info("*** post_message")
@@ -354,6 +362,19 @@ class SpaceTests(unittest.TestCase):
         space.run()
         self.assertEqual(self.context.get('puller.counter'), 0)
 
+    def test_run_backoff(self):
+
+        logging.info("*** run/backoff")
+
+        space = Space(context=self.context)
+        space.PULL_INTERVAL = 0.1
+        space.PULL_MAX_INTERVAL = 0.3
+        space.pull = mock.Mock(side_effect=[0, 0, 0, 2, 0, None])
+        with mock.patch('time.sleep') as mocked:
+            space.run()
+            delays = [round(x[0][0], 3) for x in mocked.call_args_list]
+            self.assertEqual(delays, [0.2, 0.3, 0.3, 0.1, 0.2, 0.1])
+
     def test_pull(self):
 
         logging.info("*** pull")
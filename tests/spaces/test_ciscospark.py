@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 
 import unittest
-from bottle import request
+from bottle import request, response
 import gc
 from io import BytesIO
 import json
@@ -10,13 +10,17 @@ import logging
 import mock
 import os
 from multiprocessing import Process, Queue
+import shutil
 import sys
+import tempfile
 import yaml
 
 from shellbot import Context
 from shellbot.channel import Channel
 from shellbot.events import Event, Message, Join, Leave
+from shellbot.queues import BoundedQueue
 from shellbot.spaces import Space, SparkSpace
+from shellbot.spaces.ciscospark import get_session
 
 
 # unit tests
@@ -286,6 +290,29 @@ class SparkSpaceTests(unittest.TestCase):
         self.assertEqual(self.space.api.token, 'a')
         self.assertEqual(self.space.audit_api.token, 'b')
 
+    def test_get_session(self):
+
+        logging.info("*** get_session")
+
+        session = get_session()
+        self.assertEqual(get_session(), session)
+        with mock.patch('os.getpid', return_value=-1):
+            self.assertNotEqual(get_session(), session)  # after fork
+
+        from ciscosparkapi import CiscoSparkAPI
+        self.space.api = CiscoSparkAPI(access_token='*token')
+        self.space.audit_api = FakeApi()
+        self.space.session = None
+        session = self.space.get_session()
+        self.assertEqual(self.space.session, session)
+        self.assertEqual(
+            self.space.api._session._req_session.get_adapter('https://'),
+            session.get_adapter('https://'))
+
+        self.assertTrue(self.space.share_connections(self.space.api, session))
+        self.assertFalse(self.space.share_connections(FakeApi(), session))
+        self.assertFalse(self.space.share_connections(object(), session))
+
     def test_on_connect(self):
 
         logging.info("*** on_connect")
@@ -527,14 +554,81 @@ class SparkSpaceTests(unittest.TestCase):
         self.space.remove_participant(id='*id', person='foo.bar@acme.com')
         self.assertTrue(self.space.api.memberships.delete.called)
 
+    def test_walk_messages(self):
+
+        logging.info("*** walk_messages")
+
+        def build_message(id):
+            message = FakeMessage()
+            message.id = id
+            message._json = {'text': id,
+                             'id': id,
+                             'created': '2017-07-19T05:29:{}'.format(id)}
+            return message
+
+        messages = [build_message(u'{}'.format(x)) for x in range(19, 10, -1)]
+        self.space.api = FakeApi(messages=messages)
+
+        walked = [x.id for x in self.space.walk_messages(id='*id', stop_id='17')]
+        self.assertEqual(walked, ['19', '18', '17'])
+        self.space.api.messages.list.assert_called_with(roomId='*id',
+                                                        max=self.space.HISTORY_PAGE)
+
+        self.space.api.messages.list.return_value = messages[3:]
+        walked = [x.id for x in self.space.walk_messages(id='*id')]
+        self.assertEqual(walked, [x.id for x in messages])
+        self.space.api.messages.list.assert_called_with(roomId='*id',
+                                                        max=self.space.HISTORY_PAGE,
+                                                        beforeMessage='17')
+        self.assertEqual(self.space.api.messages.list.call_count, 2)
+
+        walked = [x.id for x in self.space.walk_messages(id='*id', up_to='2017-07-19T05:29:15')]
+        self.assertEqual(walked, ['19', '18', '17', '16', '15', '14'])
+        self.assertEqual(self.space.api.messages.list.call_count, 2)  # cached
+
+        self.space.history.forget()
+        self.space.api.messages.list.side_effect = Exception('TEST')
+        with self.assertRaises(Exception):
+            walked = [x for x in self.space.walk_messages(id='*id')]
+
+    def test_list_messages(self):
+
+        logging.info("*** list_messages")
+
+        messages = []
+        for index in range(1, 10):
+            message = FakeMessage()
+            message.id = u'*{}'.format(index)
+            message._json = {'text': message.id, 'id': message.id}
+            if index % 3 == 0:
+                message._json['files'] = [u'http://file/{}'.format(index)]
+            messages.append(message)
+        self.space.api = FakeApi(messages=messages)
+
+        listed = self.space.list_messages(id='*id', quantity=4)
+        self.assertEqual([x.id for x in listed], ['*1', '*2', '*3', '*4'])
+
+        self.space.history.forget()  # fake api ignores beforeMessage
+        listed = self.space.list_messages(id='*id', stop_id='*3')
+        self.assertEqual([x.id for x in listed], ['*1', '*2'])
+
+        self.space.history.forget()
+        listed = self.space.list_messages(id='*id', with_attachment=True)
+        self.assertEqual([x.url for x in listed],
+                         ['http://file/3', 'http://file/6', 'http://file/9'])
+
     def test_post_message(self):
 
         logging.info("*** post_message")
 
         self.space.api = FakeApi()
-        self.space.post_message(id='*id', text='hello world')
+        self.assertTrue(self.space.post_message(id='*id', text='hello world'))
         self.assertTrue(self.space.api.messages.create.called)
 
+        self.space.api = FakeApi()
+        self.space.api.messages.create.side_effect = Exception('TEST')
+        self.assertFalse(self.space.post_message(id='*id', text='hello'))
+
         self.space.api = FakeApi()
         self.space.post_message(person='a@b.com', text='hello world')
         self.assertTrue(self.space.api.messages.create.called)
@@ -597,6 +691,12 @@ class SparkSpaceTests(unittest.TestCase):
         self.assertTrue(self.space.api.webhooks.create.called)
         self.assertTrue(self.context.get('audit.has_been_armed'))
 
+        self.assertEqual(len(self.space.fetchers), self.space.FETCHERS)
+        self.assertEqual(len(self.space.inboxes), self.space.FETCHERS)
+        self.context.set('general.switch', 'off')
+        for fetcher in self.space.fetchers:
+            fetcher.join()
+
     def test_deregister(self):
 
         logging.info("*** deregister")
@@ -720,6 +820,89 @@ class SparkSpaceTests(unittest.TestCase):
         with self.assertRaises(Exception):
             print(self.space.fan.get_nowait())
 
+    def test_webhook_with_fetchers(self):
+
+        logging.info("*** webhook with fetchers")
+
+        fake_message = {
+            u'resource': u'messages',
+            u'name': u'shellbot-messages',
+            u'data': {
+                u'personId': u'Y2lzY29zcGFyayYi1mYWYwZWQwMjkyMzU',
+                u'roomId': u'Y2lzY29zcGFyazovL3VzL1NzUtYzc2ZDMyOGY0Y2Rj',
+                u'id': '*123',
+                },
+            u'event': u'created',
+        }
+
+        with self.assertRaises(KeyError):
+            self.space.webhook({u'resource': u'messages'})
+
+        self.space.api = FakeApi()
+        self.context.set('bot.id', u'Y2lzY29zcGFyayYi1mYWYwZWQwMjkyMzU')
+        self.assertEqual(self.space.webhook(fake_message), 'OK')
+        self.assertFalse(self.space.api.messages.get.called)
+        with self.assertRaises(Exception):
+            print(self.space.ears.get_nowait())
+
+        self.context.set('bot.id', '*me')
+        self.assertEqual(self.space.webhook(fake_message), 'OK')
+        self.assertEqual(self.space.ears.get(True, 5.0)[0], '{')
+        self.assertEqual(self.space.webhook(fake_message), 'OK')  # duplicate
+        self.assertEqual(self.context.get('webhook.duplicates'), 1)
+        with self.assertRaises(Exception):
+            print(self.space.ears.get_nowait())
+
+        fake_message['data']['id'] = '*456'
+        with mock.patch.object(self.space, 'process_notification',
+                               side_effect=Exception('TEST')):
+            with self.assertRaises(Exception):
+                self.space.webhook(fake_message)
+        self.assertEqual(self.space.webhook(fake_message), 'OK')  # again
+        self.assertEqual(self.space.ears.get(True, 5.0)[0], '{')
+        self.assertEqual(self.context.get('webhook.duplicates'), 1)
+
+        self.space.recent.forget()
+        fetchers = self.space.start_fetchers(quantity=2)
+        self.assertEqual(len(fetchers), 2)
+        self.assertEqual(self.space.start_fetchers(), fetchers)
+
+        self.assertEqual(self.space.webhook(fake_message), 'OK')
+        data = self.space.ears.get(True, 5.0)
+        self.assertEqual(yaml.safe_load(data)['hook'], 'shellbot-messages')
+
+        for inbox in self.space.inboxes:
+            inbox.put(None)
+        for fetcher in fetchers:
+            fetcher.join()
+        self.assertEqual(self.context.get('fetcher.counter'), 1)
+
+    def test_webhook_saturated(self):
+
+        logging.info("*** webhook saturated")
+
+        fake_message = {
+            u'resource': u'messages',
+            u'name': u'shellbot-messages',
+            u'data': {u'roomId': u'*room', u'id': '*123'},
+            u'event': u'created',
+        }
+
+        self.space.ears = BoundedQueue(maxsize=1)
+        self.space.ears.put('*full')
+        self.space.inboxes = [Queue()]
+
+        self.assertEqual(self.space.webhook(fake_message),
+                         'Service Unavailable')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.context.get('webhook.refused'), 1)
+        with self.assertRaises(Exception):
+            print(self.space.inboxes[0].get_nowait())
+
+        self.assertEqual(self.space.ears.get(), '*full')
+        self.assertEqual(self.space.webhook(fake_message), 'OK')  # not dup
+        self.assertEqual(self.space.inboxes[0].get(True, 5.0), fake_message)
+
     def test_pull(self):
 
         logging.info("*** pull")
@@ -755,13 +938,53 @@ class SparkSpaceTests(unittest.TestCase):
         with self.assertRaises(Exception):
             print(self.ears.get_nowait())
 
+    def test_pull_with_cursor(self):
+
+        logging.info("*** pull/cursor")
+
+        def build_message(id):
+            message = FakeMessage()
+            message.id = id
+            message._json = {'text': id, 'id': id}
+            return message
+
+        messages = [build_message(u'*{}'.format(x)) for x in range(9, 0, -1)]
+
+        directory = tempfile.mkdtemp()
+        self.context.set('space.cursor', os.path.join(directory, 'cursor'))
+
+        self.space.PULL_PAGE = 3  # first pull takes only first page
+        self.space.api = FakeApi(messages=messages)
+        self.assertEqual(self.space.pull(), 3)
+        self.assertEqual(self.space._last_message_id, '*9')
+        for id in ('*7', '*8', '*9'):
+            self.assertEqual(yaml.safe_load(self.ears.get())['text'], id)
+
+        self.assertEqual(self.space.pull(), 0)  # nothing new
+
+        messages = [build_message(u'*{}'.format(x)) for x in range(15, 0, -1)]
+        self.space.api = FakeApi(messages=messages)
+        self.assertEqual(self.space.pull(), 6)  # up to last seen message
+        for id in ('*10', '*11', '*12', '*13', '*14', '*15'):
+            self.assertEqual(yaml.safe_load(self.ears.get())['text'], id)
+
+        space = SparkSpace(context=self.context, ears=self.ears)
+        space.api = FakeApi(messages=messages)
+        self.assertEqual(space.pull(), 0)  # restarted from saved cursor
+        self.assertEqual(space._last_message_id, '*15')
+
+        with self.assertRaises(Exception):
+            print(self.ears.get_nowait())
+
+        shutil.rmtree(directory)
+
     def test_on_message(self):
 
         logging.info("*** on_message")
 
         class MySpace(SparkSpace):
             def name_attachment(self, url, token=None):
-                return 'some_file.pdf'
+                raise AssertionError('names should be resolved lazily')
 
             def get_attachment(self, url, token=None):
                 return b'hello world'
@@ -772,7 +995,6 @@ class SparkSpaceTests(unittest.TestCase):
         message = my_message.copy()
         message.update({"type": "message"})
         message.update({"content": message['text']})
-        message.update({"attachment": "some_file.pdf"})
         message.update({"url": "http://www.example.com/images/media.png"})
         message.update({"from_id": '*matt*id'})
         message.update({"from_label": 'matt@example.com'})
@@ -803,24 +1025,94 @@ class SparkSpaceTests(unittest.TestCase):
 
         logging.info("*** download_attachment")
 
+        class MyResponse(object):
+            def __init__(self, headers={}, chunks=[b'hello ', b'world']):
+                self.status_code = 200
+                self.headers = headers
+                self.chunks = chunks
+                self.closed = False
+
+            def iter_content(self, chunk_size=1):
+                for chunk in self.chunks:
+                    yield chunk
+
+            def close(self):
+                self.closed = True
+
         class MySpace(SparkSpace):
-            def name_attachment(self, url, token=None):
+            def name_attachment(self, url, token=None, response=None):
                 return 'some_file.pdf'
 
-            def get_attachment(self, url, token=None):
-                return BytesIO(b'hello world')
+            def stream_attachment(self, url, token=None):
+                self.streamed.append(url)
+                return self.response
+
+        directory = tempfile.mkdtemp()
+        self.context.set('space.downloads', directory)
 
         space = MySpace(context=self.context)
+        space.streamed = []
+        space.response = MyResponse()
         outcome = space.download_attachment(url='/dummy')
-
+        self.assertEqual(os.path.basename(outcome), 'some_file.pdf')
+        self.assertTrue(space.response.closed)
         with open(outcome, "rb") as handle:
-            self.assertEqual(handle.read(),
-                             space.get_attachment('/dummy').read())
+            self.assertEqual(handle.read(), b'hello world')
+
+        self.assertEqual(space.download_attachment(url='/dummy'), outcome)
+        self.assertEqual(space.streamed, ['/dummy'])  # no second download
 
-        try:
-            os.remove(outcome)
-        except:
-            pass
+        space.response = MyResponse()
+        self.assertEqual(space.download_attachment(url='/same/content'),
+                         outcome)
+        self.assertEqual(space.streamed, ['/dummy', '/same/content'])
+
+        self.context.set('space.max_download', 8)
+        space.response = MyResponse()
+        with self.assertRaises(ValueError):
+            space.download_attachment(url='/too/large')
+        self.assertTrue(space.response.closed)
+
+        space.response = MyResponse(headers={'Content-Length': '1000'})
+        with self.assertRaises(ValueError):
+            space.download_attachment(url='/too/large')
+
+        self.assertEqual(len(os.listdir(directory)), 3)  # 2 urls + 1 folder
+
+        shutil.rmtree(directory)
+
+    def test_stream_attachment(self):
+
+        logging.info("*** stream_attachment")
+
+        class MyResponse(object):
+            def __init__(self, status_code=200):
+                self.status_code = status_code
+                self.closed = False
+
+            def close(self):
+                self.closed = True
+
+        response = MyResponse()
+        self.assertEqual(self.space.stream_attachment(url='/dummy',
+                                                      response=response),
+                         response)
+        self.assertFalse(response.closed)
+
+        response = MyResponse(status_code=400)
+        with self.assertRaises(Exception):
+            self.space.stream_attachment(url='/dummy', response=response)
+        self.assertTrue(response.closed)
+
+        self.context.set('space.timeout', 5)
+        with mock.patch.object(self.space, 'get_session') as mocked:
+            mocked.return_value.get.return_value = MyResponse()
+            self.space.stream_attachment(url='/dummy', token='*token')
+            mocked.return_value.get.assert_called_with(
+                url='/dummy',
+                headers={'Authorization': 'Bearer *token'},
+                stream=True,
+                timeout=5)
 
     def test_name_attachment(self):
 
@@ -841,11 +1133,41 @@ class SparkSpaceTests(unittest.TestCase):
         self.assertEqual(self.space.name_attachment(url='/dummy', response=response),
                          'some_file.pdf')
 
+        with mock.patch.object(self.space, 'get_session') as mocked:
+            self.assertEqual(self.space.name_attachment(url='/dummy'),
+                             'some_file.pdf')
+            self.assertFalse(mocked.called)
+
         self.space.token = None
         response = MyResponse(status_code=400, headers={'Content-Disposition': 'filename="some_file.pdf"'})
         with self.assertRaises(Exception):
             name = self.space.name_attachment(url='/dummy', response=response)
 
+    def test_get_token(self):
+
+        logging.info("*** get_token")
+
+        self.space.context.set('space.token', '*bot')
+        self.space.context.set('space.audit_token', '*audit')
+
+        item = my_message.copy()
+        self.space.on_message(item, self.ears)
+        url = item['files'][0]
+        self.assertEqual(self.space.get_token(url), '*bot')
+
+        item['hook'] = 'shellbot-audit'
+        self.space.on_message(item, self.fan)
+        self.assertEqual(self.space.get_token(url), '*audit')
+        self.assertEqual(self.space.get_token('/other'), '*bot')
+
+        with mock.patch.object(self.space, 'get_session') as mocked:
+            mocked.return_value.head.return_value.status_code = 200
+            mocked.return_value.head.return_value.headers = {
+                'Content-Disposition': 'filename="media.png"'}
+            self.assertEqual(self.space.name_attachment(url), 'media.png')
+            headers = mocked.return_value.head.call_args[1]['headers']
+            self.assertEqual(headers['Authorization'], 'Bearer *audit')
+
     def test_get_attachment(self):
 
         logging.info("*** get_attachment")
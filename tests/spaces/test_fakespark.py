@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+from bottle import Bottle, request
+import gc
+import logging
+import requests
+import sys
+from threading import Thread
+import time
+from wsgiref.simple_server import make_server, WSGIRequestHandler
+
+from shellbot import Context
+from shellbot.spaces.fakespark import FakeSpark
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args, **kwargs):
+        pass
+
+
+class FakeSparkTests(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakeSpark(seed=0)
+        self.fake.start()
+
+        self.session = requests.Session()
+        self.session.headers.update({'Authorization': 'Bearer *bot*token'})
+
+    def tearDown(self):
+        self.fake.stop()
+        del self.session
+        del self.fake
+        collected = gc.collect()
+        if collected:
+            logging.info("Garbage collector: collected %d objects." % (collected))
+
+    def call(self, method, path, **kwargs):
+        response = self.session.request(method, self.fake.url+path, **kwargs)
+        return (response.status_code,
+                response.json() if response.text else None)
+
+    def test_api(self):
+
+        logging.info("*** api")
+
+        self.fake.add_person(email='shelly@fake.spark',
+                             name='shelly',
+                             token='*bot*token')
+        (status, me) = self.call('GET', 'people/me')
+        self.assertEqual(status, 200)
+        self.assertEqual(me['displayName'], 'shelly')
+        self.assertEqual(me['emails'], ['shelly@fake.spark'])
+
+        (status, room) = self.call('POST', 'rooms', json={'title': 'Bench'})
+        self.assertEqual(room['title'], 'Bench')
+        (status, rooms) = self.call('GET', 'rooms', params={'type': 'group'})
+        self.assertEqual([x['id'] for x in rooms['items']], [room['id']])
+        (status, updated) = self.call('PUT', 'rooms/'+room['id'],
+                                      json={'title': 'Benchmark'})
+        self.assertEqual(updated['title'], 'Benchmark')
+
+        (status, membership) = self.call('POST', 'memberships',
+                                         json={'roomId': room['id'],
+                                               'personEmail': 'a@acme.com'})
+        self.assertEqual(status, 200)
+        (status, error) = self.call('POST', 'memberships',
+                                    json={'roomId': room['id'],
+                                          'personEmail': 'a@acme.com'})
+        self.assertEqual(status, 409)
+        (status, memberships) = self.call('GET', 'memberships',
+                                          params={'roomId': room['id']})
+        self.assertEqual(sorted(x['personEmail'] for x in memberships['items']),
+                         ['a@acme.com', 'shelly@fake.spark'])
+
+        (status, message) = self.call('POST', 'messages',
+                                      json={'roomId': room['id'],
+                                            'markdown': 'hello **world**'})
+        self.assertEqual(message['personId'], me['id'])
+        (status, fetched) = self.call('GET', 'messages/'+message['id'])
+        self.assertEqual(fetched['html'], 'hello **world**')
+
+        for index in range(1, 120):
+            self.fake.post(room['id'],
+                           u'message {}'.format(index),
+                           person='a@acme.com',
+                           mentions=[me['id']] if index % 10 == 0 else [])
+
+        response = self.session.get(self.fake.url+'messages',
+                                    params={'roomId': room['id'], 'max': 50})
+        items = response.json()['items']
+        self.assertEqual(len(items), 50)
+        self.assertEqual(items[0]['text'], 'message 119')
+
+        texts = []
+        while response.links.get('next'):  # pagination as done by the SDK
+            response = self.session.get(response.links['next']['url'])
+            texts += [x['text'] for x in response.json()['items']]
+        self.assertEqual(len(texts), 70)
+        self.assertEqual(texts[-1], '')  # first message, with markdown
+
+        (status, mentions) = self.call('GET', 'messages',
+                                       params={'roomId': room['id'],
+                                               'mentionedPeople': 'me'})
+        self.assertEqual(len(mentions['items']), 11)
+
+        (status, _) = self.call('DELETE', 'memberships/'+membership['id'])
+        self.assertEqual(status, 204)
+        (status, _) = self.call('DELETE', 'rooms/'+room['id'])
+        self.assertEqual(status, 204)
+        (status, _) = self.call('GET', 'rooms/'+room['id'])
+        self.assertEqual(status, 404)
+
+    def test_webhooks(self):
+
+        logging.info("*** webhooks")
+
+        received = []
+        hook = Bottle()
+
+        @hook.route('/hook', method='POST')
+        def handle():
+            received.append(request.json)
+            return 'OK'
+
+        httpd = make_server('127.0.0.1', 0, hook, handler_class=QuietHandler)
+        server = Thread(target=httpd.serve_forever)
+        server.daemon = True
+        server.start()
+
+        url = u'http://127.0.0.1:{}/hook'.format(httpd.server_port)
+        for (name, resource, event) in [
+            ('shellbot-memberships', 'memberships', 'all'),
+            ('shellbot-messages', 'messages', 'created')]:
+
+            (status, webhook) = self.call('POST', 'webhooks',
+                                          json={'name': name,
+                                                'targetUrl': url,
+                                                'resource': resource,
+                                                'event': event})
+            self.assertEqual(status, 200)
+
+        (status, webhooks) = self.call('GET', 'webhooks')
+        self.assertEqual(len(webhooks['items']), 2)
+
+        (status, room) = self.call('POST', 'rooms', json={'title': 'Hooked'})
+        message = self.fake.post(room['id'], 'hello', person='bob@acme.com')
+
+        while self.fake.notifications.qsize():
+            time.sleep(0.01)
+        time.sleep(0.1)
+
+        httpd.shutdown()
+        httpd.server_close()
+
+        events = [(x['resource'], x['event']) for x in received]
+        self.assertEqual(events, [('memberships', 'created'),
+                                  ('memberships', 'created'),
+                                  ('messages', 'created')])
+        self.assertEqual(received[-1]['name'], 'shellbot-messages')
+        self.assertEqual(received[-1]['data']['id'], message['id'])
+        self.assertEqual(self.fake.counters['notifications'], 3)
+
+        (status, _) = self.call('DELETE', 'webhooks/'+webhook['id'])
+        self.assertEqual(status, 204)
+
+    def test_faults(self):
+
+        logging.info("*** faults")
+
+        self.fake.throttle_rate = 1.0
+        (status, _) = self.call('GET', 'people/me')
+        self.assertEqual(status, 429)
+
+        self.fake.throttle_rate = 0.0
+        self.fake.error_rate = 1.0
+        (status, _) = self.call('GET', 'people/me')
+        self.assertEqual(status, 500)
+
+        self.fake.error_rate = 0.0
+        response = requests.get(self.fake.url+'people/me')
+        self.assertEqual(response.status_code, 401)
+
+        self.fake.latency = 0.05
+        start = time.time()
+        (status, _) = self.call('GET', 'people/me')
+        self.assertEqual(status, 200)
+        self.assertTrue(time.time() - start >= 0.05)
+
+        self.assertEqual(self.fake.counters['requests'], 4)
+        self.assertEqual(self.fake.counters['throttles'], 1)
+        self.assertEqual(self.fake.counters['errors'], 1)
+
+
+if __name__ == '__main__':
+
+    Context.set_logger()
+    sys.exit(unittest.main())
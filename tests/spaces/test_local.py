@@ -10,6 +10,7 @@ import mock
 import os
 from multiprocessing import Process, Queue
 import sys
+import tempfile
 import time
 
 from shellbot import Context
@@ -302,6 +303,65 @@ class LocalSpaceTests(unittest.TestCase):
 
         sys.stdin = original_stdin
 
+    def test_replay(self):
+
+        logging.info("***** replay")
+
+        (handle, path) = tempfile.mkstemp(suffix='.json')
+        with os.fdopen(handle, 'w') as stream:
+            stream.write('# recorded events\n')
+            stream.write(json.dumps({'type': 'join',
+                                     'actor_id': '*alice',
+                                     'channel_id': '*one'}) + '\n')
+            stream.write('\n')
+            stream.write(json.dumps({'type': 'message',
+                                     'text': 'hello',
+                                     'from_id': '*alice',
+                                     'channel_id': '*one'}) + '\n')
+            stream.write(json.dumps({'type': 'message',
+                                     'text': 'world',
+                                     'from_id': '*bob'}) + '\n')
+            stream.write(json.dumps({'type': 'leave',
+                                     'actor_id': '*bob',
+                                     'channel_id': '*two'}) + '\n')
+
+        try:
+            space = LocalSpace(context=self.context,
+                               ears=self.ears,
+                               replay=path)
+            space.check()
+            self.assertEqual(self.context.get('space.replay'), path)
+
+            logging.debug("- at some rate")
+            self.context.set('space.replay_rate', 2)
+            with mock.patch('time.time', return_value=100.0):
+                self.assertEqual(space.pull(), 1)
+                self.assertEqual(space.pull(), None)  # not due yet
+            self.assertEqual(json.loads(self.ears.get()),
+                             {'type': 'join',
+                              'actor_id': '*alice',
+                              'channel_id': '*one'})
+            with mock.patch('time.time', return_value=101.0):
+                self.assertEqual(space.pull(), 2)
+            self.assertEqual(json.loads(self.ears.get())['text'], 'hello')
+            self.assertEqual(json.loads(self.ears.get()),
+                             {'type': 'message',
+                              'text': 'world',
+                              'from_id': '*bob',
+                              'channel_id': '*local'})
+
+            logging.debug("- as fast as possible, until the end")
+            self.context.set('space.replay_rate', 0)
+            with mock.patch.object(self.ears, 'empty', return_value=True):
+                with mock.patch('time.sleep') as mocked:
+                    self.assertEqual(space.pull(), 1)
+                    self.assertTrue(mocked.called)
+            self.assertEqual(json.loads(self.ears.get())['type'], 'leave')
+            self.assertEqual(self.context.get('general.switch'), 'off')
+
+        finally:
+            os.remove(path)
+
     def test_on_message(self):
 
         logging.info("***** on_message")
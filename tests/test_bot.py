@@ -271,6 +271,21 @@ class BotTests(unittest.TestCase):
         self.bot.say(message_2)
         self.assertEqual(self.engine.mouth.get().text, message_2)
 
+        self.engine.mouths = {'bulk': Queue()}
+        self.bot.say(message_2, priority='bulk')
+        item = self.engine.mouths['bulk'].get()
+        self.assertEqual(item.text, message_2)
+        self.assertEqual(item.priority, 'bulk')
+        self.bot.say(message_2, priority='interactive')
+        self.assertEqual(self.engine.mouth.get().priority, 'interactive')
+        self.bot.say(message_2)
+        self.assertEqual(self.engine.mouth.get().priority, 'normal')
+        self.bot.priority = 'interactive'  # set by the shell
+        self.bot.say(message_2)
+        self.assertEqual(self.engine.mouth.get().priority, 'interactive')
+        self.bot.priority = 'normal'
+        self.engine.mouths = {}
+
         message_3 = 'hello'
         content_3 = 'world'
         self.bot.say(message_3, content=content_3)
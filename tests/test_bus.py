@@ -8,10 +8,12 @@ import logging
 import mock
 from multiprocessing import Process
 import sys
+from threading import Thread, current_thread
 import time
 
 from shellbot import Context
-from shellbot.bus import Bus, Subscriber, Publisher
+from shellbot.bus import Bus, Subscriber, Publisher, Broker, encode, decode
+import zmq
 
 
 class BusTests(unittest.TestCase):
@@ -65,6 +67,15 @@ class BusTests(unittest.TestCase):
 
         publisher = self.bus.publish()
 
+    def test_codec(self):
+
+        logging.info(u"***** codec")
+
+        for message in (u'hello', {u'hello': u'w\u00f6rld'}, [1, 2.5, None]):
+            payload = encode(message)
+            self.assertTrue(isinstance(payload, bytes))
+            self.assertEqual(decode(payload), message)
+
     def test_subscriber_init(self):
 
         logging.info(u"***** subscriber/init")
@@ -80,12 +91,31 @@ class BusTests(unittest.TestCase):
         subscriber =  self.bus.subscribe('dummy')
         subscriber.socket = mock.Mock()
         with mock.patch.object(subscriber.socket,
-                               'recv',
-                               return_value='dummy {"hello": "world"}') as mocked:
+                               'recv_multipart',
+                               return_value=[b'dummy', b'{"hello": "world"}']) as mocked:
 
             message = subscriber.get()
             self.assertEqual(message, {u'hello': u'world'})
 
+            (channel, message) = subscriber.receive()
+            self.assertEqual(channel, u'dummy')
+            self.assertEqual(message, {u'hello': u'world'})
+
+        with mock.patch.object(subscriber.socket,
+                               'recv_multipart',
+                               return_value=[b'dummy {"hello": "world"}']) as mocked:
+
+            (channel, message) = subscriber.receive()
+            self.assertEqual(channel, u'dummy')
+            self.assertEqual(message, {u'hello': u'world'})
+
+        with mock.patch.object(subscriber.socket,
+                               'recv_multipart',
+                               side_effect=zmq.error.Again()) as mocked:
+
+            self.assertEqual(subscriber.get(), None)
+            self.assertEqual(subscriber.receive(), (None, None))
+
     def test_publisher_init(self):
 
         logging.info(u"***** publisher/init")
@@ -108,6 +138,20 @@ class BusTests(unittest.TestCase):
         publisher.fan.put(None)
         publisher.run()
 
+    def test_publisher_bind(self):
+
+        logging.info(u"***** publisher/bind")
+
+        publisher = Publisher(context=self.context)
+        publisher.DEFER_DURATION = 0.0
+        self.context.set('general.switch', 'off')
+        self.context.set('bus.bind', 'tcp://*:6666')
+
+        with mock.patch('shellbot.bus.zmq.Context.instance') as mocked:
+            publisher.run()
+            socket = mocked.return_value.socket.return_value
+            socket.bind.assert_called_with('tcp://*:6666')
+
     def test_publisher_static_test(self):
 
         logging.info(u"***** publisher/static test")
@@ -148,9 +192,9 @@ class BusTests(unittest.TestCase):
             def __init__(self, context):
                 self.context = context
 
-            def send_string(self, item):
+            def send_multipart(self, frames):
                 pipe = self.context.get('pipe', [])
-                pipe.append(item)
+                pipe.append(frames)
                 self.context.set('pipe', pipe)
 
             def close(self):
@@ -162,7 +206,9 @@ class BusTests(unittest.TestCase):
         self.assertEqual(self.context.get('publisher.counter', 0), 3)
         self.assertEqual(
             self.context.get('pipe'),
-            ['channel_A "hello"', 'channel_B "world"', 'channel_C {"hello": "world"}'])
+            [[b'channel_A', b'"hello"'],
+             [b'channel_B', b'"world"'],
+             [b'channel_C', b'{"hello": "world"}']])
 
     def test_publisher_put(self):
 
@@ -192,10 +238,84 @@ class BusTests(unittest.TestCase):
                                'put') as mocked:
 
             publisher.put('channel', 'message')
-            mocked.assert_called_with('channel "message"')
+            mocked.assert_called_with(('channel', b'"message"'))
 
             publisher.put(['channel'], 'message')
-            mocked.assert_called_with('channel "message"')
+            mocked.assert_called_with(('channel', b'"message"'))
+
+    def test_publisher_direct(self):
+
+        logging.info(u"***** publisher/direct")
+
+        publisher = self.bus.publish()
+        self.assertFalse(publisher.is_direct)
+
+        self.context.set('bus.direct', True)
+        publisher = self.bus.publish()
+        self.assertFalse(publisher.is_direct)  # no broker
+
+        self.context.set('bus.broker', 'tcp://127.0.0.1:6668')
+        publisher = self.bus.publish()
+        self.assertTrue(publisher.is_direct)
+        publisher.DEFER_DURATION = 0.0
+
+        with mock.patch('shellbot.bus.zmq.Context.instance') as mocked, \
+                mock.patch.object(publisher.fan, 'put') as fan:
+
+            socket = mocked.return_value.socket.return_value
+
+            publisher.put(['channel_A', 'channel_B'], 'message')
+            self.assertFalse(fan.called)
+            socket.connect.assert_called_once_with('tcp://127.0.0.1:6668')
+            socket.send_multipart.assert_called_with(
+                [b'channel_B', b'"message"'], copy=True)
+
+            large = 'x' * publisher.ZERO_COPY
+            publisher.put('channel_A', large)
+            socket.send_multipart.assert_called_with(
+                [b'channel_A', encode(large)], copy=False)
+
+            self.assertEqual(mocked.return_value.socket.call_count, 1)
+            self.assertEqual(self.context.get('publisher.counter'), None)
+
+            publisher.close()
+            self.assertEqual(self.context.get('publisher.counter'), 3)
+            self.assertEqual(socket.close.call_count, 1)
+
+            publisher.FLUSH = 0.0
+            publisher.put('channel_A', 'message')
+            self.assertEqual(self.context.get('publisher.counter'), 4)
+            self.assertEqual(mocked.return_value.socket.call_count, 2)
+
+    def test_publisher_sweep(self):
+
+        logging.info(u"***** publisher/sweep")
+
+        self.context.set('bus.direct', True)
+        self.context.set('bus.broker', 'tcp://127.0.0.1:6668')
+        publisher = self.bus.publish()
+        publisher.DEFER_DURATION = 0.0
+
+        with mock.patch('shellbot.bus.zmq.Context.instance') as mocked:
+
+            mocked.return_value.socket.side_effect = \
+                lambda kind: mock.Mock()
+
+            worker = Thread(target=publisher.put, args=('channel', 'a'))
+            worker.start()
+            worker.join()
+            self.assertEqual(len(publisher._sockets), 1)
+            ended = list(publisher._sockets.values())[0]
+            self.assertFalse(ended.close.called)
+
+            publisher.put('channel', 'b')  # new thread, sweep ended one
+            self.assertEqual(ended.close.call_count, 1)
+            self.assertEqual(list(publisher._sockets.keys()),
+                             [current_thread()])
+
+            publisher.close()
+            self.assertEqual(publisher._sockets, {})
+            self.assertEqual(self.context.get('publisher.counter'), 2)
 
     def test_life_cycle(self):
 
@@ -213,12 +333,14 @@ class BusTests(unittest.TestCase):
 
                 while self.bus.context.get('general.switch', 'off') == 'on':
 
-                    message = subscriber.get()
-                    if not message:
+                    message = subscriber.receive()
+                    if not message[1]:
                         time.sleep(0.001)
                         continue
 
+                    (channel, message) = message
                     self.bus.context.set('received', message)
+                    self.bus.context.set('channel', channel)
                     logging.info(u"- {}".format(message))
 
                 logging.info(u"Stopping subscriber")
@@ -240,8 +362,164 @@ class BusTests(unittest.TestCase):
         time.sleep(0.5)
         listener.join()
 
-#        self.assertEqual(self.context.get('received'), {'counter': 9})
+        self.assertEqual(self.context.get('received'), {'counter': 9})
+        self.assertEqual(self.context.get('channel'), 'channel')
+
+
+    def test_broker_stats(self):
+
+        logging.info(u"***** broker/stats")
+
+        broker = self.bus.serve()
+        self.assertTrue(isinstance(broker, Broker))
+        self.assertEqual(broker.topics, {})
+
+        self.assertEqual(broker.get_topic([b'channel_A {"a": 1}']),
+                         u'channel_A')
+        self.assertEqual(broker.get_topic([b'channel_B', b'{}']),
+                         u'channel_B')
+
+        broker.subscribe([b'\x01channel_A'])
+        broker.subscribe([b'\x01channel_A'])
+        broker.subscribe([b'\x00channel_A'])
+        broker.subscribe([b''])
+        broker.count([b'channel_A "hello"'])
+        broker.count([b'channel_A', b'"world"'])
+        broker.flush()
+
+        self.assertEqual(self.context.get('broker.topics'),
+                         {u'channel_A': {'messages': 2,
+                                         'bytes': 33,
+                                         'subscribers': 1}})
+
+    def test_broker_life_cycle(self):
+
+        logging.info(u"***** broker/life cycle")
+
+        self.context.set('bus.broker', 'tcp://127.0.0.1:6667')
+        broker = self.bus.serve()
+        broker.FLUSH = 0.1
+        broker.start()
+
+        socket = zmq.Context.instance().socket(zmq.SUB)
+        socket.linger = 0
+        socket.setsockopt(zmq.SUBSCRIBE, b'channel_')
+        socket.connect(self.context.get('bus.address'))
+
+        publishers = [self.bus.publish() for index in range(2)]
+        for index, publisher in enumerate(publishers):
+            publisher.put(u'channel_{}'.format(index), {'counter': index})
+            publisher.fan.put(None)
+            publisher.DEFER_DURATION = 0.5
+            publisher.start()
+
+        received = []
+        while socket.poll(3000):
+            received.append(socket.recv_multipart())
+            if len(received) == 2:
+                break
+
+        for publisher in publishers:
+            publisher.join()
+        socket.close()
+        self.context.set('general.switch', 'off')
+        broker.join()
+
+        self.assertEqual(sorted(received),
+                         [[b'channel_0', b'{"counter": 0}'],
+                          [b'channel_1', b'{"counter": 1}']])
+
+        topics = self.context.get('broker.topics')
+        self.assertEqual(topics[u'channel_0']['messages'], 1)
+        self.assertEqual(topics[u'channel_1']['messages'], 1)
+
+    def test_broker_subscribers(self):
+
+        logging.info(u"***** broker/subscribers")
+
+        self.context.set('bus.broker', 'tcp://127.0.0.1:6671')
+        broker = self.bus.serve()
+        broker.FLUSH = 0.1
+        broker.start()
+
+        sockets = []
+        for index in range(3):
+            socket = zmq.Context.instance().socket(zmq.SUB)
+            socket.linger = 0
+            socket.setsockopt(zmq.SUBSCRIBE, b'channel_A')
+            socket.connect(self.context.get('bus.address'))
+            sockets.append(socket)
+
+        def count():
+            topics = self.context.get('broker.topics', {})
+            return topics.get(u'channel_A', {}).get('subscribers')
+
+        for attempt in range(50):
+            if count() == 3:
+                break
+            time.sleep(0.1)
+        self.assertEqual(count(), 3)
+
+        sockets[0].setsockopt(zmq.UNSUBSCRIBE, b'channel_A')
+        for attempt in range(50):
+            if count() == 2:
+                break
+            time.sleep(0.1)
+        self.assertEqual(count(), 2)
+
+        sockets[1].close()  # subscriber has gone away
+        for attempt in range(50):
+            if count() == 1:
+                break
+            time.sleep(0.1)
+        self.assertEqual(count(), 1)
+
+        for socket in sockets:
+            socket.close()
+        self.context.set('general.switch', 'off')
+        broker.join()
+
+    def test_direct_life_cycle(self):
+
+        logging.info(u"***** direct/life cycle")
+
+        self.context.set('bus.broker', 'tcp://127.0.0.1:6669')
+        self.context.set('bus.direct', True)
+        broker = self.bus.serve()
+        broker.start()
+
+        socket = zmq.Context.instance().socket(zmq.SUB)
+        socket.linger = 0
+        socket.setsockopt(zmq.SUBSCRIBE, b'channel_')
+        socket.connect(self.context.get('bus.address'))
+
+        publisher = self.bus.publish()
+        publisher.DEFER_DURATION = 0.5
+
+        def produce(index):
+            publisher.put(u'channel_{}'.format(index), {'counter': index})
+            publisher.close()
+
+        workers = [Process(target=produce, args=(x,)) for x in range(2)]
+        for worker in workers:
+            worker.start()
+
+        received = []
+        while socket.poll(3000):
+            received.append(socket.recv_multipart())
+            if len(received) == 2:
+                break
+
+        for worker in workers:
+            worker.join()
+        socket.close()
+        self.context.set('general.switch', 'off')
+        broker.join()
 
+        self.assertEqual(sorted(received),
+                         [[b'channel_0', b'{"counter": 0}'],
+                          [b'channel_1', b'{"counter": 1}']])
+        self.assertEqual(self.context.get('publisher.counter'), 2)
 
 if __name__ == '__main__':
 
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+import gc
+import logging
+import mock
+import sys
+
+from shellbot import Context
+from shellbot.cache import Cache
+
+
+class CacheTests(unittest.TestCase):
+
+    def tearDown(self):
+        collected = gc.collect()
+        if collected:
+            logging.info("Garbage collector: collected %d objects." % (collected))
+
+    def test_init(self):
+
+        logging.info('***** init')
+
+        cache = Cache()
+        self.assertEqual(cache.size, 1000)
+        self.assertEqual(cache.duration, None)
+        self.assertEqual(len(cache), 0)
+
+        cache = Cache(size=10, duration=5.0)
+        self.assertEqual(cache.size, 10)
+        self.assertEqual(cache.duration, 5.0)
+
+        with self.assertRaises(AssertionError):
+            Cache(size=0)
+
+        with self.assertRaises(AssertionError):
+            Cache(duration=-1)
+
+    def test_put_get(self):
+
+        logging.info('***** put/get')
+
+        cache = Cache(size=3)
+        self.assertEqual(cache.get('a'), None)
+        self.assertEqual(cache.get('a', '*default'), '*default')
+
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.put('c', 3)
+        self.assertEqual(len(cache), 3)
+        self.assertEqual(cache.get('a'), 1)  # 'a' is now most recent
+
+        cache.put('d', 4)  # 'b' is pushed out
+        self.assertEqual(len(cache), 3)
+        self.assertTrue('a' in cache)
+        self.assertFalse('b' in cache)
+        self.assertTrue('c' in cache)
+        self.assertTrue('d' in cache)
+
+        cache.forget('a')
+        self.assertFalse('a' in cache)
+        cache.forget()
+        self.assertEqual(len(cache), 0)
+
+    def test_duration(self):
+
+        logging.info('***** duration')
+
+        cache = Cache(duration=10.0)
+        with mock.patch('time.time', return_value=100.0):
+            cache.put('a', 1)
+            cache.put('b', 2)
+            cache.get('a')
+
+        with mock.patch('time.time', return_value=105.0):
+            cache.put('c', 3)
+            self.assertEqual(cache.get('a'), 1)
+            self.assertEqual(len(cache), 3)
+
+        with mock.patch('time.time', return_value=111.0):
+            self.assertEqual(cache.get('a'), None)
+            self.assertFalse('b' in cache)
+            self.assertEqual(cache.get('c'), 3)
+            self.assertEqual(len(cache), 1)
+
+    def test_seen(self):
+
+        logging.info('***** seen')
+
+        cache = Cache(size=2, duration=10.0)
+        with mock.patch('time.time', return_value=100.0):
+            self.assertFalse(cache.seen('a'))
+            self.assertTrue(cache.seen('a'))
+            self.assertFalse(cache.seen('b'))
+            self.assertTrue(cache.seen('a'))
+
+        with mock.patch('time.time', return_value=200.0):
+            self.assertFalse(cache.seen('a'))
+            self.assertTrue(cache.seen('a'))
+
+        self.assertFalse(cache.seen('c'))
+        self.assertFalse(cache.seen('d'))
+        self.assertFalse(cache.seen('a'))  # pushed out by 'c' and 'd'
+
+
+if __name__ == '__main__':
+
+    Context.set_logger()
+    sys.exit(unittest.main())
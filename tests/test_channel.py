@@ -53,6 +53,7 @@ class ChannelTests(unittest.TestCase):
         self.assertEqual(channel.title, "A fancy channel")
         self.assertTrue(channel.is_direct)
         self.assertFalse(channel.is_moderated)
+        self.assertFalse(channel.is_group)
 
     def test___getattr__(self):
 
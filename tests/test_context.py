@@ -384,6 +384,47 @@ class ContextTests(unittest.TestCase):
         value = self.context.decrement('gauge')
         self.assertEqual(value, -1)
 
+    def test_append(self):
+
+        self.assertEqual(self.context.append('list', 'a'), ['a'])
+        self.assertEqual(self.context.append('list', 'b'), ['a', 'b'])
+        self.assertEqual(self.context.append('list', 'c', limit=2),
+                         ['b', 'c'])
+        self.assertEqual(self.context.get('list'), ['b', 'c'])
+
+        self.context.set('list', 'world')
+        self.assertEqual(self.context.append('list', 'a'), ['a'])
+
+    def test_remove(self):
+
+        self.assertEqual(self.context.remove('list', 'a'), None)
+        self.context.append('list', 'a')
+        self.context.append('list', {'id': 1, 'x': 'b'})
+        self.context.append('list', {'id': 2, 'x': 'c'})
+        self.assertEqual(self.context.remove('list', {'id': 3}), None)
+        self.assertEqual(self.context.remove('list', 'a'), 'a')
+        self.assertEqual(self.context.remove('list', 2, field='id'),
+                         {'id': 2, 'x': 'c'})
+        self.assertEqual(self.context.remove('list', 2, field='id'), None)
+        self.assertEqual(self.context.get('list'), [{'id': 1, 'x': 'b'}])
+
+    def test_observe(self):
+
+        histogram = self.context.observe('latency', 0.3, buckets=[0.1, 1.0])
+        self.assertEqual(histogram['bounds'], [0.1, 1.0])
+        self.assertEqual(histogram['buckets'], [0, 1])
+
+        self.context.observe('latency', 0.05)
+        histogram = self.context.observe('latency', 2.0)
+        self.assertEqual(histogram['buckets'], [1, 2])
+        self.assertEqual(histogram['count'], 3)
+        self.assertAlmostEqual(histogram['sum'], 2.35)
+        self.assertEqual(self.context.get('latency'), histogram)
+
+        histogram = self.context.observe('default', 0.02)
+        self.assertEqual(len(histogram['bounds']), len(Context.BUCKETS))
+        self.assertEqual(histogram['buckets'][:3], [0, 0, 1])
+
     def test_gauge(self):
 
         # undefined key
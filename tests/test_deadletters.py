@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+import gc
+import logging
+import mock
+from multiprocessing import Queue
+import sys
+import time
+
+from shellbot import Context, Engine, Vibes
+from shellbot.deadletters import DeadLetters
+
+
+class DeadLettersTests(unittest.TestCase):
+
+    def setUp(self):
+        self.context = Context()
+        self.engine = Engine(context=self.context,
+                             ears=Queue(),
+                             mouth=Queue(),
+                             fan=Queue())
+        self.engine.mouths = {'bulk': Queue()}
+
+    def tearDown(self):
+        del self.engine
+        del self.context
+        collected = gc.collect()
+        if collected:
+            logging.info("Garbage collector: collected %d objects." % (collected))
+
+    def test_init(self):
+
+        logging.info("*** init")
+
+        letters = DeadLetters(engine=self.engine)
+        self.assertTrue(letters.engine is self.engine)
+        self.assertEqual(letters.list(), [])
+        self.assertTrue(isinstance(self.engine.deadletters, DeadLetters))
+
+    def test_add(self):
+
+        logging.info("*** add")
+
+        letters = DeadLetters(engine=self.engine)
+        try:
+            raise KeyError('text')
+        except Exception as feedback:
+            letter = letters.add('listener', '*item', feedback,
+                                 started=time.time() - 1.0)
+
+        self.assertEqual(letter['id'], 1)
+        self.assertEqual(letter['stage'], 'listener')
+        self.assertEqual(letter['item'], '*item')
+        self.assertEqual(letter['error'], u"KeyError: 'text'")
+        self.assertTrue('raise KeyError' in letter['traceback'])
+        self.assertTrue(letter['duration'] >= 1.0)
+        self.assertEqual(letters.list(), [letter])
+
+        self.context.set('deadletters.limit', 2)
+        for index in range(3):
+            letters.add('observer', index, Exception('TEST'))
+        self.assertEqual([x['item'] for x in letters.list()], [1, 2])
+        self.assertEqual(letters.list()[-1]['id'], 4)
+        self.assertEqual(letters.list()[-1]['duration'], None)
+
+        with mock.patch.object(self.context, 'append',
+                               side_effect=Exception('TEST')):
+            self.assertEqual(letters.add('speaker', 3, Exception()), None)
+
+    def test_replay(self):
+
+        logging.info("*** replay")
+
+        letters = DeadLetters(engine=self.engine)
+        letters.add('listener', '*inbound', Exception('TEST'))
+        letters.add('speaker', Vibes(text='*bulk', priority='bulk'),
+                    Exception('TEST'))
+        letters.add('speaker', '*outbound', Exception('TEST'))
+        letters.add('observer', '*fan', Exception('TEST'))
+
+        self.assertEqual(letters.replay(id='3'), 1)
+        self.assertEqual(self.engine.mouth.get(True, 1.0), '*outbound')
+        self.assertEqual(letters.replay(id=3), 0)
+        self.assertEqual([x['id'] for x in letters.list()], [1, 2, 4])
+
+        self.assertEqual(letters.replay(), 3)
+        self.assertEqual(self.engine.ears.get(True, 1.0), '*inbound')
+        self.assertEqual(self.engine.mouths['bulk'].get(True, 1.0).text,
+                         '*bulk')
+        self.assertEqual(self.engine.fan.get(True, 1.0), '*fan')
+        self.assertEqual(letters.list(), [])
+
+    def test_clear(self):
+
+        logging.info("*** clear")
+
+        letters = DeadLetters(engine=self.engine)
+        self.assertEqual(letters.clear(), 0)
+        letters.add('listener', '*inbound', Exception('TEST'))
+        self.assertEqual(letters.clear(), 1)
+        self.assertEqual(letters.list(), [])
+
+
+if __name__ == '__main__':
+
+    Context.set_logger()
+    sys.exit(unittest.main())
@@ -7,11 +7,14 @@ import logging
 import os
 import mock
 from multiprocessing import Manager, Process, Queue
+import shutil
 import sys
+import tempfile
 import time
 
 from shellbot import Context, Engine, ShellBot, MachineFactory
 from shellbot.i18n import _, localization as l10n
+from shellbot.queues import BoundedQueue, DurableQueue
 from shellbot.spaces import Space, LocalSpace, SparkSpace
 
 
@@ -323,6 +326,19 @@ class EngineTests(unittest.TestCase):
         self.assertTrue(self.engine.bus is not None)
         self.assertTrue(self.engine.publisher is not None)
 
+        self.assertEqual(self.engine.get('profiler.switch'), None)
+
+    def test_configure_profile(self):
+
+        logging.info('*** configure profile ***')
+
+        self.engine.configure({'server': {'profile': '/profile'}})
+        self.assertEqual(self.engine.get('profiler.switch'), 'off')
+
+        self.engine.set('profiler.switch', 'on')
+        self.engine.check()
+        self.assertEqual(self.engine.get('profiler.switch'), 'on')
+
     def test_configure_environment(self):
 
         logging.info('*** configure from the environment ***')
@@ -627,6 +643,31 @@ class EngineTests(unittest.TestCase):
             self.context.set('server.binding', '0.0.0.0')
             self.engine.hook(server=server)
             mocked.assert_called_with(hook_url='http://here.you.go:123/hook')
+            self.assertEqual(server.add_route.call_count, 2)
+
+            self.context.set('server.metrics', '/metrics')
+            self.engine.hook(server=server)
+            route = server.add_route.call_args[0][0]
+            self.assertEqual(route.route, '/metrics')
+            self.assertTrue(route.engine is self.engine)
+
+            self.context.set('server.profile', '/profile')
+            self.context.set('server.deadletters', '/deadletters')
+            server.add_route.reset_mock()
+            self.engine.hook(server=server)  # no admin token
+            self.assertEqual([x[0][0].route
+                              for x in server.add_route.call_args_list],
+                             ['/hook', '/metrics'])
+
+            self.context.set('server.admin_token', '*secret')
+            server.add_route.reset_mock()
+            self.engine.hook(server=server)
+            routes = [x[0][0] for x in server.add_route.call_args_list]
+            self.assertEqual([x.route for x in routes],
+                             ['/hook', '/metrics', '/profile', '/deadletters'])
+            self.assertEqual(routes[2].token, '*secret')
+            self.assertEqual(routes[3].token, '*secret')
+            self.assertTrue(routes[3].engine is self.engine)
 
     def test_get_hook(self):
 
@@ -673,12 +714,73 @@ class EngineTests(unittest.TestCase):
         engine.start_processes = mock.Mock()
         engine.on_start = mock.Mock()
 
+        self.assertTrue(engine.get_mouth('bulk') is None)
+
         engine.start()
         self.assertTrue(engine.ears is not None)
         self.assertTrue(engine.mouth is not None)
+        self.assertEqual(sorted(engine.mouths.keys()), ['bulk', 'interactive'])
+        self.assertTrue(engine.get_mouth() is engine.mouth)
+        self.assertTrue(engine.get_mouth('normal') is engine.mouth)
+        self.assertTrue(engine.get_mouth('bulk') is engine.mouths['bulk'])
+        self.assertTrue(engine.get_mouth('*unknown') is engine.mouth)
         self.assertTrue(engine.start_processes.called)
         self.assertTrue(engine.on_start.called)
 
+    def test_start_durable(self):
+
+        logging.info('*** start with durable ears ***')
+
+        path = tempfile.mkdtemp()
+        try:
+            self.context.set('ears.log', path)
+            engine = Engine(context=self.context)
+            engine.space=LocalSpace(context=self.context)
+            engine.start_processes = mock.Mock()
+
+            engine.start()
+            self.assertTrue(isinstance(engine.ears, DurableQueue))
+            self.assertTrue(engine.space.ears is engine.ears)
+            self.assertEqual(engine.ears.path, path)
+
+        finally:
+            shutil.rmtree(path)
+
+    def test_build_queue(self):
+
+        logging.info('*** build_queue ***')
+
+        engine = Engine(context=self.context)
+        queue = engine.build_queue('ears')
+        self.assertFalse(isinstance(queue, BoundedQueue))
+
+        engine.configure({'ears': {'size': 10, 'policy': 'drop_oldest'},
+                          'mouth': {'size': 5}})
+        queue = engine.build_queue('ears')
+        self.assertEqual(queue.name, 'ears')
+        self.assertEqual(queue.maxsize, 10)
+        self.assertEqual(queue.policy, 'drop_oldest')
+
+        queue = engine.build_queue('mouth', lane='bulk')
+        self.assertEqual(queue.name, 'mouth.bulk')
+        self.assertEqual(queue.maxsize, 5)
+        self.assertEqual(queue.policy, 'block')
+
+    def test_start_direct(self):
+
+        logging.info('*** start direct ***')
+
+        self.context.set('bus.broker', 'tcp://127.0.0.1:6670')
+        self.context.set('bus.direct', True)
+        engine = Engine(context=self.context)
+        engine.configure()
+        for name in ('speaker', 'listener', 'publisher', 'observer'):
+            setattr(getattr(engine, name), 'start', mock.Mock())
+
+        engine.start_processes()
+        self.assertTrue(engine.observer.start.called)
+        self.assertFalse(engine.publisher.start.called)
+
     def test_static(self):
 
         logging.info('*** static test ***')
@@ -2,9 +2,11 @@
 # -*- coding: utf-8 -*-
 
 import unittest
+import copy
 import gc
 import json
 import logging
+import mock
 from multiprocessing import Queue
 import os
 import sys
@@ -12,6 +14,7 @@ import yaml
 
 from shellbot import Context
 from shellbot.events import Event, Message, Join, Leave, EventFactory
+from shellbot.events import AttachmentName
 
 
 class EventsTests(unittest.TestCase):
@@ -228,6 +231,29 @@ class EventsTests(unittest.TestCase):
         after = Message(my_queue.get())
         self.assertEqual(after.attributes, item)
 
+    def test_attachment_name(self):
+
+        space = mock.Mock()
+        space.name_attachment.return_value = 'report.pdf'
+
+        name = AttachmentName(space, 'http://a.server/files/123')
+        self.assertTrue(name)
+        self.assertFalse(AttachmentName(space, None))
+        self.assertEqual(repr(name),
+                         'AttachmentName("http://a.server/files/123")')
+        self.assertFalse(space.name_attachment.called)
+
+        self.assertEqual(u"Got {}".format(name), u'Got report.pdf')
+        self.assertEqual(name, 'report.pdf')
+        self.assertTrue(name.endswith('.pdf'))
+        self.assertEqual(u'> ' + name, u'> report.pdf')
+        self.assertEqual(str(name), 'report.pdf')
+        space.name_attachment.assert_called_once_with(
+            'http://a.server/files/123')
+
+        copied = copy.copy(name)
+        self.assertEqual(copied, 'report.pdf')
+
     def test_join_init(self):
 
         event = Join()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+import gc
+import logging
+import mock
+from multiprocessing import Queue
+import os
+import sys
+import tempfile
+
+from shellbot import Context, Engine, Speaker, Vibes
+from shellbot.journal import Journal
+
+
+class JournalTests(unittest.TestCase):
+
+    def setUp(self):
+        (handle, self.path) = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+
+    def tearDown(self):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+        collected = gc.collect()
+        if collected:
+            logging.info("Garbage collector: collected %d objects." % (collected))
+
+    def test_journal(self):
+
+        logging.info("*** journal")
+
+        journal = Journal(path=self.path)
+        self.assertEqual(journal.pending(), [])
+
+        first = Vibes(text='hello', channel_id='*id1', priority='bulk')
+        key = journal.record(first)
+        self.assertEqual(len(key), 32)
+        self.assertEqual(first.key, key)
+
+        second = Vibes(content='**world**', person='a@b.com')
+        second.key = '*key'
+        self.assertEqual(journal.record(second), '*key')
+        self.assertEqual(journal.record(second), '*key')  # ignored
+
+        pending = journal.pending()
+        self.assertEqual([x.key for x in pending], [key, '*key'])
+        self.assertEqual(pending[0].text, 'hello')
+        self.assertEqual(pending[0].channel_id, '*id1')
+        self.assertEqual(pending[0].priority, 'bulk')
+        self.assertEqual(pending[1].content, '**world**')
+        self.assertEqual(pending[1].person, 'a@b.com')
+
+        self.assertFalse(journal.is_posted(key))
+        journal.complete(key)
+        self.assertTrue(journal.is_posted(key))
+        self.assertFalse(journal.is_posted('*unknown'))
+
+        for attempt in range(Journal.ATTEMPTS - 1):
+            journal.fail('*key')
+            self.assertEqual([x.key for x in journal.pending()], ['*key'])
+        journal.fail('*key')
+        self.assertEqual(journal.pending(), [])
+
+        self.assertEqual(journal.purge(), 0)
+        journal.retention = -1.0
+        self.assertEqual(journal.purge(), 2)
+
+    def test_speaker(self):
+
+        logging.info("*** speaker")
+
+        context = Context({'speaker': {'journal': self.path}})
+        engine = Engine(context=context, type='local', mouth=Queue())
+        engine.start_processes = mock.Mock()
+        engine.start()
+        self.assertTrue(isinstance(engine.journal, Journal))
+
+        journal = Journal(path=self.path)  # from a previous run
+        journal.record(Vibes(text='replayed', channel_id='*id1'))
+        posted = Vibes(text='posted', channel_id='*id1')
+        journal.record(posted)
+        journal.complete(posted.key)
+
+        engine.mouth.put(posted)  # already posted
+        failed = Vibes(text='failed', channel_id='*id2')
+        engine.journal.record(failed)
+        engine.mouth.put(failed)
+        engine.mouth.put(None)
+
+        def post_message(id=None, text=None, **kwargs):
+            return text != 'failed'
+
+        speaker = Speaker(engine=engine)
+        with mock.patch.object(engine.space,
+                               'post_message',
+                               side_effect=post_message) as mocked:
+            speaker.run()
+
+        texts = [x[1]['text'] for x in mocked.call_args_list]
+        self.assertEqual(texts, ['replayed', 'failed', 'failed'])  # retried
+        self.assertEqual([x.text for x in journal.pending()], ['failed'])
+
+    def test_coalesce(self):
+
+        logging.info("*** coalesce")
+
+        context = Context({'speaker': {'journal': self.path,
+                                       'coalesce': 10.0}})
+        engine = Engine(context=context, type='local', mouth=Queue())
+        engine.start_processes = mock.Mock()
+        engine.start()
+
+        for text in ('hello', 'world'):
+            vibes = Vibes(text=text, channel_id='*id1')
+            engine.journal.record(vibes)
+            engine.mouth.put(vibes)
+        engine.mouth.put(None)
+
+        speaker = Speaker(engine=engine)
+        speaker.replay = mock.Mock()  # updates recorded while running
+        with mock.patch.object(engine.space,
+                               'post_message',
+                               return_value=None) as mocked:
+            speaker.run()
+
+        texts = [x[1]['text'] for x in mocked.call_args_list]
+        self.assertEqual(texts, ['hello\nworld'])
+        self.assertEqual(engine.journal.pending(), [])
+
+
+if __name__ == '__main__':
+
+    Context.set_logger()
+    sys.exit(unittest.main())
@@ -8,13 +8,16 @@ import logging
 import mock
 from multiprocessing import Process, Queue
 import os
+import shutil
 import sys
+import tempfile
 from threading import Timer
 import time
 import yaml
 
 from shellbot import Context, Engine, Listener, SpaceFactory, Vibes
 from shellbot.events import Event, Message, Join, Leave
+from shellbot.queues import DurableQueue
 
 
 class MyEngine(Engine):
@@ -194,6 +197,10 @@ class ListenerTests(unittest.TestCase):
         self.engine.ears.put(None)
         listener.run()
         self.assertEqual(self.engine.get('listener.counter'), 0)
+        letters = self.engine.deadletters.list()
+        self.assertEqual([x['item'] for x in letters], ['dummy'])
+        self.assertEqual(letters[0]['stage'], 'listener')
+        self.assertEqual(letters[0]['error'], 'Exception: TEST')
 
         listener = Listener(engine=self.engine)
         listener.DEFER_DURATION = 0.0
@@ -202,6 +209,31 @@ class ListenerTests(unittest.TestCase):
         listener.run()
         self.assertEqual(self.engine.get('listener.counter'), 0)
 
+    def test_work_durable(self):
+
+        logging.info("*** run with durable ears")
+
+        path = tempfile.mkdtemp()
+        try:
+            self.engine.ears = DurableQueue(path=path)
+            self.engine.set('general.switch', 'on')
+
+            listener = Listener(engine=self.engine)
+            listener.DEFER_DURATION = 0.0
+            listener.process = mock.Mock(
+                side_effect=[None, Exception('TEST')])
+            self.engine.ears.put('first')
+            self.engine.ears.put('second')
+            self.engine.ears.put(None)
+            listener.run()
+            self.engine.ears.flush()
+
+            self.assertEqual(self.engine.ears.read_mark(), 1)
+            self.assertEqual(DurableQueue(path=path).replayed, 0)
+
+        finally:
+            shutil.rmtree(path)
+
     def test_run_wait(self):
 
         logging.info("*** run/wait while empty and not ready")
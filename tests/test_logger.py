@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+import gc
+import logging
+import mock
+import sys
+
+from shellbot import Context
+from shellbot.logger import Logger
+
+
+class Item(object):
+
+    def __init__(self):
+        self.count = 0
+
+    def __str__(self):
+        self.count += 1
+        return 'item'
+
+
+class LoggerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = Logger('shellbot.tests.logger')
+
+    def tearDown(self):
+        self.logger.logger.setLevel(logging.NOTSET)
+        collected = gc.collect()
+        if collected:
+            logging.info("Garbage collector: collected %d objects." % (collected))
+
+    def test_init(self):
+
+        logging.info("*** init")
+
+        self.assertEqual(self.logger.logger.name, 'shellbot.tests.logger')
+
+    def test_deferred(self):
+
+        logging.info("*** deferred")
+
+        self.logger.logger.setLevel(logging.INFO)
+        self.assertFalse(self.logger.is_enabled())
+        self.assertTrue(self.logger.is_enabled(logging.INFO))
+
+        item = Item()
+        with mock.patch.object(self.logger.logger, 'log') as mocked:
+            self.logger.debug(u"Processing {}", item)
+            self.assertFalse(mocked.called)
+            self.assertEqual(item.count, 0)
+
+            self.logger.info(u"Processing {}", item)
+            mocked.assert_called_with(logging.INFO, u"Processing item")
+            self.assertEqual(item.count, 1)
+
+            self.logger.warning(u"Processing {label}", label='hello')
+            mocked.assert_called_with(logging.WARNING, u"Processing hello")
+
+            self.logger.error(u"Literal {}")
+            mocked.assert_called_with(logging.ERROR, u"Literal {}")
+
+        self.logger.logger.setLevel(logging.DEBUG)
+        with mock.patch.object(self.logger.logger, 'log') as mocked:
+            self.logger.debug(u"Processing {}", item)
+            mocked.assert_called_with(logging.DEBUG, u"Processing item")
+
+    def test_exception(self):
+
+        logging.info("*** exception")
+
+        with mock.patch.object(self.logger.logger, 'exception') as mocked:
+            feedback = ValueError('hello')
+            self.logger.exception(feedback)
+            mocked.assert_called_with(feedback)
+
+
+if __name__ == '__main__':
+
+    Context.set_logger()
+    sys.exit(unittest.main())
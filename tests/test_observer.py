@@ -190,6 +190,9 @@ class ObserverTests(unittest.TestCase):
         self.engine.fan.put(None)
         self.engine.observer.run()
         self.assertEqual(self.engine.get('observer.counter'), 0)
+        letter = self.engine.deadletters.list()[-1]
+        self.assertEqual(letter['stage'], 'observer')
+        self.assertEqual(letter['error'], 'Exception: TEST')
 
         self.engine.observer = Observer(engine=self.engine)
         self.engine.observer.process = mock.Mock(side_effect=KeyboardInterrupt('ctl-C'))
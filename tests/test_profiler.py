@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+import gc
+import logging
+import os
+import sys
+from threading import Event, Thread
+import time
+
+from shellbot import Context
+from shellbot.profiler import Profiler
+
+
+class ProfilerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.context = Context()
+
+    def tearDown(self):
+        del self.context
+        collected = gc.collect()
+        if collected:
+            logging.info("Garbage collector: collected %d objects." % (collected))
+
+    def test_collapse(self):
+
+        logging.info("*** collapse")
+
+        profiler = Profiler(self.context)
+        profiler.name = 'worker'
+
+        def inner():
+            return sys._getframe()
+
+        def outer():
+            return inner()
+
+        stack = profiler.collapse(outer())
+        frames = stack.split(';')
+        self.assertEqual(frames[0], 'worker')
+        self.assertEqual(frames[-2], 'outer (test_profiler.py)')
+        self.assertEqual(frames[-1], 'inner (test_profiler.py)')
+
+    def test_sample(self):
+
+        logging.info("*** sample")
+
+        profiler = Profiler(self.context)
+        profiler.name = 'worker'
+
+        done = Event()
+
+        def waiting():
+            done.wait()
+
+        thread = Thread(target=waiting)
+        thread.start()
+        try:
+            profiler.sample()
+            profiler.sample()
+        finally:
+            done.set()
+            thread.join()
+
+        stacks = [x for x in profiler.stacks.keys() if 'waiting' in x]
+        self.assertEqual(len(stacks), 1)
+        self.assertEqual(profiler.stacks[stacks[0]], 2)
+        self.assertFalse(
+            any('sample (profiler.py)' in x for x in profiler.stacks.keys()))
+
+    def test_report(self):
+
+        logging.info("*** report")
+
+        profiler = Profiler(self.context)
+        self.assertEqual(profiler.report(), '')
+
+        profiler.name = 'listener'
+        profiler.stacks['listener;run (listener.py)'] = 3
+        profiler.flush()
+        self.assertEqual(
+            self.context.get(u'profiler.stacks.listener-{}'.format(os.getpid())),
+            {'listener;run (listener.py)': 3})
+
+        self.context.set('profiler.stacks.listener-1',
+                         {'listener;run (listener.py)': 2,
+                          'listener;idle (listener.py)': 1})
+        self.assertEqual(profiler.report(),
+                         'listener;idle (listener.py) 1\n'
+                         'listener;run (listener.py) 5\n')
+
+    def test_run(self):
+
+        logging.info("*** run")
+
+        profiler = Profiler()
+        profiler.POLL = 0.05
+        profiler.FLUSH = 0.05
+        self.context.set('profiler.switch', 'on')
+        profiler.start(self.context, 'tester')
+
+        time.sleep(0.5)
+        self.context.set('profiler.switch', 'off')
+        time.sleep(0.2)
+
+        report = profiler.report()
+        self.assertTrue(report.startswith('tester;'))
+        self.assertTrue('test_run (test_profiler.py)' in report)
+
+        profiler.stop()
+        self.assertEqual(profiler._thread, None)
+
+    def test_start_stop(self):
+
+        logging.info("*** start/stop")
+
+        profiler = Profiler()
+        profiler.start(self.context, 'tester')  # not configured
+        self.assertEqual(profiler._thread, None)
+        profiler.stop()
+
+        profiler.POLL = 0.05
+        profiler.FLUSH = 10.0
+        self.context.set('profiler.switch', 'on')
+        profiler.start(self.context, 'tester')
+        thread = profiler._thread
+        self.assertTrue(thread.is_alive())
+
+        time.sleep(0.2)
+        profiler.stop()
+        self.assertFalse(thread.is_alive())
+        self.assertTrue(profiler.report().startswith('tester;'))  # flushed
+
+
+if __name__ == '__main__':
+
+    Context.set_logger()
+    sys.exit(unittest.main())
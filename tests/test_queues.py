@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+import gc
+import logging
+import mock
+from multiprocessing import Process
+import os
+import shutil
+from six.moves.queue import Empty, Full
+import sys
+import tempfile
+import time
+
+from shellbot import Context
+from shellbot.queues import BoundedQueue, DurableQueue
+
+
+class BoundedQueueTests(unittest.TestCase):
+
+    def tearDown(self):
+        collected = gc.collect()
+        if collected:
+            logging.info("Garbage collector: collected %d objects." % (collected))
+
+    def drain(self, queue):
+        items = []
+        while True:
+            try:
+                items.append(queue.get(timeout=0.1))
+            except Empty:
+                return items
+
+    def test_init(self):
+
+        logging.info("*** init")
+
+        queue = BoundedQueue()
+        self.assertEqual(queue.name, 'queue')
+        self.assertEqual(queue.maxsize, 1000)
+        self.assertEqual(queue.policy, 'block')
+        self.assertEqual(queue.path, None)
+        self.assertTrue(queue.empty())
+        self.assertFalse(queue.is_saturated)
+        self.assertEqual(queue.stats(),
+                         {'capacity': 1000, 'dropped': 0, 'spilled': 0})
+
+        with self.assertRaises(AssertionError):
+            BoundedQueue(maxsize=0)
+
+        with self.assertRaises(AssertionError):
+            BoundedQueue(policy='*unknown')
+
+    def test_block(self):
+
+        logging.info("*** block")
+
+        queue = BoundedQueue(maxsize=2)
+        queue.put('a')
+        queue.put('b')
+        time.sleep(0.1)
+        self.assertTrue(queue.full())
+        self.assertTrue(queue.is_saturated)
+
+        with self.assertRaises(Full):
+            queue.put('c', timeout=0.1)
+
+        with self.assertRaises(Full):
+            queue.put_nowait('c')
+
+        self.assertEqual(self.drain(queue), ['a', 'b'])
+        self.assertEqual(queue.stats()['dropped'], 0)
+
+    def test_drop_newest(self):
+
+        logging.info("*** drop_newest")
+
+        queue = BoundedQueue(maxsize=2, policy='drop_newest')
+        for item in ('a', 'b', 'c', 'd'):
+            queue.put(item)
+        time.sleep(0.1)
+        self.assertTrue(queue.is_saturated)
+
+        self.assertEqual(self.drain(queue), ['a', 'b'])
+        self.assertEqual(queue.stats()['dropped'], 2)
+
+    def test_drop_oldest(self):
+
+        logging.info("*** drop_oldest")
+
+        queue = BoundedQueue(maxsize=2, policy='drop_oldest')
+        for item in ('a', 'b', 'c', 'd'):
+            queue.put(item)
+            time.sleep(0.05)
+
+        self.assertEqual(self.drain(queue), ['c', 'd'])
+        self.assertEqual(queue.stats()['dropped'], 2)
+
+    def test_spill(self):
+
+        logging.info("*** spill")
+
+        queue = BoundedQueue(maxsize=2, policy='spill')
+        self.assertTrue(os.path.exists(queue.path))
+
+        try:
+            for item in ('a', 'b', {'c': 3}, 'd'):
+                queue.put(item)
+            time.sleep(0.1)
+            self.assertFalse(queue.is_saturated)
+            self.assertEqual(queue.qsize(), 4)
+
+            self.assertEqual(queue.get(), 'a')
+            queue.put('e')  # goes after spilled items
+            self.assertEqual(self.drain(queue), ['b', {'c': 3}, 'd', 'e'])
+            self.assertTrue(queue.empty())
+            self.assertEqual(os.path.getsize(queue.path), 0)
+
+            self.assertEqual(queue.stats(),
+                             {'capacity': 2, 'dropped': 0, 'spilled': 3})
+
+        finally:
+            os.remove(queue.path)
+
+    def test_pills(self):
+
+        logging.info("*** pills")
+
+        queue = BoundedQueue(maxsize=1, policy='drop_newest')
+        queue.put('a')
+        with self.assertRaises(Full):
+            queue.put(None, timeout=0.1)
+
+        self.assertEqual(queue.get(), 'a')
+        queue.put(None)
+        self.assertEqual(queue.get(), None)
+
+    def test_pills_spill(self):
+
+        logging.info("*** pills/spill")
+
+        queue = BoundedQueue(maxsize=1, policy='spill')
+        try:
+            for item in ('a', 'b', None):
+                queue.put(item)
+            time.sleep(0.1)
+
+            self.assertEqual(self.drain(queue), ['a', 'b', None])
+            self.assertEqual(queue.stats()['spilled'], 1)
+
+        finally:
+            os.remove(queue.path)
+
+    def test_pills_drop_oldest(self):
+
+        logging.info("*** pills/drop_oldest")
+
+        queue = BoundedQueue(maxsize=2, policy='drop_oldest')
+        queue.put(None)
+        time.sleep(0.05)
+        for item in ('a', 'b', 'c'):
+            queue.put(item)
+            time.sleep(0.05)
+
+        self.assertEqual(self.drain(queue), [None, 'c'])
+        self.assertEqual(queue.stats()['dropped'], 2)
+
+        queue.put(None)
+        queue.put(None)
+        time.sleep(0.05)
+        queue.put('d')  # nothing to drop but pills
+        self.assertEqual(self.drain(queue), [None, None])
+        self.assertEqual(queue.stats()['dropped'], 3)
+
+
+
+class DurableQueueTests(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+        collected = gc.collect()
+        if collected:
+            logging.info("Garbage collector: collected %d objects." % (collected))
+
+    def test_init(self):
+
+        logging.info("*** init")
+
+        path = os.path.join(self.path, 'ears')
+        queue = DurableQueue(path=path)
+        self.assertTrue(os.path.isdir(path))
+        self.assertEqual(queue.name, 'ears')
+        self.assertEqual(queue.sync_count, DurableQueue.SYNC_COUNT)
+        self.assertEqual(queue.replayed, 0)
+        self.assertEqual(queue.read_mark(), -1)
+        self.assertTrue(queue.empty())
+        self.assertFalse(queue.full())
+
+    def test_replay(self):
+
+        logging.info("*** replay")
+
+        queue = DurableQueue(path=self.path)
+        for item in ('a', {'b': 2}, 'c', 'd'):
+            queue.put(item)
+
+        self.assertEqual(queue.get(), 'a')
+        queue.ack()
+        self.assertEqual(queue.get(), {'b': 2})
+        queue.ack()
+        self.assertEqual(queue.get(), 'c')  # crash before ack
+        queue.flush()
+        self.assertEqual(queue.read_mark(), 1)
+
+        queue = DurableQueue(path=self.path)  # restart
+        self.assertEqual(queue.replayed, 2)
+        queue.put('e')
+        items = []
+        while not queue.empty() or len(items) < 3:
+            items.append(queue.get(timeout=1.0))
+            queue.ack()
+        self.assertEqual(items, ['c', 'd', 'e'])
+
+        queue = DurableQueue(path=self.path)
+        self.assertEqual(queue.replayed, 0)
+
+    def test_pills(self):
+
+        logging.info("*** pills")
+
+        queue = DurableQueue(path=self.path)
+        queue.put(None)
+        self.assertEqual(queue.get(), None)
+        queue.ack()
+        self.assertEqual(queue.read_mark(), -1)
+        self.assertEqual(DurableQueue(path=self.path).replayed, 0)
+
+    def test_order(self):
+
+        logging.info("*** order")
+
+        queue = DurableQueue(path=self.path, sync_count=1)
+        for item in ('a', 'b', 'c'):
+            queue.put(item)
+        queue.get()
+        queue.get()
+        queue.ack()  # 'b' is done before 'a'
+        self.assertEqual(queue.acked.value, -1)
+
+        queue._current = 0
+        queue.ack()
+        self.assertEqual(queue.acked.value, 1)
+        self.assertEqual(queue.read_mark(), 1)
+
+    def test_damaged(self):
+
+        logging.info("*** damaged")
+
+        queue = DurableQueue(path=self.path, sync_count=1)
+        queue.put('a')
+        queue.put('b')
+
+        segment = queue.get_segment_path(0)
+        with open(segment, 'r+b') as handle:
+            handle.truncate(os.path.getsize(segment) - 1)
+
+        queue = DurableQueue(path=self.path)
+        self.assertEqual(queue.replayed, 1)
+        self.assertEqual(queue.get(), 'a')
+        self.assertEqual(queue.sequence.value, 1)
+
+    def test_compact(self):
+
+        logging.info("*** compact")
+
+        with mock.patch.object(DurableQueue, 'SEGMENT', 10):
+            queue = DurableQueue(path=self.path, sync_count=1)
+            for item in ('a', 'b', 'c'):
+                queue.put(item)
+            self.assertEqual(queue.list_segments(), [0, 1, 2])
+
+            queue.get()
+            queue.ack()
+            self.assertEqual(queue.list_segments(), [1, 2])
+            queue.get()
+            queue.ack()
+            queue.get()
+            queue.ack()
+            self.assertEqual(queue.list_segments(), [2])
+
+            queue = DurableQueue(path=self.path)
+            self.assertEqual(queue.replayed, 0)
+
+    def test_processes(self):
+
+        logging.info("*** processes")
+
+        queue = DurableQueue(path=self.path)
+
+        def produce(label):
+            for index in range(10):
+                queue.put(u'{}{}'.format(label, index))
+            queue.flush()
+
+        workers = [Process(target=produce, args=(x,)) for x in 'ab']
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        queue = DurableQueue(path=self.path)
+        self.assertEqual(queue.replayed, 20)
+        items = [queue.get() for index in range(20)]
+        self.assertEqual([x for x in items if x[0] == 'a'],
+                         [u'a{}'.format(x) for x in range(10)])
+
+if __name__ == '__main__':
+
+    Context.set_logger()
+    sys.exit(unittest.main())
@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+import gc
+import logging
+import mock
+from multiprocessing import Queue
+import sys
+from threading import Timer
+
+from shellbot import Context, Engine
+from shellbot.shards import HashRing, Shards, ShardReceiver
+
+
+class FakeSubscriber(object):
+
+    def __init__(self, engine, items):
+        self.engine = engine
+        self.items = items
+
+    def get(self):
+        if not self.items:
+            self.engine.set('general.switch', 'off')
+            return None
+        item = self.items.pop(0)
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+
+class HashRingTests(unittest.TestCase):
+
+    def tearDown(self):
+        collected = gc.collect()
+        if collected:
+            logging.info("Garbage collector: collected %d objects." % (collected))
+
+    def test_ring(self):
+
+        logging.info("*** ring")
+
+        ring = HashRing()
+        self.assertEqual(ring.nodes, [])
+        self.assertEqual(ring.get_node('*id'), None)
+
+        ring = HashRing(['node1', 'node2', 'node3'], replicas=32)
+        self.assertEqual(ring.nodes, ['node1', 'node2', 'node3'])
+        self.assertEqual(len(ring.points), 96)
+
+        keys = [u'*channel{}'.format(x) for x in range(300)]
+        before = dict((x, ring.get_node(x)) for x in keys)
+        self.assertEqual(before, dict((x, ring.get_node(x)) for x in keys))
+        for node in ring.nodes:
+            self.assertTrue(len([x for x in keys if before[x] == node]) > 50)
+
+        ring.add('node4')
+        after = dict((x, ring.get_node(x)) for x in keys)
+        moved = [x for x in keys if before[x] != after[x]]
+        self.assertTrue(0 < len(moved) < 150)
+        self.assertEqual(set(after[x] for x in moved), set(['node4']))
+
+        ring.remove('node4')
+        self.assertEqual(before, dict((x, ring.get_node(x)) for x in keys))
+
+        ring.remove('*unknown')
+        self.assertEqual(ring.nodes, ['node1', 'node2', 'node3'])
+
+
+class ShardsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.context = Context()
+        self.engine = Engine(context=self.context, mouth=Queue())
+        self.engine.space = mock.Mock()
+        self.engine.space.webhook.return_value = 'OK'
+        self.engine.publisher = mock.Mock()
+
+    def tearDown(self):
+        del self.engine
+        del self.context
+        collected = gc.collect()
+        if collected:
+            logging.info("Garbage collector: collected %d objects." % (collected))
+
+    def test_init(self):
+
+        logging.info("*** init")
+
+        shards = Shards(engine=self.engine)
+        self.assertFalse(shards.is_enabled)
+        self.assertEqual(shards.node, None)
+        self.assertEqual(shards.get_ring().nodes, [])
+        self.assertEqual(Shards.get_channel('node1'), u'shard/node1/')
+        self.assertTrue(self.engine.get_hook() is self.engine.space.webhook)
+
+        self.context.apply({'shards': {'node': 'node1',
+                                       'nodes': ['node1', 'node2']}})
+        self.assertTrue(shards.is_enabled)
+        self.assertEqual(shards.node, 'node1')
+        self.assertEqual(self.engine.get_hook(), self.engine.shards.webhook)
+
+    def test_webhook(self):
+
+        logging.info("*** webhook")
+
+        self.context.apply({'shards': {'node': 'node1',
+                                       'nodes': ['node1', 'node2']}})
+        shards = Shards(engine=self.engine)
+
+        items = [{'data': {'roomId': u'*room{}'.format(x)}}
+                 for x in range(20)]
+        owners = [shards.get_owner(x) for x in items]
+        self.assertEqual(set(owners), set(['node1', 'node2']))
+
+        for item in items:
+            self.assertEqual(shards.webhook(item), 'OK')
+
+        local = [x[0][0] for x in self.engine.space.webhook.call_args_list]
+        self.assertEqual(local, [x for x, y in zip(items, owners)
+                                 if y == 'node1'])
+
+        forwarded = [x[0] for x in self.engine.publisher.put.call_args_list]
+        expected = [x for x, y in zip(items, owners) if y == 'node2']
+        self.assertEqual(forwarded,
+                         [(u'shard/node2/', {'node': 'node1',
+                                             'sequence': index + 1,
+                                             'item': x})
+                          for index, x in enumerate(expected)])
+        self.assertEqual(self.context.get('shards.forwarded'), len(forwarded))
+
+    def test_webhook_refused(self):
+
+        logging.info("*** webhook/refused")
+
+        self.context.apply({'shards': {'node': 'node1', 'nodes': 'node2'}})
+        shards = Shards(engine=self.engine)
+        item = {'data': {'roomId': '*room'}}  # owned by node2
+
+        self.assertTrue(shards.is_listening(u'shard/node2/'))  # no broker
+
+        self.context.set('broker.topics',
+                         {u'shard/node2/': {'messages': 0,
+                                            'bytes': 0,
+                                            'subscribers': 0}})
+        self.assertFalse(shards.is_listening(u'shard/node2/'))
+        self.assertFalse(shards.is_listening(u'shard/node3/'))
+        with mock.patch('shellbot.shards.response') as response, \
+                mock.patch.object(shards, 'get_owner',
+                                  return_value='node2'):  # not updated yet
+            self.assertEqual(shards.webhook(item), 'Service Unavailable')
+            self.assertEqual(response.status, 503)
+        self.assertFalse(self.engine.publisher.put.called)
+        self.assertEqual(self.context.get('shards.refused'), 1)
+
+        self.context.set('broker.topics',
+                         {u'shard/node2/': {'messages': 0,
+                                            'bytes': 0,
+                                            'subscribers': 1}})
+        self.assertEqual(shards.webhook(item), 'OK')
+        self.assertTrue(self.engine.publisher.put.called)
+
+    def test_rebalance(self):
+
+        logging.info("*** rebalance")
+
+        self.context.apply({'shards': {'node': 'node1', 'nodes': 'node1'}})
+        shards = Shards(engine=self.engine)
+        item = {'data': {'id': '*message'}}
+        self.assertEqual(shards.get_owner(item), 'node1')
+
+        shards.join('node2')
+        self.assertEqual(self.context.get('shards.nodes'), ['node1', 'node2'])
+        self.assertEqual(shards.get_ring().nodes, ['node1', 'node2'])
+
+        shards.leave('node1')
+        self.assertEqual(self.context.get('shards.nodes'), ['node2'])
+        self.assertEqual(shards.get_owner(item), 'node2')
+
+
+    def test_get_nodes(self):
+
+        logging.info("*** get_nodes")
+
+        self.context.apply({'shards': {'node': 'node1', 'nodes': 'node1'}})
+        shards = Shards(engine=self.engine)
+        self.assertEqual(shards.get_nodes(), ('node1',))  # no broker
+
+        self.context.set('broker.topics', {})
+        self.assertEqual(shards.get_nodes(), ())  # no receiver yet
+
+        self.context.set('broker.topics',
+                         {u'shard/node2/': {'subscribers': 1},
+                          u'shard/node1/': {'subscribers': 2},
+                          u'shard/node3/': {'subscribers': 0},
+                          u'shard/a/b/': {'subscribers': 1},
+                          u'shard/': {'subscribers': 1},
+                          u'channel': {'subscribers': 1}})
+        self.assertEqual(shards.get_nodes(), ('node1', 'node2'))
+
+    def test_failover(self):
+
+        logging.info("*** failover")
+
+        self.context.apply({'shards': {'node': 'node1',
+                                       'nodes': ['node1', 'node2', 'node3']}})
+        shards = Shards(engine=self.engine)
+
+        def listen(*nodes):
+            self.context.set('broker.topics',
+                             dict((Shards.get_channel(x), {'subscribers': 1})
+                                  for x in nodes))
+
+        listen('node1', 'node2', 'node3')
+        items = [{'data': {'roomId': u'*room{}'.format(x)}}
+                 for x in range(30)]
+        before = [shards.get_owner(x) for x in items]
+        self.assertEqual(set(before), set(['node1', 'node2', 'node3']))
+
+        listen('node1', 'node2')  # node3 is gone
+        after = [shards.get_owner(x) for x in items]
+        self.assertEqual(set(after), set(['node1', 'node2']))
+        for x, y in zip(before, after):
+            if x != 'node3':
+                self.assertEqual(x, y)  # other channels do not move
+
+        moved = [x for x, y in zip(items, before) if y == 'node3']
+        for item in moved:
+            self.assertEqual(shards.webhook(item), 'OK')  # no 503
+        self.assertEqual(self.context.get('shards.refused'), None)
+        channels = [x[0][0] for x in self.engine.publisher.put.call_args_list]
+        self.assertFalse(u'shard/node3/' in channels)
+
+        listen('node1', 'node2', 'node3')  # node3 is back
+        self.assertEqual([shards.get_owner(x) for x in items], before)
+
+        listen('node1', 'node2', 'node3', 'node4')  # a new node joins
+        self.assertEqual(shards.get_ring().nodes,
+                         ['node1', 'node2', 'node3', 'node4'])
+
+
+class ShardReceiverTests(unittest.TestCase):
+
+    def tearDown(self):
+        collected = gc.collect()
+        if collected:
+            logging.info("Garbage collector: collected %d objects." % (collected))
+
+    def test_run(self):
+
+        logging.info("*** run")
+
+        engine = Engine(context=Context(), mouth=Queue())
+        engine.configure({'shards': {'node': 'node2',
+                                     'nodes': ['node1', 'node2']}})
+        engine.space = mock.Mock()
+        engine.space.webhook.side_effect = [Exception('TEST'), 'OK']
+
+        subscriber = FakeSubscriber(engine, [{'id': 1},
+                                             ValueError('TEST'),
+                                             {'node': 'node1',
+                                              'sequence': 1,
+                                              'item': {'id': 2}}])
+        engine.bus.subscribe = mock.Mock(return_value=subscriber)
+
+        engine.set('general.switch', 'on')
+        receiver = ShardReceiver(engine=engine)
+        receiver.run()
+
+        engine.bus.subscribe.assert_called_with(u'shard/node2/')
+        self.assertEqual(engine.get('receiver.counter'), 2)
+        self.assertEqual([x[0][0] for x in engine.space.webhook.call_args_list],
+                         [{'id': 1}, {'id': 2}])
+
+    def test_check(self):
+
+        logging.info("*** check")
+
+        engine = Engine(context=Context(), mouth=Queue())
+        receiver = ShardReceiver(engine=engine)
+
+        self.assertEqual(receiver.check('node1', 5), 0)  # first one
+        self.assertEqual(receiver.check('node1', 6), 0)
+        self.assertEqual(receiver.check('node1', 9), 2)
+        self.assertEqual(receiver.check('node3', 7), 0)  # another front end
+        self.assertEqual(receiver.check('node1', 1), 0)  # restarted
+        self.assertEqual(receiver.check('node1', 3), 1)
+        self.assertEqual(engine.get('shards.lost'), 3)
+
+    def test_process_saturated(self):
+
+        logging.info("*** process/saturated")
+
+        engine = Engine(context=Context(), mouth=Queue())
+        engine.space = mock.Mock()
+        engine.ears = mock.Mock()
+        engine.ears.is_saturated = True
+        engine.set('general.switch', 'on')
+
+        receiver = ShardReceiver(engine=engine)
+        receiver.EMPTY_DELAY = 0.01
+
+        def release():
+            engine.ears.is_saturated = False
+
+        timer = Timer(0.1, release)
+        timer.start()
+        receiver.process({'id': 1})
+        timer.join()
+
+        self.assertFalse(engine.ears.is_saturated)
+        engine.space.webhook.assert_called_with({'id': 1})
+
+
+if __name__ == '__main__':
+
+    Context.set_logger()
+    sys.exit(unittest.main())
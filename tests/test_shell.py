@@ -29,6 +29,7 @@ class MyBot(object):
 
     def __init__(self, engine):
         self.engine = engine
+        self.space = engine.space
 
     def say(self, text, content=None, file=None):
         self.engine.mouth.put(Vibes(text, content, file))
@@ -222,6 +223,8 @@ class ShellTests(unittest.TestCase):
         self.assertEqual(shell.engine.mouth.get().text, 'hello world')
         with self.assertRaises(Exception):
             shell.engine.mouth.get_nowait()
+        self.assertEqual(
+            self.engine.context.get('metrics.command.echo')['count'], 1)
 
         shell.do('help help', received=self.message)
         self.assertEqual(shell.line, 'help help')
@@ -441,6 +444,63 @@ class ShellTests(unittest.TestCase):
         with self.assertRaises(Exception):
             print(shell.engine.mouth.get_nowait())
 
+    def test_upload(self):
+
+        logging.info('***** upload')
+
+        shell = Shell(engine=self.engine)
+
+        from shellbot.commands.upload import Upload
+
+        class Custom(Upload):
+            def execute(self, bot, attachment, url, arguments=None, **kwargs):
+                bot.say(u"Got {}".format(attachment))
+
+        shell.load_command(Custom(self.engine))
+
+        with mock.patch.object(self.engine.space,
+                               'name_attachment',
+                               return_value='lazy.txt') as mocked:
+
+            shell.do('', received=self.upload)
+            self.assertEqual(shell.engine.mouth.get().text, u'Got viral.txt')
+            self.assertFalse(mocked.called)
+
+            upload = my_upload.copy()
+            upload.pop('attachment')
+            shell.do('', received=Message(upload))
+            self.assertEqual(shell.engine.mouth.get().text, u'Got lazy.txt')
+            mocked.assert_called_with(my_upload['url'])
+
+            shell.do('hello', received=Message(upload))
+            self.assertEqual(shell.engine.mouth.get().text,
+                             u"Sorry, I do not know how to handle 'hello'")
+            self.assertEqual(mocked.call_count, 1)
+
+            from shellbot.commands.base import Command
+
+            class Hello(Command):  # like examples/hello.py
+                keyword = 'hello'
+                def execute(self, bot, attachment=None, **kwargs):
+                    if attachment:
+                        bot.say(u"Thanks for {}".format(attachment))
+                    else:
+                        bot.say(u"Hello")
+
+            shell.load_command(Hello(self.engine))
+
+            shell.do('hello', received=self.message)
+            self.assertEqual(shell.engine.mouth.get().text, u'Hello')
+            self.assertEqual(mocked.call_count, 1)
+
+            shell.do('hello', received=Message(upload))
+            self.assertEqual(shell.engine.mouth.get().text,
+                             u'Thanks for lazy.txt')
+            self.assertEqual(mocked.call_count, 2)
+
+        with self.assertRaises(Exception):
+            print(shell.engine.mouth.get_nowait())
+
     def test_in_direct_or_group(self):
 
         logging.info('***** in_direct or in_group')
@@ -540,6 +600,31 @@ class ShellTests(unittest.TestCase):
         with self.assertRaises(Exception):
             print(shell.engine.mouth.get_nowait())
 
+    def test_priority(self):
+
+        logging.info('***** priority')
+
+        bot = MyBot(engine=self.engine)
+        bot.priority = 'normal'
+        self.engine.get_bot = mock.Mock(return_value=bot)
+
+        priorities = []
+
+        class Probe(object):
+            keyword = 'probe'
+            in_direct = True
+            in_group = True
+
+            def execute(self, bot, **kwargs):
+                priorities.append(bot.priority)
+
+        shell = Shell(engine=self.engine)
+        shell._commands = {'probe': Probe()}
+
+        shell.do('probe', received=self.message)
+        self.assertEqual(priorities, ['interactive'])
+        self.assertEqual(bot.priority, 'normal')
+
 
 if __name__ == '__main__':
 
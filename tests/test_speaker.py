@@ -114,6 +114,9 @@ class SpeakerTests(unittest.TestCase):
         my_engine.mouth.put(None)
         my_engine.speaker.run()
         self.assertEqual(my_engine.get('speaker.counter'), 0)
+        letter = my_engine.deadletters.list()[-1]
+        self.assertEqual(letter['stage'], 'speaker')
+        self.assertEqual(letter['item'], 'dummy')
 
         my_engine.speaker = Speaker(engine=my_engine)
         my_engine.speaker.process = mock.Mock(side_effect=KeyboardInterrupt('ctl-C'))
@@ -197,6 +200,187 @@ class SpeakerTests(unittest.TestCase):
             speaker.process(item)
             mocked.assert_called_with(content='hello **world**', file='http://a.server/with/file', id='007', person=None, text='hello world')
 
+    def test_workers(self):
+
+        logging.info('*** workers ***')
+
+        my_engine.space = SpaceFactory.get('local', engine=my_engine)
+        my_engine.set('general.switch', 'on')
+        my_engine.set('speaker.workers', 3)
+        my_engine.set('speaker.backlog', 2)
+
+        items = []
+        for index in range(10):
+            for channel in ('*a', '*b', '*c', '*d'):
+                items.append(Vibes(text=str(index), channel_id=channel))
+        items.append(Vibes(text='direct', person='a@b.com'))
+        for item in items:
+            my_engine.mouth.put(item)
+        my_engine.mouth.put(None)
+
+        posted = []
+
+        def post_message(id=None, person=None, **kwargs):
+            time.sleep(0.001)
+            posted.append((id or person, kwargs['text']))
+
+        speaker = Speaker(engine=my_engine)
+        self.assertEqual(speaker.get_key(items[0]), '*a')
+        self.assertEqual(speaker.get_key(items[-1]), 'a@b.com')
+        self.assertEqual(speaker.get_key('hello'), '*default')
+
+        try:
+            with mock.patch.object(my_engine.space,
+                                   'post_message',
+                                   side_effect=post_message):
+                speaker.run()
+
+        finally:
+            my_engine.set('speaker.workers', 1)
+
+        self.assertEqual(len(posted), len(items))
+        for channel in ('*a', '*b', '*c', '*d'):
+            self.assertEqual([text for (id, text) in posted if id == channel],
+                             [str(index) for index in range(10)])
+        self.assertTrue(('a@b.com', 'direct') in posted)
+        self.assertEqual(speaker.workers, [])
+
+    def test_coalesce(self):
+
+        logging.info('*** coalesce ***')
+
+        my_engine.space = SpaceFactory.get('local', engine=my_engine)
+        my_engine.set('general.switch', 'on')
+        my_engine.set('speaker.coalesce', 0.05)
+
+        items = [Vibes(text='hello', channel_id='*a'),
+                 Vibes(text='world', content='**world**', channel_id='*a'),
+                 Vibes(text='other', channel_id='*b'),
+                 Vibes(text='file', file='/a/file', channel_id='*a'),
+                 Vibes(text='x' * 5000, channel_id='*b'),
+                 Vibes(text='y' * 5000, channel_id='*b'),
+                 'plain']
+        for item in items:
+            my_engine.mouth.put(item)
+        my_engine.mouth.put(None)
+
+        speaker = Speaker(engine=my_engine)
+        try:
+            with mock.patch.object(my_engine.space,
+                                   'post_message',
+                                   return_value=None) as mocked:
+                speaker.run()
+
+        finally:
+            my_engine.set('speaker.coalesce', 0)
+
+        calls = [x[1] for x in mocked.call_args_list]
+        self.assertEqual(len(calls), 5)
+        posted = [(x.get('id'), x.get('text'), x.get('content'))
+                  for x in calls]
+        self.assertEqual(posted[0],
+                         ('*a', 'hello\nworld', 'hello\n\n**world**'))
+        self.assertEqual(posted[1][1], 'file')
+        self.assertEqual(calls[1]['file'], '/a/file')
+        self.assertTrue(('*b', 'other\n' + 'x' * 5000, None) in posted)
+        self.assertTrue(('*b', 'y' * 5000, None) in posted)
+        self.assertTrue(('*default', 'plain', None) in posted)
+        self.assertEqual(speaker.pending, {})
+
+    def test_coalesce_failure(self):
+
+        logging.info('*** coalesce/failure ***')
+
+        my_engine.space = SpaceFactory.get('local', engine=my_engine)
+        my_engine.set('general.switch', 'on')
+        my_engine.set('speaker.coalesce', 0.05)
+
+        my_engine.mouth.put(Vibes(text='hello', channel_id='*a'))
+        my_engine.mouth.put(Vibes(text='file', file='/a/file', channel_id='*a'))
+        my_engine.mouth.put(Vibes(text='world', channel_id='*b'))
+        my_engine.mouth.put(None)
+
+        speaker = Speaker(engine=my_engine)
+        try:
+            with mock.patch.object(my_engine.space,
+                                   'post_message',
+                                   side_effect=ValueError('post failed')) as mocked:
+                speaker.run()
+
+        finally:
+            my_engine.set('speaker.coalesce', 0)
+
+        self.assertEqual(mocked.call_count, 3)  # speaker kept running
+        letters = my_engine.deadletters.list()[-3:]
+        self.assertEqual([x['item'].text for x in letters],
+                         ['hello', 'file', 'world'])
+        self.assertEqual([x['error'] for x in letters],
+                         ['ValueError: post failed'] * 3)
+        self.assertEqual(speaker.pending, {})
+
+    def test_release(self):
+
+        logging.info('*** release ***')
+
+        speaker = Speaker(engine=my_engine)
+        speaker.submit = mock.Mock()
+
+        speaker.coalesce(Vibes(text='hello', channel_id='*a'), 10.0)
+        speaker.coalesce(Vibes(text='world', channel_id='*b'), 0.0)
+        speaker.release()
+        self.assertEqual(speaker.submit.call_count, 1)
+        self.assertEqual(speaker.submit.call_args[0][0].text, 'world')
+        self.assertEqual(list(speaker.pending.keys()), ['*a'])
+
+        speaker.release(force=True)
+        self.assertEqual(speaker.submit.call_count, 2)
+        self.assertEqual(speaker.pending, {})
+
+    def test_schedule(self):
+
+        logging.info('*** schedule ***')
+
+        speaker = Speaker(engine=my_engine)
+        self.assertEqual(speaker.build_schedule(Speaker.WEIGHTS),
+                         ['interactive', 'normal', 'interactive', 'bulk',
+                          'interactive', 'normal', 'interactive'])
+        self.assertEqual(speaker.build_schedule({}), ['normal'])
+        self.assertEqual(speaker.build_schedule({'bulk': 1, 'normal': 1}),
+                         ['normal', 'bulk'])
+
+    def test_priorities(self):
+
+        logging.info('*** priorities ***')
+
+        engine = Engine(mouth=Queue())
+        engine.mouths = {'interactive': Queue(), 'bulk': Queue()}
+
+        for index in range(6):
+            engine.get_mouth('bulk').put('bulk')
+        for index in range(3):
+            engine.get_mouth('normal').put('normal')
+        engine.get_mouth('interactive').put('interactive')
+        time.sleep(0.1)
+
+        speaker = Speaker(engine=engine)
+        speaker.schedule = speaker.build_schedule(Speaker.WEIGHTS)
+
+        items = []
+        while True:
+            try:
+                items.append(speaker.get_item())
+            except Exception:
+                break
+
+        self.assertEqual(items, ['interactive', 'normal', 'bulk', 'normal',
+                                 'normal', 'bulk', 'bulk', 'bulk', 'bulk',
+                                 'bulk'])
+
+        speaker = Speaker(engine=my_engine)
+        my_engine.mouth.put('hello')
+        time.sleep(0.1)
+        self.assertEqual(speaker.get_item(), 'hello')
+
 
 if __name__ == '__main__':
 
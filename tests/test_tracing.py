@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+import gc
+import json
+import logging
+import mock
+from multiprocessing import Queue
+import os
+import sys
+import tempfile
+
+from shellbot import Context, Engine, Vibes
+from shellbot.events import Message
+from shellbot.tracing import (tracer, Tracer, Sink, MemorySink, FileSink,
+                              OtelSink, MetricsSink)
+
+
+class TracingTests(unittest.TestCase):
+
+    def setUp(self):
+        self.context = Context()
+
+    def tearDown(self):
+        tracer.sink = None
+        tracer.set_context(None)
+        del self.context
+        collected = gc.collect()
+        if collected:
+            logging.info("Garbage collector: collected %d objects." % (collected))
+
+    def test_disabled(self):
+
+        logging.info("*** disabled")
+
+        my_tracer = Tracer(context=self.context)
+        self.assertFalse(my_tracer.is_enabled)
+
+        message = Message({'text': 'hello'})
+        self.assertEqual(my_tracer.mark(message, 'ears'), None)
+        self.assertEqual(message.get('trace'), None)
+        self.assertEqual(my_tracer.export(message, 'done'), [])
+
+        vibes = Vibes(text='hello')
+        my_tracer.current = None
+        self.assertEqual(my_tracer.inherit(vibes, 'mouth'), None)
+        self.assertEqual(vibes.trace, None)
+
+    def test_build_sink(self):
+
+        logging.info("*** build_sink")
+
+        my_tracer = Tracer(context=self.context)
+        self.assertEqual(my_tracer.build_sink(), None)
+
+        self.context.set('tracing.sink', 'memory')
+        self.context.set('tracing.size', 10)
+        sink = my_tracer.build_sink()
+        self.assertTrue(isinstance(sink, MemorySink))
+        self.assertEqual(sink.ring.maxlen, 10)
+
+        self.context.set('tracing.sink', 'file')
+        self.context.set('tracing.path', '*path')
+        sink = my_tracer.build_sink()
+        self.assertEqual(type(sink), FileSink)
+        self.assertEqual(sink.path, '*path')
+
+        self.context.set('tracing.sink', 'otel')
+        self.assertTrue(isinstance(my_tracer.build_sink(), OtelSink))
+
+        self.context.set('tracing.sink', 'metrics')
+        sink = my_tracer.build_sink()
+        self.assertTrue(isinstance(sink, MetricsSink))
+        sink.put([{'name': 'listener', 'start': 1.0, 'end': 1.25},
+                  {'name': 'listener', 'start': 2.0, 'end': 2.5}])
+        histogram = self.context.get('metrics.stage.listener')
+        self.assertEqual(histogram['count'], 2)
+        self.assertEqual(histogram['sum'], 0.75)
+
+        self.context.set('tracing.sink', '*unknown')
+        self.assertEqual(my_tracer.build_sink(), None)
+
+        my_tracer.set_context(self.context)
+        self.assertFalse(my_tracer.is_enabled)
+
+        with self.assertRaises(NotImplementedError):
+            Sink().put([])
+
+    def test_spans(self):
+
+        logging.info("*** spans")
+
+        sink = MemorySink(size=4)
+        my_tracer = Tracer(sink=sink)
+        self.assertTrue(my_tracer.is_enabled)
+
+        item = {'type': 'message', 'text': 'hello'}
+        with mock.patch('shellbot.tracing.clock', side_effect=[1.0, 1.5, 2.5]):
+            trace = my_tracer.mark(item, 'webhook')
+            self.assertEqual(len(trace['id']), 32)
+            self.assertEqual(trace['parent'], None)
+            self.assertEqual(item['trace'], trace)
+
+            message = Message(item)
+            my_tracer.mark(message, 'listener')
+            my_tracer.current = message.trace
+
+            vibes = Vibes(text='world')
+            my_tracer.inherit(vibes, 'mouth')
+            my_tracer.current = None
+
+        self.assertEqual(vibes.trace['id'], trace['id'])
+        self.assertEqual(vibes.trace['parent'], trace['stamps'][-1][2])
+
+        with mock.patch('shellbot.tracing.clock', return_value=3.0):
+            spans = my_tracer.export(message, 'done', channel_id='*id')
+
+        self.assertEqual([x['name'] for x in spans], ['webhook', 'listener'])
+        self.assertEqual(spans[0]['start'], 1.0)
+        self.assertEqual(spans[0]['end'], 1.5)
+        self.assertEqual(spans[0]['parent_id'], None)
+        self.assertEqual(spans[1]['start'], 1.5)
+        self.assertEqual(spans[1]['end'], 3.0)
+        self.assertEqual(spans[1]['parent_id'], spans[0]['span_id'])
+        self.assertEqual(spans[1]['attributes']['channel_id'], '*id')
+        self.assertEqual(spans[1]['attributes']['pid'], os.getpid())
+
+        with mock.patch('shellbot.tracing.clock', return_value=4.0):
+            spans = my_tracer.export(vibes, 'posted')
+        self.assertEqual(len(spans), 1)
+        self.assertEqual(spans[0]['name'], 'mouth')
+        self.assertEqual(spans[0]['trace_id'], trace['id'])
+        self.assertEqual(spans[0]['parent_id'], vibes.trace['parent'])
+        self.assertEqual((spans[0]['start'], spans[0]['end']), (2.5, 4.0))
+
+        self.assertEqual([x['name'] for x in sink.spans()],
+                         ['webhook', 'listener', 'mouth'])
+
+        self.assertEqual(my_tracer.mark('some text', 'speaker'), None)
+
+    def test_file_sinks(self):
+
+        logging.info("*** file sinks")
+
+        span = {'trace_id': 'a' * 32,
+                'span_id': 'b' * 16,
+                'parent_id': 'c' * 16,
+                'name': 'listener',
+                'start': 10.0,
+                'end': 10.5,
+                'attributes': {'channel_id': '*id', 'pid': 123}}
+
+        (handle, path) = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        try:
+            FileSink(path=path).put([span, span])
+            with open(path) as stream:
+                lines = stream.readlines()
+            self.assertEqual(len(lines), 2)
+            self.assertEqual(json.loads(lines[0]), span)
+
+            os.remove(path)
+            sink = OtelSink(path=path)
+            sink.put([])
+            self.assertFalse(os.path.exists(path))
+
+            with mock.patch('shellbot.tracing.clock', return_value=10.0):
+                with mock.patch('time.time', return_value=1000.0):
+                    sink.put([span])
+            with open(path) as stream:
+                request = json.loads(stream.read())
+
+            resource = request['resourceSpans'][0]
+            self.assertEqual(resource['resource']['attributes'],
+                             [{'key': 'service.name',
+                               'value': {'stringValue': 'shellbot'}}])
+            converted = resource['scopeSpans'][0]['spans'][0]
+            self.assertEqual(converted['traceId'], 'a' * 32)
+            self.assertEqual(converted['spanId'], 'b' * 16)
+            self.assertEqual(converted['parentSpanId'], 'c' * 16)
+            self.assertEqual(converted['name'], 'listener')
+            self.assertEqual(converted['startTimeUnixNano'], '1000000000000')
+            self.assertEqual(converted['endTimeUnixNano'], '1000500000000')
+            self.assertEqual(converted['attributes'],
+                             [{'key': 'channel_id',
+                               'value': {'stringValue': '*id'}},
+                              {'key': 'pid',
+                               'value': {'intValue': '123'}}])
+
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_pipeline(self):
+
+        logging.info("*** pipeline")
+
+        sink = MemorySink()
+        tracer.sink = sink
+
+        engine = Engine(context=self.context,
+                        type='local',
+                        command='shellbot.commands.echo',
+                        mouth=Queue(),
+                        ears=Queue())
+        engine.configure()
+        self.assertTrue(tracer.context is self.context)
+
+        engine.space.on_message({'text': 'echo hello'}, engine.ears)
+        engine.listener.process(engine.ears.get())
+        self.assertEqual([x['name'] for x in sink.spans()],
+                         ['ears', 'listener', 'shell', 'command'])
+        self.assertEqual(sink.spans()[0]['attributes']['type'], 'message')
+        self.assertEqual(tracer.current, None)
+
+        vibes = engine.mouth.get()
+        while vibes.text != 'hello':  # skip any message on bot entrance
+            vibes = engine.mouth.get()
+        with mock.patch('sys.stdout'):
+            engine.speaker.process(vibes)
+
+        spans = sink.spans()
+        self.assertEqual([x['name'] for x in spans[4:]], ['mouth', 'speaker'])
+        self.assertEqual(len(set(x['trace_id'] for x in spans)), 1)
+        self.assertEqual(spans[4]['parent_id'], spans[3]['span_id'])
+
+
+if __name__ == '__main__':
+
+    Context.set_logger()
+    sys.exit(unittest.main())
@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+
+from shellbot import Context
+from shellbot.bus import Bus
+
+Context.set_logger()
+
+# this should be ran manually for test purpose
+#
+# publishers connect to bus.broker, subscribers connect to bus.address
+
+bus = Bus(context=Context())
+bus.context.set('bus.broker', 'tcp://127.0.0.1:5556')
+bus.check()
+
+broker = bus.serve()
+broker.start()
+
+logging.info("Forwarding messages, press Ctl-C to stop the program")
+try:
+    while True:
+        time.sleep(5.0)
+        for topic, stats in sorted(bus.context.get('broker.topics', {}).items()):
+            logging.info("- {}: {}".format(topic, stats))
+except KeyboardInterrupt:
+    pass
+
+bus.context.set('general.switch', 'off')
+broker.join()